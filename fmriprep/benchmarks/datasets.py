@@ -0,0 +1,170 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Synthetic BIDS datasets for benchmarking workflow construction.
+
+Building the workflow only reads the headers and metadata of the input files,
+so images are written as NIfTI headers without any voxel data.
+This keeps datasets with hundreds of runs within a few megabytes.
+
+"""
+
+import gzip
+import io
+from pathlib import Path
+
+import nibabel as nb
+import numpy as np
+
+#: Shape and voxel size of the synthetic images, by suffix
+IMAGE_SPECS = {
+    'T1w': ((176, 256, 256), (1.0, 1.0, 1.0)),
+    'bold': ((64, 64, 40, 300), (3.0, 3.0, 3.0, 2.0)),
+    'sbref': ((64, 64, 40), (3.0, 3.0, 3.0)),
+    'epi': ((64, 64, 40, 3), (3.0, 3.0, 3.0, 2.0)),
+}
+
+_SLICE_TIMING = [round(0.05 * i, 2) for i in range(40)]
+
+
+def write_header_only(path, shape, zooms, dtype='int16'):
+    """
+    Write a NIfTI image consisting of a header and no voxel data.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     path = write_header_only(Path(tmpdir) / 'bold.nii.gz', (64, 64, 40, 300), (3,) * 4)
+    ...     img = nb.load(path)
+    ...     img.shape, path.stat().st_size < 100
+    ((64, 64, 40, 300), True)
+
+    """
+    header = nb.Nifti1Header()
+    header.set_data_dtype(dtype)
+    header.set_data_shape(shape)
+    header.set_zooms(zooms)
+    affine = np.diag([*zooms[:3], 1.0])
+    affine[:3, 3] = -0.5 * np.array(zooms[:3]) * (np.array(shape[:3]) - 1)
+    header.set_qform(affine, code=1)
+    header.set_sform(affine, code=1)
+    header.set_xyzt_units('mm', 'sec')
+    header['vox_offset'] = 352
+
+    buffer = io.BytesIO()
+    header.write_to(buffer)
+    buffer.write(b'\0' * 4)  # Empty extension flag
+
+    path = Path(path)
+    with gzip.open(path, 'wb') if path.suffix == '.gz' else path.open('wb') as fobj:
+        fobj.write(buffer.getvalue())
+    return path
+
+
+def make_spec(subjects=1, sessions=0, runs=1, echoes=1, sbref=True, fieldmaps=True):
+    """
+    Generate the specification of a synthetic dataset.
+
+    The specification can be passed on to
+    :func:`niworkflows.utils.testing.generate_bids_skeleton`.
+    Each session has one T1w image, ``runs`` resting-state runs
+    (with ``echoes`` echoes each) and, optionally, a PEPolar fieldmap
+    that corrects all of them.
+
+    >>> spec = make_spec(subjects=2, sessions=2, runs=3, echoes=2)
+    >>> sorted(spec), [session['session'] for session in spec['02']]
+    (['01', '02'], ['1', '2'])
+    >>> len([f for f in spec['01'][0]['func'] if f['suffix'] == 'bold'])
+    6
+    >>> 'session' in make_spec()['01']
+    False
+
+    """
+    spec = {}
+    for sub in range(1, subjects + 1):
+        sessions_spec = []
+        for ses in range(1, max(sessions, 1) + 1):
+            # Fieldmap identifiers are registered once per process, across subjects
+            b0_id = f'pepolar{sub:02d}{ses:02d}'
+            func = []
+            for run in range(1, runs + 1):
+                for echo in range(1, echoes + 1):
+                    entities = {'task': 'rest', 'run': run}
+                    if echoes > 1:
+                        entities['echo'] = echo
+                    metadata = {
+                        'RepetitionTime': 2.0,
+                        'PhaseEncodingDirection': 'j',
+                        'TotalReadoutTime': 0.05,
+                        'EchoTime': 0.015 * echo if echoes > 1 else 0.03,
+                        'SliceTiming': _SLICE_TIMING,
+                    }
+                    if fieldmaps:
+                        metadata['B0FieldSource'] = b0_id
+                    func.append({**entities, 'suffix': 'bold', 'metadata': metadata})
+                    if sbref:
+                        func.append({**entities, 'suffix': 'sbref', 'metadata': metadata})
+
+            session = {
+                'anat': [{'suffix': 'T1w'}],
+                'func': func,
+            }
+            if fieldmaps:
+                session['fmap'] = [
+                    {
+                        'dir': pe_dir,
+                        'suffix': 'epi',
+                        'metadata': {
+                            'PhaseEncodingDirection': pe,
+                            'TotalReadoutTime': 0.05,
+                            'B0FieldIdentifier': b0_id,
+                        },
+                    }
+                    for pe_dir, pe in (('AP', 'j-'), ('PA', 'j'))
+                ]
+
+            if sessions:
+                session['session'] = f'{ses}'
+            sessions_spec.append(session)
+
+        spec[f'{sub:02d}'] = sessions_spec if sessions else sessions_spec[0]
+    return spec
+
+
+def generate_dataset(bids_dir, **kwargs):
+    """
+    Write a synthetic BIDS dataset, as specified by :func:`make_spec`.
+
+    Returns
+    -------
+    :obj:`~pathlib.Path`
+        The root of the new dataset.
+
+    """
+    from niworkflows.utils.testing import generate_bids_skeleton
+
+    bids_dir = Path(bids_dir).absolute()
+    generate_bids_skeleton(bids_dir, make_spec(**kwargs))
+    for path in bids_dir.glob('sub-*/**/*.nii.gz'):
+        suffix = path.name[: -len('.nii.gz')].rsplit('_', 1)[-1]
+        write_header_only(path, *IMAGE_SPECS[suffix])
+    return bids_dir
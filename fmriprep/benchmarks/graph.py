@@ -0,0 +1,187 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Benchmarks of workflow construction.
+
+Each case generates a synthetic dataset (see :mod:`fmriprep.benchmarks.datasets`),
+scaled along the number of subjects, sessions, runs, echoes or output spaces,
+and builds the workflow with :func:`~fmriprep.workflows.base.init_fmriprep_wf`
+in a fresh process, recording:
+
+``build_time``
+    Wall time (in seconds) of :func:`~fmriprep.workflows.base.init_fmriprep_wf`.
+``peak_rss``
+    Peak resident set size of the process (in MiB), after the build.
+``nodes``, ``edges``
+    Size of the flattened graph.
+``pickle_size``
+    Size (in MiB) of the pickled workflow, as it is sent back from
+    :func:`~fmriprep.cli.workflow.build_workflow`.
+
+Building the workflow requires the TemplateFlow resources it references
+to be available in ``$TEMPLATEFLOW_HOME`` (they are fetched on the first run).
+
+"""
+
+import multiprocessing as mp
+import os
+import pickle
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+#: Benchmark cases, with the arguments to :func:`~fmriprep.benchmarks.datasets.make_spec`,
+#: and the settings of the :mod:`~fmriprep.config` that differ from the defaults
+CASES = {
+    'runs-1': {'dataset': {'runs': 1}},
+    'runs-16': {'dataset': {'runs': 16}},
+    'runs-64': {'dataset': {'runs': 64}},
+    'echoes-3': {'dataset': {'runs': 4, 'echoes': 3}},
+    'sessions-4': {'dataset': {'sessions': 4, 'runs': 4}},
+    'subjects-8': {'dataset': {'subjects': 8, 'runs': 4}},
+    'spaces-6': {
+        'dataset': {'runs': 4},
+        'config': {
+            'output_spaces': (
+                'MNI152NLin2009cAsym:res-2 MNI152NLin6Asym:res-2 MNIPediatricAsym:cohort-1 '
+                'T1w fsnative fsaverage:den-10k'
+            ),
+            'cifti_output': '91k',
+        },
+    },
+}
+
+#: Default relative increase of each metric over the baseline flagged as a regression
+TOLERANCES = {
+    'build_time': 0.25,
+    'peak_rss': 0.15,
+    'nodes': 0.0,
+    'edges': 0.0,
+    'pickle_size': 0.05,
+}
+
+#: Metrics for which lower values are regressions
+HIGHER_IS_BETTER = ()
+
+#: Metrics that do not depend on the machine, the only ones stored in the baseline
+#: distributed with *fMRIPrep*
+PORTABLE_METRICS = ('nodes', 'edges', 'pickle_size')
+
+
+def _peak_rss():
+    """Peak resident set size of the current process, in MiB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and kilobytes elsewhere
+    return maxrss / 1024**2 if sys.platform == 'darwin' else maxrss / 1024
+
+
+@contextmanager
+def _benchmark_config(bids_dir, work_dir):
+    """Configure *fMRIPrep* to build the workflow of a synthetic dataset."""
+    from toml import loads
+
+    from .. import config, data
+
+    _old_fs = os.getenv('FREESURFER_HOME')
+    if not _old_fs:
+        os.environ['FREESURFER_HOME'] = str(work_dir / 'freesurfer')
+        (work_dir / 'freesurfer').mkdir(exist_ok=True)
+
+    settings = loads(data.load.readable('benchmarks/config.toml').read_text())
+    for sectionname, configs in settings.items():
+        getattr(config, sectionname).load(configs, init=False)
+    config.nipype.init()
+    config.loggers.init()
+
+    config.execution.work_dir = work_dir / 'work'
+    config.execution.output_dir = config.execution.fmriprep_dir = work_dir / 'out'
+    config.execution.output_dir.mkdir(exist_ok=True)
+    config.execution.bids_dir = bids_dir
+    # Index all subjects of the dataset
+    config.execution.participant_label = sorted(path.name[4:] for path in bids_dir.glob('sub-*'))
+    config.execution.bids_database_dir = None
+    config.execution._layout = None
+    try:
+        yield
+    finally:
+        if not _old_fs:
+            del os.environ['FREESURFER_HOME']
+
+
+def run_case(name, work_dir=None, level='full'):
+    """
+    Build the workflow of a benchmark case within the current process.
+
+    Use :func:`run_cases` to measure each case in a fresh process.
+
+    Returns
+    -------
+    :obj:`dict`
+        The metrics of the case.
+
+    """
+    import logging
+
+    from .. import config
+    from ..workflows.base import init_fmriprep_wf
+    from .datasets import generate_dataset
+
+    case = CASES[name]
+    logging.getLogger('nipype.workflow').setLevel(logging.ERROR)
+
+    with TemporaryDirectory(dir=work_dir) as tmpdir:
+        bids_dir = generate_dataset(Path(tmpdir) / 'bids', **case['dataset'])
+        with _benchmark_config(bids_dir, Path(tmpdir)):
+            config.workflow.level = level
+            for key, value in case.get('config', {}).items():
+                section = 'execution' if key == 'output_spaces' else 'workflow'
+                setattr(getattr(config, section), key, value)
+            config.init_spaces()
+            config.execution.init()
+            config._create_processing_groups()
+
+            start = time.perf_counter()
+            workflow = init_fmriprep_wf()
+            build_time = time.perf_counter() - start
+
+        graph = workflow._create_flat_graph()
+        return {
+            'build_time': round(build_time, 3),
+            'peak_rss': round(_peak_rss(), 1),
+            'nodes': graph.number_of_nodes(),
+            'edges': graph.number_of_edges(),
+            'pickle_size': round(len(pickle.dumps(workflow)) / 1024**2, 3),
+        }
+
+
+def run_cases(names, work_dir=None, level='full'):
+    """Run each benchmark case in a fresh process, so memory usage is isolated."""
+    context = mp.get_context('spawn')
+    results = {}
+    for name in names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_case, (name,), {'work_dir': work_dir, 'level': level})
+    return results
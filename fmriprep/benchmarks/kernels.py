@@ -0,0 +1,367 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Microbenchmarks of the numerical kernels of *fMRIPrep*.
+
+Each case prepares synthetic inputs of realistic sizes (a 2 mm MNI grid,
+1 mm and 0.8 mm T1w grids, and BOLD series of 1000 volumes), and then times
+a single kernel, recording:
+
+``time``
+    Best wall time (in seconds) over the repeats of the case.
+``throughput``
+    Volumes processed per second, for kernels operating on BOLD volumes.
+``peak_memory``
+    Peak memory (in MiB) allocated by the kernel, as traced by :mod:`tracemalloc`
+    (which includes NumPy arrays) in an additional, untimed repeat.
+
+Inputs are generated in memory or in a temporary directory, so the cases run offline.
+
+"""
+
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import nibabel as nb
+import numpy as np
+
+#: Shape and voxel size of the grids used by the cases
+GRIDS = {
+    'bold': ((64, 64, 40), 3.0),
+    'MNI152NLin2009cAsym:res-2': ((97, 115, 97), 2.0),
+    'T1w': ((176, 256, 256), 1.0),
+    'T1w:res-0.8': ((220, 320, 320), 0.8),
+}
+
+#: Number of volumes of the synthetic BOLD series
+VOLUMES = 1000
+
+#: Default relative change of each metric over the baseline flagged as a regression
+TOLERANCES = {
+    'time': 0.25,
+    'throughput': 0.2,
+    'peak_memory': 0.15,
+}
+
+#: Metrics for which lower values are regressions
+HIGHER_IS_BETTER = ('throughput',)
+
+#: Metrics that do not depend on the machine, the only ones stored in the baseline
+#: distributed with *fMRIPrep*
+PORTABLE_METRICS = ('peak_memory',)
+
+
+def _grid(name):
+    """Voxel-to-RAS affine of a grid, centered on the origin."""
+    shape, zoom = GRIDS[name]
+    affine = np.diag([zoom, zoom, zoom, 1.0])
+    affine[:3, 3] = -0.5 * zoom * (np.array(shape) - 1)
+    return shape, affine
+
+
+def _smooth_noise(shape, rng, sigma=4.0):
+    from scipy.ndimage import gaussian_filter
+
+    return gaussian_filter(rng.standard_normal(shape, dtype='float32'), sigma)
+
+
+def _hmc_xfms(volumes, rng):
+    """Small random rigid-body head motion, as VOX2VOX affines."""
+    from scipy.spatial.transform import Rotation
+
+    rotations = Rotation.from_rotvec(rng.normal(0, 0.01, (volumes, 3))).as_matrix()
+    xfms = np.tile(np.eye(4), (volumes, 1, 1))
+    xfms[:, :3, :3] = rotations
+    xfms[:, :3, 3] = rng.normal(0, 0.3, (volumes, 3))
+    return xfms
+
+
+def _bold_coordinates(target):
+    """Voxel coordinates of a target grid in the BOLD grid."""
+    _, bold_affine = _grid('bold')
+    shape, affine = _grid(target)
+    ijk = np.indices(shape, dtype='float32').reshape(3, -1)
+    return nb.affines.apply_affine(np.linalg.inv(bold_affine) @ affine, ijk.T).T.reshape(
+        (3, *shape)
+    )
+
+
+def setup_resample_vol(tmpdir, volumes=VOLUMES, nthreads=1, target='MNI152NLin2009cAsym:res-2'):
+    """Resample one BOLD volume onto a standard grid, with head-motion and SDC."""
+    from ..interfaces.resampling import resample_vol
+
+    rng = np.random.default_rng(0)
+    bold_shape, _ = _grid('bold')
+    data = _smooth_noise(bold_shape, rng) + 100
+    coordinates = _bold_coordinates(target)
+    fmap_hz = 20 * _smooth_noise(coordinates.shape[1:], rng, sigma=8)
+    hmc_xfm = _hmc_xfms(1, rng)[0]
+
+    def run():
+        resample_vol(data, coordinates, (1, 0.05), True, hmc_xfm, fmap_hz, np.float32)
+
+    return run, 1
+
+
+def setup_resample_series(tmpdir, volumes=VOLUMES, nthreads=1, target='bold', motion=True):
+    """Resample a BOLD series onto its own grid, with SDC and (optionally) head-motion."""
+    from ..interfaces.resampling import resample_series
+
+    rng = np.random.default_rng(0)
+    bold_shape, _ = _grid('bold')
+    data = rng.standard_normal((*bold_shape, volumes), dtype='float32')
+    data += _smooth_noise(bold_shape, rng)[..., None] + 100
+    coordinates = _bold_coordinates(target)
+    fmap_hz = 20 * _smooth_noise(coordinates.shape[1:], rng, sigma=8)
+    hmc_xfms = list(_hmc_xfms(volumes, rng)) if motion else None
+
+    def run():
+        resample_series(
+            data,
+            coordinates,
+            [(1, 0.05)] * volumes,
+            True,
+            hmc_xfms,
+            fmap_hz,
+            output_dtype=np.float32,
+            nthreads=nthreads,
+        )
+
+    return run, volumes
+
+
+def setup_reconstruct_fieldmap(tmpdir, volumes=VOLUMES, nthreads=1, target='bold'):
+    """Reconstruct a fieldmap from two levels of B-spline coefficients onto a target grid."""
+    import nitransforms as nt
+
+    from ..interfaces.resampling import reconstruct_fieldmap
+
+    rng = np.random.default_rng(0)
+    shape, affine = _grid(target)
+    extent = np.array(shape) * affine[0, 0]
+    coefficients = []
+    for spacing in (40.0, 20.0):
+        knots = np.ceil(extent / spacing).astype(int) + 3
+        coeff_affine = np.diag([spacing, spacing, spacing, 1.0])
+        coeff_affine[:3, 3] = -0.5 * spacing * (knots - 1)
+        coefficients.append(
+            nb.Nifti1Image(rng.normal(0, 10, knots).astype('float32'), coeff_affine)
+        )
+    target_img = nb.Nifti1Image(np.zeros(shape, dtype='uint8'), affine)
+
+    def run():
+        reconstruct_fieldmap(coefficients, target_img, target_img, nt.linear.Affine())
+
+    return run, None
+
+
+def setup_fsl_rmsd(tmpdir, volumes=VOLUMES, nthreads=1):
+    """Calculate the RMS deviation of the head-motion transforms of a series."""
+    import nitransforms as nt
+
+    from ..interfaces.confounds import FSLRMSDeviation
+
+    rng = np.random.default_rng(0)
+    bold_shape, bold_affine = _grid('bold')
+    boldref = str(Path(tmpdir) / 'boldref.nii.gz')
+    nb.Nifti1Image(np.zeros(bold_shape, dtype='int16'), bold_affine).to_filename(boldref)
+    # RAS-to-RAS transforms, as written by the head-motion correction workflow
+    xfms = bold_affine @ _hmc_xfms(volumes, rng) @ np.linalg.inv(bold_affine)
+    xfm_file = str(Path(tmpdir) / 'hmc.txt')
+    nt.linear.LinearTransformsMapping(xfms).to_filename(xfm_file, fmt='itk')
+
+    def run():
+        FSLRMSDeviation(xfm_file=xfm_file, boldref_file=boldref).run(cwd=tmpdir)
+
+    return run, volumes
+
+
+def setup_gather_confounds(tmpdir, volumes=VOLUMES, nthreads=1):
+    """Concatenate the confounds of a series into a single table."""
+    import pandas as pd
+
+    from ..interfaces.confounds import _gather_confounds
+
+    rng = np.random.default_rng(0)
+    columns = {
+        'signals': ['global_signal', 'csf', 'white_matter', 'csf_wm'],
+        'dvars': ['dvars'],
+        'std_dvars': ['std_dvars'],
+        'fdisp': ['FramewiseDisplacement'],
+        'rmsd': ['rmsd'],
+        'tcompcor': [f't_comp_cor_{i:02d}' for i in range(50)],
+        'acompcor': [f'a_comp_cor_{i:02d}' for i in range(300)],
+        'crowncompcor': [f'c_comp_cor_{i:02d}' for i in range(24)],
+        'cos_basis': [f'cosine{i:02d}' for i in range(20)],
+        'motion': ['trans_x', 'trans_y', 'trans_z', 'rot_x', 'rot_y', 'rot_z'],
+    }
+    files = {}
+    for name, names in columns.items():
+        # Derivative-based confounds are one row shorter
+        rows = volumes - (name in ('dvars', 'std_dvars'))
+        files[name] = str(Path(tmpdir) / f'{name}.tsv')
+        pd.DataFrame(rng.normal(size=(rows, len(names))), columns=names).to_csv(
+            files[name], sep='\t', index=False, na_rep='n/a'
+        )
+
+    def run():
+        _gather_confounds(newpath=tmpdir, **files)
+
+    return run, volumes
+
+
+def setup_acompcor_masks(tmpdir, volumes=VOLUMES, nthreads=1, is_aseg=False):
+    """Generate the aCompCor masks from tissue maps on the T1w grid."""
+    from ..utils.confounds import acompcor_masks
+
+    rng = np.random.default_rng(0)
+    shape, affine = _grid('T1w')
+    # Three tissue classes from smooth noise
+    labels = np.digitize(_smooth_noise(shape, rng, sigma=3), [-0.02, 0.02])
+    in_files = []
+    for i, tissue in enumerate(('GM', 'WM', 'CSF')):
+        tissue_map = labels == (1, 2, 0)[i]
+        if is_aseg:
+            data = tissue_map.astype('uint8')
+        else:
+            data = np.clip(tissue_map + rng.normal(0, 0.05, shape), 0, 1).astype('float32')
+        in_files.append(str(Path(tmpdir) / f'label-{tissue}_probseg.nii.gz'))
+        nb.Nifti1Image(data, affine).to_filename(in_files[-1])
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(tmpdir)
+        try:
+            acompcor_masks(in_files, is_aseg=is_aseg, zooms=(3.0, 3.0, 3.0))
+        finally:
+            os.chdir(cwd)
+
+    return run, None
+
+
+def setup_binary_dilation(tmpdir, volumes=VOLUMES, nthreads=1, grid='T1w', backend='fmriprep'):
+    """Dilate a GM-like mask on a T1w grid with a ball of radius 3, as for aCompCor."""
+    from ..utils.morphology import binary_dilation
+
+    rng = np.random.default_rng(0)
+    shape, _ = _grid(grid)
+    mask = np.abs(_smooth_noise(shape, rng, sigma=3)) < 0.02
+
+    if backend == 'ndimage':
+        from scipy.ndimage import binary_dilation as ndi_dilation
+        from skimage.morphology import ball
+
+        def run():
+            ndi_dilation(mask, structure=ball(3))
+
+    else:
+
+        def run():
+            binary_dilation(mask, 3)
+
+    return run, None
+
+
+#: Benchmark cases: setup function, keyword arguments, and number of timed repeats
+CASES = {
+    'resample_vol': (setup_resample_vol, {}, 5),
+    'resample_series-1thread': (setup_resample_series, {'nthreads': 1}, 1),
+    'resample_series-4threads': (setup_resample_series, {'nthreads': 4}, 1),
+    'resample_series-MNI152NLin2009cAsym:res-2': (
+        setup_resample_series,
+        {'nthreads': 4, 'target': 'MNI152NLin2009cAsym:res-2', 'volumes': 100},
+        1,
+    ),
+    # Without head motion, coordinates are shifted once for the whole series
+    'resample_series-MNI152NLin2009cAsym:res-2-nomotion': (
+        setup_resample_series,
+        {'nthreads': 4, 'target': 'MNI152NLin2009cAsym:res-2', 'volumes': 100, 'motion': False},
+        1,
+    ),
+    'reconstruct_fieldmap': (setup_reconstruct_fieldmap, {}, 5),
+    'FSLRMSDeviation': (setup_fsl_rmsd, {}, 5),
+    '_gather_confounds': (setup_gather_confounds, {}, 5),
+    'acompcor_masks': (setup_acompcor_masks, {}, 1),
+    'acompcor_masks-aseg': (setup_acompcor_masks, {'is_aseg': True}, 1),
+    'binary_dilation': (setup_binary_dilation, {}, 3),
+    'binary_dilation-ndimage': (setup_binary_dilation, {'backend': 'ndimage'}, 3),
+    'binary_dilation-T1w:res-0.8': (setup_binary_dilation, {'grid': 'T1w:res-0.8'}, 3),
+    'binary_dilation-ndimage-T1w:res-0.8': (
+        setup_binary_dilation,
+        {'grid': 'T1w:res-0.8', 'backend': 'ndimage'},
+        3,
+    ),
+}
+
+
+def run_case(name, work_dir=None, repeats=None):
+    """
+    Time a benchmark case.
+
+    Returns
+    -------
+    :obj:`dict`
+        The metrics of the case.
+
+    """
+    setup, kwargs, default_repeats = CASES[name]
+    with TemporaryDirectory(dir=work_dir) as tmpdir:
+        run, volumes = setup(tmpdir, **kwargs)
+
+        timings = []
+        for _ in range(repeats or default_repeats):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    # Significant digits, so the metrics of small cases do not round to zero
+    metrics = {'time': _round(min(timings)), 'peak_memory': _round(peak / 1024**2)}
+    if volumes:
+        metrics['throughput'] = _round(volumes / min(timings))
+    return metrics
+
+
+def _round(value, digits=4):
+    """
+    Round to a number of significant digits.
+
+    >>> _round(0.000123456), _round(1234.56)
+    (0.0001235, 1235.0)
+
+    """
+    return float(f'{value:.{digits}g}')
+
+
+def run_cases(names, work_dir=None, repeats=None):
+    """Run several benchmark cases, one after the other."""
+    return {name: run_case(name, work_dir=work_dir, repeats=repeats) for name in names}
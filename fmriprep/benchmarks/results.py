@@ -0,0 +1,123 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Storage of benchmark results, and comparison against a baseline."""
+
+import json
+import sys
+from pathlib import Path
+
+
+def compare(results, baseline, tolerances, higher_is_better=()):
+    """
+    Flag metrics that regressed with respect to a baseline.
+
+    Only metrics listed in ``tolerances`` are compared.
+    A metric regresses when it increases (or decreases, for metrics in
+    ``higher_is_better``) by more than its tolerance, relative to the baseline.
+
+    >>> compare(
+    ...     {'runs-1': {'build_time': 1.3, 'nodes': 100}, 'runs-16': {'nodes': 9}},
+    ...     {'runs-1': {'build_time': 1.0, 'nodes': 99}},
+    ...     {'build_time': 0.25, 'nodes': 0.0},
+    ... )
+    [('runs-1', 'build_time', 1.0, 1.3), ('runs-1', 'nodes', 99, 100)]
+    >>> compare({'a': {'build_time': 1.2}}, {'a': {'build_time': 1.0}}, {'build_time': 0.25})
+    []
+    >>> compare({'a': {'fps': 70}}, {'a': {'fps': 100}}, {'fps': 0.2}, higher_is_better=['fps'])
+    [('a', 'fps', 100, 70)]
+
+    Returns
+    -------
+    :obj:`list`
+        ``(case, metric, baseline, result)`` tuples of the regressed metrics.
+
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if reference is None or metric not in tolerances:
+                continue
+            change = reference - value if metric in higher_is_better else value - reference
+            if change > tolerances[metric] * abs(reference):
+                regressions.append((name, metric, reference, value))
+    return regressions
+
+
+def load_baseline(path):
+    """Read stored results, if any."""
+    path = Path(path)
+    return json.loads(path.read_text())['results'] if path.is_file() else {}
+
+
+def save_baseline(path, results, metrics=None):
+    """
+    Store results as a baseline, updating the results already stored in ``path``.
+
+    If ``metrics`` is given, only those metrics are stored.
+
+    """
+    from .. import __version__
+
+    path = Path(path)
+    stored = load_baseline(path)
+    stored.update(
+        {
+            name: {
+                key: value for key, value in values.items() if metrics is None or key in metrics
+            }
+            for name, values in results.items()
+        }
+    )
+    contents = {'fmriprep': __version__, 'python': sys.version.split()[0], 'results': stored}
+    path.write_text(json.dumps(contents, indent=2, sort_keys=True) + '\n')
+
+
+def format_results(results, baseline=None):
+    """
+    Format results as a table, with the relative change from the baseline.
+
+    >>> print(format_results({'a': {'nodes': 110, 'time': 2.5}}, {'a': {'nodes': 100}}))
+    case  nodes       time
+    a     110 (+10%)  2.5
+
+    """
+    baseline = baseline or {}
+    metrics = sorted({metric for values in results.values() for metric in values})
+    rows = [['case', *metrics]]
+    for name, values in results.items():
+        row = [name]
+        for metric in metrics:
+            value = values.get(metric)
+            reference = baseline.get(name, {}).get(metric)
+            cell = '-' if value is None else f'{value:g}'
+            if value is not None and reference:
+                cell += f' ({(value - reference) / reference:+.0%})'
+            row.append(cell)
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths, strict=True)).rstrip()
+        for row in rows
+    )
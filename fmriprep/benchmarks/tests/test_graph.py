@@ -0,0 +1,28 @@
+import nibabel as nb
+
+from .. import graph
+from ..datasets import generate_dataset
+
+
+def test_generate_dataset(tmp_path):
+    bids_dir = generate_dataset(tmp_path / 'bids', subjects=2, sessions=2, runs=2, echoes=3)
+
+    bold_files = sorted(bids_dir.glob('sub-*/ses-*/func/*_bold.nii.gz'))
+    assert len(bold_files) == 2 * 2 * 2 * 3
+    assert nb.load(bold_files[0]).shape == (64, 64, 40, 300)
+    # Headers only
+    assert sum(path.stat().st_size for path in bids_dir.rglob('*.nii.gz')) < 100_000
+    assert len(list(bids_dir.glob('sub-02/ses-2/fmap/*_epi.nii.gz'))) == 2
+
+
+def test_run_case(tmp_path, monkeypatch):
+    monkeypatch.setitem(graph.CASES, 'test', {'dataset': {'subjects': 2, 'fieldmaps': False}})
+
+    metrics = graph.run_case('test', work_dir=tmp_path, level='minimal')
+    assert set(metrics) == set(graph.TOLERANCES)
+    assert metrics['nodes'] > 0
+    assert metrics['pickle_size'] > 0
+
+    # Both subjects are built
+    single = graph.run_case('runs-1', work_dir=tmp_path, level='minimal')
+    assert metrics['nodes'] > single['nodes']
@@ -0,0 +1,24 @@
+import pytest
+
+from .. import kernels
+
+
+@pytest.fixture
+def small_grids(monkeypatch):
+    monkeypatch.setitem(kernels.GRIDS, 'bold', ((16, 16, 10), 3.0))
+    monkeypatch.setitem(kernels.GRIDS, 'MNI152NLin2009cAsym:res-2', ((20, 24, 20), 2.0))
+    monkeypatch.setitem(kernels.GRIDS, 'T1w', ((30, 36, 30), 1.0))
+    monkeypatch.setitem(kernels.GRIDS, 'T1w:res-0.8', ((36, 44, 36), 0.8))
+
+
+@pytest.mark.parametrize('name', list(kernels.CASES))
+def test_run_case(tmp_path, monkeypatch, small_grids, name):
+    setup, kwargs, _ = kernels.CASES[name]
+    monkeypatch.setitem(kernels.CASES, name, (setup, {**kwargs, 'volumes': 5}, 1))
+
+    metrics = kernels.run_case(name, work_dir=tmp_path)
+    assert metrics['time'] > 0
+    assert metrics['peak_memory'] > 0
+    assert metrics.get('throughput', 1) > 0
+    # Temporary inputs are cleaned up
+    assert not list(tmp_path.iterdir())
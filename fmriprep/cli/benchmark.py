@@ -0,0 +1,161 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Run the performance benchmarks of *fMRIPrep* (``fmriprep-benchmark``)."""
+
+import json
+import sys
+from pathlib import Path
+
+#: Benchmark suites, with their descriptions
+SUITES = {
+    'graph': 'Time the construction of the workflow over synthetic datasets',
+    'kernels': 'Time the numerical kernels over synthetic data',
+}
+
+
+def _build_parser():
+    from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError
+
+    from .. import data
+    from ..benchmarks import graph, kernels
+
+    def _tolerance(value):
+        metric, _, fraction = value.partition('=')
+        try:
+            return metric, float(fraction)
+        except ValueError as exc:
+            raise ArgumentTypeError(f'expected METRIC=FRACTION, got {value!r}') from exc
+
+    parser = ArgumentParser(description=__doc__, formatter_class=ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='suite', required=True)
+    suites = {
+        suite: subparsers.add_parser(
+            suite, help=help_text, formatter_class=ArgumentDefaultsHelpFormatter
+        )
+        for suite, help_text in SUITES.items()
+    }
+
+    suites['graph'].add_argument(
+        'cases',
+        nargs='*',
+        metavar='CASE',
+        default=list(graph.CASES),
+        help=f'Cases to run (choices: {", ".join(graph.CASES)})',
+    )
+    suites['graph'].add_argument(
+        '--level',
+        choices=['minimal', 'resampling', 'full'],
+        default='full',
+        help='Processing level of the built workflow',
+    )
+
+    suites['kernels'].add_argument(
+        'cases',
+        nargs='*',
+        metavar='CASE',
+        default=list(kernels.CASES),
+        help=f'Cases to run (choices: {", ".join(kernels.CASES)})',
+    )
+    suites['kernels'].add_argument(
+        '--repeats', type=int, help='Timed repeats of each case (default: set by each case)'
+    )
+
+    for suite, subparser in suites.items():
+        subparser.add_argument(
+            '-w',
+            '--work-dir',
+            type=Path,
+            help='Directory where synthetic data are generated',
+        )
+        subparser.add_argument(
+            '--baseline',
+            type=Path,
+            default=data.load(f'benchmarks/{suite}.json'),
+            help='Stored results to compare against (only machine-independent metrics '
+            'are compared against the distributed baseline)',
+        )
+        subparser.add_argument(
+            '--save-baseline',
+            type=Path,
+            metavar='PATH',
+            help='Store the results as a baseline (updating the results already in PATH). '
+            'Only machine-independent metrics are stored into the distributed baseline',
+        )
+        subparser.add_argument(
+            '--tolerance',
+            type=_tolerance,
+            action='append',
+            default=[],
+            metavar='METRIC=FRACTION',
+            help='Relative change of a metric flagged as a regression',
+        )
+        subparser.add_argument(
+            '-o', '--output', type=Path, help='Write the results in JSON format to this file'
+        )
+    return parser
+
+
+def main(argv=None):
+    """Entry point of ``fmriprep-benchmark``."""
+    from .. import data
+    from ..benchmarks import graph, kernels, results
+
+    parser = _build_parser()
+    opts = parser.parse_args(argv)
+
+    suite = {'graph': graph, 'kernels': kernels}[opts.suite]
+    if unknown := set(opts.cases) - set(suite.CASES):
+        parser.error(f'Unknown cases: {", ".join(sorted(unknown))}')
+
+    if opts.suite == 'graph':
+        metrics = graph.run_cases(opts.cases, work_dir=opts.work_dir, level=opts.level)
+    else:
+        metrics = kernels.run_cases(opts.cases, work_dir=opts.work_dir, repeats=opts.repeats)
+
+    # Timings depend on the machine, so the distributed baseline does not hold them
+    distributed = Path(data.load(f'benchmarks/{opts.suite}.json')).absolute()
+
+    baseline = results.load_baseline(opts.baseline)
+    print(results.format_results(metrics, baseline))
+
+    if opts.output:
+        opts.output.write_text(json.dumps(metrics, indent=2) + '\n')
+    if opts.save_baseline:
+        portable = opts.save_baseline.absolute() == distributed
+        results.save_baseline(
+            opts.save_baseline, metrics, suite.PORTABLE_METRICS if portable else None
+        )
+
+    tolerances = {**suite.TOLERANCES, **dict(opts.tolerance)}
+    if opts.baseline.absolute() == distributed:
+        tolerances = {
+            metric: tol for metric, tol in tolerances.items() if metric in suite.PORTABLE_METRICS
+        }
+    regressions = results.compare(metrics, baseline, tolerances, suite.HIGHER_IS_BETTER)
+    for name, metric, reference, value in regressions:
+        print(f'REGRESSION: {name} {metric} {reference:g} -> {value:g}', file=sys.stderr)
+    return int(bool(regressions))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -283,6 +283,22 @@ def _build_parser(**kwargs):
             '(e.g., `--derivatives smriprep=/path/to/smriprep`).'
         ),
     )
+    g_bids.add_argument(
+        '--fit-cache-dir',
+        metavar='PATH',
+        type=Path,
+        help='Path to a cache of the outputs of the BOLD fit stage (head-motion correction, '
+        'reference and registration), reused for BOLD series whose inputs and fitting '
+        'options are unchanged, and shared by runs with different output settings. '
+        'Pre-computed derivatives (--derivatives) take precedence. Implies --fit-cache.',
+    )
+    g_bids.add_argument(
+        '--fit-cache',
+        action='store_true',
+        default=False,
+        help='Reuse and store outputs of the BOLD fit stage in the fit cache '
+        '(at --fit-cache-dir, or OUTPUT_DIR/sourcedata/fitcache by default).',
+    )
     g_bids.add_argument(
         '--bids-database-dir',
         metavar='PATH',
@@ -331,6 +347,44 @@ def _build_parser(**kwargs):
         type=IsFile,
         help='Nipype plugin configuration file',
     )
+    g_perfm.add_argument(
+        '--warm-pool',
+        action='store_true',
+        default=False,
+        help='Run nodes on worker processes with preloaded imports (MultiProc plugin only), '
+        'replaced when their resident memory grows too large',
+    )
+    g_perfm.add_argument(
+        '--worker-max-rss-gb',
+        action='store',
+        type=float,
+        metavar='GB',
+        help='With --warm-pool, replace the worker pool when the resident memory of a '
+        'worker exceeds this after running a node (default: 4)',
+    )
+    g_perfm.add_argument(
+        '--fuse-nodes',
+        action=BooleanOptionalAction,
+        default=True,
+        help='Fold trivial bookkeeping nodes (e.g., list selections) into the connections '
+        'of the nodes consuming their outputs, reducing scheduling and filesystem overhead.',
+    )
+    g_perfm.add_argument(
+        '--resample-within-mask',
+        action=BooleanOptionalAction,
+        default=False,
+        help='Only interpolate standard-space BOLD series within the brain mask of the '
+        'template dilated by 4 voxels. This changes the outputs: voxels farther from the '
+        'brain are set to zero instead of being interpolated (default: off).',
+    )
+    g_perfm.add_argument(
+        '--reports-nprocs',
+        dest='reports_nprocs',
+        action='store',
+        type=PositiveInt,
+        help='Number of processes generating the visual reports of different subjects in '
+        'parallel (default: serial)',
+    )
     g_perfm.add_argument(
         '--sloppy',
         action='store_true',
@@ -363,6 +417,13 @@ def _build_parser(**kwargs):
         help="Only generate reports, don't run workflows. This will only rerun report "
         'aggregation, not reportlet generation for specific nodes.',
     )
+    g_subset.add_argument(
+        '--reports-incremental',
+        action=BooleanOptionalAction,
+        default=False,
+        help='Skip regenerating visual reports whose reportlets, boilerplate, crashfiles '
+        'and specification have not changed since they were last generated (default: off).',
+    )
 
     g_conf = parser.add_argument_group('Workflow configuration')
     g_conf.add_argument(
@@ -417,6 +478,14 @@ https://fmriprep.readthedocs.io/en/{currentv.base_version if is_release else 'la
         'if available, otherwise the T1w image. `t1w` forces use of the T1w, `t2w` forces use of '
         'the T2w, and `header` uses the BOLD header information without an initial registration.',
     )
+    g_conf.add_argument(
+        '--bold2anat-speculative',
+        action='store_true',
+        default=False,
+        help='Run boundary-based registration initialized with both the header and the initial '
+        'coregistration concurrently, and keep the registration of lowest cost (among these two '
+        'and the initial coregistration). Only applies if BBR is not forced or disabled.',
+    )
     g_conf.add_argument(
         '--bold2anat-dof',
         action='store',
@@ -529,6 +598,23 @@ https://fmriprep.readthedocs.io/en/{currentv.base_version if is_release else 'la
         'from surface resampling. Only performed for GIFTI files mapped to a freesurfer subject '
         '(fsaverage or fsnative).',
     )
+    g_outputs.add_argument(
+        '--quantize-outputs',
+        action='store',
+        choices=('int16', 'uint16'),
+        help='Store the BOLD series resampled into output spaces as scaled integers of this '
+        'type, halving their size on disk. Series are stored as float32 if the quantization '
+        'error would exceed --quantize-tolerance. The scaling and the quantization error '
+        'are reported in the JSON sidecar.',
+    )
+    g_outputs.add_argument(
+        '--quantize-tolerance',
+        action='store',
+        type=float,
+        default=0.01,
+        help='Maximum quantization error of --quantize-outputs, as a fraction of the median '
+        'temporal standard deviation of each series',
+    )
     g_outputs.add_argument(
         '--md-only-boilerplate',
         action='store_true',
@@ -726,6 +812,15 @@ https://fmriprep.readthedocs.io/en/{currentv.base_version if is_release else 'la
         default=False,
         help="Enable Nipype's resource monitoring to keep track of memory and CPU usage",
     )
+    g_other.add_argument(
+        '--trace',
+        action='store_true',
+        default=False,
+        help='Record where the wall time of the execution goes (node scheduling, setup, '
+        'hash checks, interfaces and their hot paths, result pickling and I/O), as a '
+        'Chrome trace (<output_dir>/logs/<run_uuid>/trace.json) that can be opened with '
+        'Perfetto (https://ui.perfetto.dev)',
+    )
     g_other.add_argument(
         '--config-file',
         action='store',
@@ -905,6 +1000,12 @@ applied."""
         elif output_layout == 'legacy':
             config.execution.fs_subjects_dir = output_dir / 'freesurfer'
 
+    if opts.fit_cache and config.execution.fit_cache_dir is None:
+        if output_layout == 'bids':
+            config.execution.fit_cache_dir = output_dir / 'sourcedata' / 'fitcache'
+        elif output_layout == 'legacy':
+            config.execution.fit_cache_dir = output_dir / 'fitcache'
+
     if config.execution.fmriprep_dir is None:
         if output_layout == 'bids':
             config.execution.fmriprep_dir = output_dir
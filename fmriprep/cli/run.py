@@ -33,12 +33,19 @@ def main():
     from os import EX_SOFTWARE
     from pathlib import Path
 
+    from ..utils import tracing
     from ..utils.bids import write_bidsignore, write_derivative_description
     from .parser import parse_args
     from .workflow import build_workflow
 
     parse_args()
 
+    if config.nipype.warm_pool:
+        from ..engine.plugin import preload_forkserver
+
+        # Must happen before any process is started from the forkserver
+        preload_forkserver()
+
     # Code Carbon
     if config.execution.track_carbon:
         from codecarbon import OfflineEmissionsTracker
@@ -142,7 +149,8 @@ def main():
     config.loggers.workflow.log(25, 'fMRIPrep started!')
     errno = 1  # Default is error exit unless otherwise set
     try:
-        fmriprep_wf.run(**config.nipype.get_plugin())
+        with tracing.span('workflow run', cat='scheduler'):
+            fmriprep_wf.run(**config.nipype.get_plugin())
     except Exception as e:
         if not config.execution.notrack:
             from ..utils.telemetry import process_crashfile
@@ -185,18 +193,10 @@ def main():
 
         if config.workflow.run_reconall:
             from niworkflows.utils.misc import _copy_any
-            from templateflow import api
-
-            dseg_tsv = str(
-                api.get(
-                    'fsaverage',
-                    hemi=None,
-                    atlas=None,
-                    segmentation='aparc',
-                    suffix='dseg',
-                    extension=['.tsv'],
-                )
-            )
+
+            from ..utils.templates import aseg_dseg_tsv
+
+            dseg_tsv = str(aseg_dseg_tsv())
             _copy_any(dseg_tsv, str(config.execution.fmriprep_dir / 'desc-aseg_dseg.tsv'))
             _copy_any(dseg_tsv, str(config.execution.fmriprep_dir / 'desc-aparcaseg_dseg.tsv'))
         errno = 0
@@ -215,12 +215,30 @@ def main():
             config.execution.get().get('bids_filters', {}).get('bold', {}).get('session')
         )
 
-        failed_reports = generate_reports(
-            config.execution.participant_label,
-            config.execution.fmriprep_dir,
-            config.execution.run_uuid,
-            session_list=session_list,
-        )
+        run_log_dir = config.execution.log_dir / config.execution.run_uuid
+        if config.nipype.trace:
+            from fmriprep.reports.scheduling import write_scheduling_report
+
+            # Analyze the schedule for the reports, and to inform --nprocs/--omp-nthreads
+            try:
+                write_scheduling_report(
+                    run_log_dir / 'trace',
+                    config.execution.fmriprep_dir,
+                    config.execution.run_uuid,
+                    config.nipype.nprocs,
+                )
+            except Exception as e:  # noqa: BLE001
+                config.loggers.workflow.warning(f'Could not analyze the execution trace: {e}')
+
+        with tracing.span('generate_reports', cat='reports'):
+            failed_reports = generate_reports(
+                config.execution.participant_label,
+                config.execution.fmriprep_dir,
+                config.execution.run_uuid,
+                session_list=session_list,
+                n_procs=config.execution.reports_nprocs,
+                incremental=config.execution.reports_incremental,
+            )
         write_derivative_description(
             config.execution.bids_dir,
             config.execution.fmriprep_dir,
@@ -228,6 +246,17 @@ def main():
         )
         write_bidsignore(config.execution.fmriprep_dir)
 
+        if config.nipype.trace:
+            trace_file = tracing.export_chrome_trace(
+                run_log_dir / 'trace',
+                run_log_dir / 'trace.json',
+                metadata={
+                    'run_uuid': config.execution.run_uuid,
+                    'version': config.environment.version,
+                },
+            )
+            config.loggers.workflow.log(25, f'Execution trace written to {trace_file}.')
+
         if failed_reports:
             msg = (
                 'Report generation was not successful for the following participants '
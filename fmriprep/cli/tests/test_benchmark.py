@@ -0,0 +1,62 @@
+"""Test the benchmarks' command line."""
+
+import json
+
+import pytest
+
+from ...benchmarks import graph
+from ..benchmark import main
+
+
+@pytest.fixture
+def fake_cases(monkeypatch):
+    metrics = {'runs-1': {'build_time': 2.0, 'nodes': 500}, 'runs-16': {'nodes': 3000}}
+
+    def _run_cases(names, work_dir=None, level='full'):
+        return {name: metrics[name] for name in names}
+
+    monkeypatch.setattr(graph, 'run_cases', _run_cases)
+    return metrics
+
+
+def test_benchmark_graph(tmp_path, fake_cases, capsys):
+    baseline = tmp_path / 'baseline.json'
+    args = ['graph', 'runs-1', '--baseline', str(baseline)]
+
+    # No baseline, no regressions
+    assert main([*args, '--save-baseline', str(baseline)]) == 0
+    assert json.loads(baseline.read_text())['results'] == {'runs-1': fake_cases['runs-1']}
+
+    fake_cases['runs-1'] = {'build_time': 2.4, 'nodes': 501}
+    assert main([*args, '-o', str(tmp_path / 'results.json')]) == 1
+    captured = capsys.readouterr()
+    assert 'REGRESSION: runs-1 nodes 500 -> 501' in captured.err
+    assert 'build_time' not in captured.err
+    assert '+20%' in captured.out
+    assert json.loads((tmp_path / 'results.json').read_text()) == {'runs-1': fake_cases['runs-1']}
+
+    assert main([*args, '--tolerance', 'nodes=0.01', '--tolerance', 'build_time=0.1']) == 1
+    assert 'REGRESSION: runs-1 build_time 2 -> 2.4' in capsys.readouterr().err
+
+    # Other cases are added to the stored baseline
+    main(['graph', 'runs-16', '--baseline', str(baseline), '--save-baseline', str(baseline)])
+    assert set(json.loads(baseline.read_text())['results']) == {'runs-1', 'runs-16'}
+
+    with pytest.raises(SystemExit):
+        main(['graph', 'runs-1000'])
+
+
+def test_benchmark_distributed_baseline(tmp_path, fake_cases, monkeypatch):
+    from ... import data
+
+    monkeypatch.setattr(data, 'load', lambda path: tmp_path / path)
+    distributed = tmp_path / 'benchmarks' / 'graph.json'
+    distributed.parent.mkdir()
+
+    # Only machine-independent metrics are stored into the distributed baseline
+    assert main(['graph', 'runs-1', '--save-baseline', str(distributed)]) == 0
+    assert json.loads(distributed.read_text())['results'] == {'runs-1': {'nodes': 500}}
+
+    # ... and compared against it
+    distributed.write_text(json.dumps({'results': {'runs-1': {'build_time': 1.0, 'nodes': 500}}}))
+    assert main(['graph', 'runs-1']) == 0
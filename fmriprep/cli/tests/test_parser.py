@@ -159,6 +159,34 @@ def test_parse_args(tmp_path, minimal_bids):
     _reset_config()
 
 
+@pytest.mark.parametrize(
+    ('args', 'expected'),
+    [
+        ([], None),
+        (['--fit-cache'], 'out/sourcedata/fitcache'),
+        (['--fit-cache-dir', 'cache'], 'cache'),
+    ],
+)
+def test_fit_cache(tmp_path, minimal_bids, args, expected):
+    parse_args(
+        args=[
+            str(minimal_bids),
+            str(tmp_path / 'out'),
+            'participant',
+            '-w',
+            str(tmp_path / 'work'),
+            '--skip-bids-validation',
+            *[str(tmp_path / arg) if arg == 'cache' else arg for arg in args],
+        ]
+    )
+    # The fit cache is opt-in
+    if expected is None:
+        assert config.execution.fit_cache_dir is None
+    else:
+        assert config.execution.fit_cache_dir == tmp_path / expected
+    _reset_config()
+
+
 def test_bids_filter_file(tmp_path, capsys):
     bids_path = tmp_path / 'data'
     out_path = tmp_path / 'out'
@@ -279,6 +307,10 @@ def test_derivatives(tmp_path):
         (['--submm-recon'], 'hires', True),
         ([], 'hires', True),
         (['--no-msm'], 'run_msmsulc', False),
+        ([], 'reports_incremental', False),
+        ([], 'resample_within_mask', False),
+        (['--resample-within-mask'], 'resample_within_mask', True),
+        (['--reports-incremental'], 'reports_incremental', True),
     ],
 )
 def test_optional_booleans(tmp_path, supp_args, opt, expected):
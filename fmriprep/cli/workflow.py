@@ -39,8 +39,10 @@ def build_workflow(config_file, retval):
 
     from fmriprep import config, data
     from fmriprep.reports.core import generate_reports
+    from fmriprep.utils import tracing
     from fmriprep.utils.bids import check_pipeline_version
     from fmriprep.utils.misc import check_deps, fmt_subjects_sessions
+    from fmriprep.utils.templates import prefetch_templates
     from fmriprep.workflows.base import init_fmriprep_wf
 
     config.load(config_file)
@@ -87,6 +89,8 @@ def build_workflow(config_file, retval):
             config.execution.fmriprep_dir,
             config.execution.run_uuid,
             session_list=session_list,
+            n_procs=config.execution.reports_nprocs,
+            incremental=config.execution.reports_incremental,
         )
         if failed_reports:
             config.loggers.cli.error(
@@ -108,12 +112,25 @@ def build_workflow(config_file, retval):
     if config.execution.derivatives:
         init_msg += [f'Searching for derivatives: {list(config.execution.derivatives.values())}.']
 
+    if config.execution.fit_cache_dir:
+        init_msg += [f'Fit cache: {config.execution.fit_cache_dir}.']
+
     if config.execution.fs_subjects_dir:
         init_msg += [f"Pre-run FreeSurfer's SUBJECTS_DIR: {config.execution.fs_subjects_dir}."]
 
     build_log.log(25, f'\n{" " * 11}* '.join(init_msg))
 
-    retval['workflow'] = init_fmriprep_wf()
+    # Resolve template resources once, failing early if any is unavailable
+    try:
+        with tracing.span('prefetch_templates', cat='build'):
+            prefetch_templates()
+    except RuntimeError as err:
+        build_log.critical(str(err))
+        return retval
+
+    with tracing.span('init_fmriprep_wf', cat='build') as span_args:
+        retval['workflow'] = init_fmriprep_wf()
+        span_args['nodes'] = len(retval['workflow']._get_all_nodes())
 
     # Check for FS license after building the workflow
     if not check_valid_fs_license():
@@ -138,7 +155,8 @@ license file at several paths, in this order: 1) command line argument ``--fs-li
         return retval
 
     # Check workflow for missing commands
-    missing = check_deps(retval['workflow'])
+    with tracing.span('check_deps', cat='build'):
+        missing = check_deps(retval['workflow'])
     if missing:
         deps_list = '\n'.join([f'\t* {cmd} (Interface: {iface})' for iface, cmd in missing])
         build_log.critical(f'Cannot run fMRIPrep. Missing dependencies:\n{deps_list}')
@@ -146,9 +164,7 @@ license file at several paths, in this order: 1) command line argument ``--fs-li
         return retval
 
     config.to_filename(config_file)
-    build_log.info(
-        f'fMRIPrep workflow graph with {len(retval["workflow"]._get_all_nodes())} nodes built successfully.'
-    )
+    build_log.info(f'fMRIPrep workflow graph with {span_args["nodes"]} nodes built successfully.')
     retval['return_code'] = 0
     return retval
 
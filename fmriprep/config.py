@@ -320,7 +320,8 @@ class nipype(_Config):
     omp_nthreads = None
     """Number of CPUs a single process can access for multithreaded execution."""
     plugin = 'MultiProc'
-    """NiPype's execution plugin."""
+    """NiPype's execution plugin. ``SharedFS`` runs nodes on workers pulling them from a queue
+    on a shared filesystem (see :class:`~fmriprep.engine.distributed.SharedFSPlugin`)."""
     plugin_args = {
         'maxtasksperchild': 1,
         'raise_insufficient': False,
@@ -332,6 +333,15 @@ class nipype(_Config):
     """Enable resource monitor."""
     stop_on_first_crash = True
     """Whether the workflow should stop or continue after the first error."""
+    trace = False
+    """Record the execution as spans, exported as a Chrome trace to
+    ``<log_dir>/<run_uuid>/trace.json`` (see :mod:`fmriprep.utils.tracing`)."""
+    warm_pool = False
+    """Run MultiProc nodes on long-lived workers with preloaded imports
+    (see :class:`~fmriprep.engine.plugin.WarmMultiProcPlugin`)."""
+    worker_max_rss_gb = None
+    """Resident memory (GB) of a warm worker, after running a node, above which the worker
+    pool is replaced."""
 
     @classmethod
     def get_plugin(cls):
@@ -344,6 +354,30 @@ class nipype(_Config):
             out['plugin_args']['n_procs'] = int(cls.nprocs)
             if cls.memory_gb:
                 out['plugin_args']['memory_gb'] = float(cls.memory_gb)
+        if cls.warm_pool and cls.plugin == 'MultiProc':
+            from .engine.plugin import WarmMultiProcPlugin
+
+            # Not an option of the executor of MultiProc, whose workers are long-lived anyway
+            plugin_args = {k: v for k, v in cls.plugin_args.items() if k != 'maxtasksperchild'}
+            if cls.worker_max_rss_gb:
+                plugin_args['max_worker_rss_gb'] = float(cls.worker_max_rss_gb)
+            if execution.log_dir:
+                plugin_args['dispatch_log'] = str(
+                    Path(execution.log_dir) / execution.run_uuid / 'dispatch.tsv'
+                )
+            out['plugin'] = WarmMultiProcPlugin(plugin_args=plugin_args)
+            out['plugin_args'] = plugin_args
+        elif cls.trace and cls.plugin == 'MultiProc':
+            from .engine.plugin import TracedMultiProcPlugin
+
+            out['plugin'] = TracedMultiProcPlugin(plugin_args=out['plugin_args'])
+        elif cls.plugin == 'SharedFS':
+            from .engine.distributed import SharedFSPlugin
+
+            plugin_args = dict(cls.plugin_args)
+            plugin_args.setdefault('queue_dir', str(Path(execution.work_dir) / 'queue'))
+            out['plugin'] = SharedFSPlugin(plugin_args=plugin_args)
+            out['plugin_args'] = plugin_args
         return out
 
     @classmethod
@@ -381,6 +415,14 @@ class nipype(_Config):
         if cls.omp_nthreads is None:
             cls.omp_nthreads = min(cls.nprocs - 1 if cls.nprocs > 1 else os.cpu_count(), 8)
 
+        # Tracing is enabled once the log directory has been set up
+        if cls.trace and execution.log_dir:
+            from .engine.tracing import instrument_nipype
+            from .utils import tracing
+
+            tracing.enable(Path(execution.log_dir) / execution.run_uuid / 'trace')
+            instrument_nipype()
+
 
 class execution(_Config):
     """Configure run-level settings."""
@@ -405,6 +447,9 @@ class execution(_Config):
     """Select a particular echo for multi-echo EPI datasets."""
     fmriprep_dir = None
     """Root of fMRIPrep BIDS Derivatives dataset. Depends on output_layout."""
+    fit_cache_dir = None
+    """Content-addressed cache of the outputs of the BOLD fit stage
+    (see :mod:`~fmriprep.utils.fitcache`). Disabled if unset."""
     fs_license_file = _fs_license
     """An existing file containing a FreeSurfer license."""
     fs_subjects_dir = None
@@ -438,6 +483,10 @@ class execution(_Config):
     the command line) as spatial references for outputs."""
     reports_only = False
     """Only build the reports, based on the reportlets found in a cached working directory."""
+    reports_nprocs = None
+    """Number of worker processes generating the visual reports of subjects (serial if unset)."""
+    reports_incremental = False
+    """Skip visual reports whose fingerprint manifest matches their current inputs."""
     run_uuid = f'{strftime("%Y%m%d-%H%M%S")}_{uuid4()}'
     """Unique identifier of this particular run."""
     processing_groups = None
@@ -464,6 +513,7 @@ class execution(_Config):
         'derivatives',
         'bids_database_dir',
         'fmriprep_dir',
+        'fit_cache_dir',
         'fs_license_file',
         'fs_subjects_dir',
         'layout',
@@ -574,6 +624,9 @@ class workflow(_Config):
     """Method of initial BOLD to anatomical coregistration. If `auto`, a T2w image is used
     if available, otherwise the T1w image. `t1w` forces use of the T1w, `t2w` forces use of
     the T2w, and `header` uses the BOLD header information without an initial registration."""
+    bold2anat_speculative = False
+    """Run the BOLD-to-anatomical registration candidates (header- and coregistration-initialized
+    BBR, and the coregistration itself) concurrently, and select the one of lowest cost."""
     cifti_output = None
     """Generate HCP Grayordinates, accepts either ``'91k'`` (default) or ``'170k'``."""
     dummy_scans = None
@@ -584,6 +637,8 @@ class workflow(_Config):
     """Remove the mean from fieldmaps."""
     force_syn = None
     """Run *fieldmap-less* susceptibility-derived distortions estimation."""
+    fuse_nodes = True
+    """Fold trivial bookkeeping nodes into the connections of their consumers."""
     fallback_total_readout_time = None
     """Infer the total readout time if unavailable from authoritative metadata.
     This may be a number or the string "estimated"."""
@@ -603,12 +658,20 @@ class workflow(_Config):
     """Fill medial surface with :abbr:`NaNs (not-a-number)` when sampling."""
     project_goodvoxels = False
     """Exclude voxels with locally high coefficient of variation from sampling."""
+    quantize_outputs = None
+    """Store resampled BOLD series as scaled integers of this type (``int16`` or ``uint16``)."""
+    quantize_tolerance = 0.01
+    """Maximum quantization error of resampled BOLD series, as a fraction of the
+    median temporal standard deviation of each series."""
     regressors_all_comps = None
     """Return all CompCor components."""
     regressors_dvars_th = None
     """Threshold for DVARS."""
     regressors_fd_th = None
     """Threshold for :abbr:`FD (frame-wise displacement)`."""
+    resample_within_mask = False
+    """Only interpolate standard-space BOLD within the template brain mask dilated by 4 voxels,
+    zero-filling the rest of the field of view (changes the outputs, hence opt-in)."""
     run_reconall = True
     """Run FreeSurfer's surface reconstruction."""
     skull_strip_fixed_seed = False
@@ -0,0 +1,643 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Distributed execution on workers pulling nodes from a shared-filesystem queue.
+
+:class:`SharedFSPlugin` runs the nodes of a workflow on workers, possibly on
+many machines, that share a filesystem with the scheduler (as they must share
+the working directory anyway), without a batch system or a network service.
+Workers are started on each machine with::
+
+    python -m fmriprep.engine.distributed <queue_dir> [--nprocs N] [--mem-gb GB]
+
+(and stopped by interrupting them, or creating ``workers/<worker>.stop``),
+or by the plugin itself, on the machine of the scheduler (``n_local_workers``).
+
+The queue directory holds:
+
+``workers/<worker>.json``
+    The resources (``n_procs``, ``mem_gb``) of each worker. Workers update the
+    modification time of their file as a heartbeat.
+``jobs/<worker>/<job>.pklz``
+    Nodes placed on each worker, waiting to be pulled. Jobs are named after
+    the run, the node and the attempt at running it
+    (``<run>-<taskid>-<attempt>.pklz``).
+``running/<worker>/<job>.pklz``
+    Nodes pulled by each worker, running.
+``results/<job>.pklz``
+    Results of the nodes, collected by the scheduler.
+
+Nodes are placed by data locality first: the nodes of a subject are placed
+on the worker that ran its first node (and thus holds its anatomical
+derivatives, FreeSurfer subject directory and templates in its caches),
+as long as its outstanding nodes fit in its resources (``n_procs`` and
+``mem_gb``); otherwise, on the least loaded worker.
+Workers only pull the nodes that fit in their free resources, in order of
+submission.
+
+Nodes that fail, or whose worker is lost (its heartbeat stops), are placed
+again on another worker up to ``max_retries`` times, unless
+``stop_on_first_crash`` is set, in which case the run stops on the first
+failure, as with the other plugins.
+Heartbeats are timed with the clock of the scheduler, as the modification
+times of the worker files come from the clock of the file server.
+Workers run each node in a process of its own, which they kill (along with
+the processes it started) as soon as they find its job withdrawn from
+``running/``, so that a worker that was only stalled stops running the nodes
+placed again on another worker.
+Workers only report the results of the jobs they still hold in ``running/``,
+and the scheduler discards the results of previous attempts.
+
+"""
+
+import json
+import multiprocessing as mp
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from traceback import format_exception
+from uuid import uuid4
+
+from nipype import logging
+from nipype.pipeline.plugins.base import DistributedPluginBase
+from nipype.utils.filemanip import loadpkl, savepkl
+from nipype.utils.misc import str2bool
+
+from ..reports.scheduling import SUBJECT_WF
+from ..utils import tracing
+from .plugin import PRELOAD_MODULES, _warm_initializer, run_node
+
+logger = logging.getLogger('nipype.workflow')
+
+HEARTBEAT_TIMEOUT = 60.0
+"""Seconds without a heartbeat after which a worker is considered lost."""
+
+POLL_SECS = 0.5
+"""Seconds between two polls of the queue by workers."""
+
+STOP_SUFFIX = '.stop'
+"""Suffix of the file (next to the worker's) requesting a worker to stop."""
+
+
+def locality_key(node):
+    """
+    Key of the data a node works on: the subject of its workflow, if any.
+
+    >>> from nipype.pipeline import engine as pe
+    >>> from nipype.interfaces import utility as niu
+    >>> node = pe.Node(niu.IdentityInterface(fields=['a']), name='node')
+    >>> node._hierarchy = 'fmriprep_25_0_wf.sub_01_ses_1_wf.anat_fit_wf'
+    >>> locality_key(node)
+    '01'
+    >>> node._hierarchy = 'fmriprep_25_0_wf'
+    >>> locality_key(node) is None
+    True
+
+    """
+    for part in node.fullname.split('.'):
+        if match := SUBJECT_WF.match(part):
+            return match['subject']
+    return None
+
+
+def _save_atomic(path, record):
+    """Write a pickle aside and move it into place, so readers never find it incomplete."""
+    # Keep the suffix, which determines the compression of the pickle
+    tmp_file = path.parent / f'.{path.stem}.{os.getpid()}.{threading.get_ident()}{path.suffix}'
+    savepkl(str(tmp_file), record)
+    os.replace(tmp_file, path)
+
+
+def _failed(exc):
+    """Result of a job that could not run."""
+    return {'result': None, 'traceback': format_exception(type(exc), exc, exc.__traceback__)}
+
+
+def _run_owned(running_file, poll_secs, *args):
+    """
+    Run a node (see :func:`~fmriprep.engine.plugin.run_node`) while the worker owns its job.
+
+    The node runs in a child forked from the (pre-warmed) process of the pool,
+    in a process group of its own. If the job is withdrawn from the worker
+    (its file in ``running/`` disappears), the child and the processes it
+    started are killed.
+
+    """
+    fd, out_file = tempfile.mkstemp(suffix='.pkl')
+    os.close(fd)
+    pid = os.fork()
+    if pid == 0:
+        os.setsid()
+        try:
+            try:
+                result = run_node(*args)
+            except BaseException as exc:  # noqa: BLE001
+                result = _failed(exc)
+            savepkl(out_file, result)
+        finally:
+            os._exit(0)
+
+    try:
+        while not (status := os.waitpid(pid, os.WNOHANG))[0]:
+            if not running_file.exists():
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+                return {
+                    'result': None,
+                    'traceback': [f'Job {running_file.name} was withdrawn from the worker.'],
+                }
+            time.sleep(poll_secs)
+        if not os.path.getsize(out_file):
+            raise RuntimeError(
+                f'The process running job {running_file.name} exited with status {status[1]}.'
+            )
+        return loadpkl(out_file)
+    finally:
+        os.unlink(out_file)
+
+
+def _save_owned(running_file, result_file, record):
+    """
+    Save the result of a job, unless it was withdrawn from the worker.
+
+    The job is moved aside first, so the scheduler cannot withdraw it while
+    its result is being written. Returns whether the result was saved.
+
+    """
+    claimed = running_file.with_name(f'.{running_file.name}')
+    try:
+        os.rename(running_file, claimed)
+    except FileNotFoundError:  # Withdrawn, and placed again on another worker
+        return False
+    _save_atomic(result_file, record)
+    claimed.unlink(missing_ok=True)
+    return True
+
+
+def run_worker(
+    queue_dir,
+    worker_id=None,
+    n_procs=None,
+    mem_gb=None,
+    poll_secs=POLL_SECS,
+    preload=PRELOAD_MODULES,
+):
+    """
+    Run the nodes placed on this worker in the queue, until requested to stop.
+
+    Nodes run on a pool of ``n_procs`` pre-warmed processes (see
+    :class:`~fmriprep.engine.plugin.WarmMultiProcPlugin`), as long as their
+    ``n_procs`` and ``mem_gb`` fit in the free resources of the worker.
+    Nodes whose jobs are withdrawn by the scheduler are killed (see :func:`_run_owned`).
+
+    Parameters
+    ----------
+    queue_dir : :obj:`os.PathLike`
+        Queue directory of the scheduler (see :class:`SharedFSPlugin`)
+    worker_id : :obj:`str`
+        Name of the worker (default: hostname and process ID)
+    n_procs : :obj:`int`
+        Processors available to the worker (default: all)
+    mem_gb : :obj:`float`
+        Memory available to the worker (default: 90% of the system's)
+    poll_secs : :obj:`float`
+        Seconds between two polls of the queue
+    preload : :obj:`tuple` of :obj:`str`
+        Modules imported by the processes of the worker at start-up
+
+    """
+    from nipype.utils.profiler import get_system_total_memory_gb
+
+    queue = Path(queue_dir)
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    n_procs = int(n_procs or os.cpu_count())
+    mem_gb = float(mem_gb or 0.9 * get_system_total_memory_gb())
+
+    inbox = queue / 'jobs' / worker_id
+    running = queue / 'running' / worker_id
+    results = queue / 'results'
+    for path in (inbox, running, results, queue / 'workers'):
+        path.mkdir(parents=True, exist_ok=True)
+
+    info = queue / 'workers' / f'{worker_id}.json'
+    stop_file = info.with_suffix(STOP_SUFFIX)
+    stop_file.unlink(missing_ok=True)
+    info.write_text(
+        json.dumps(
+            {
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'n_procs': n_procs,
+                'mem_gb': mem_gb,
+            }
+        )
+    )
+
+    pool = ProcessPoolExecutor(
+        max_workers=n_procs,
+        initializer=_warm_initializer,
+        initargs=(os.getcwd(), tuple(preload)),
+        mp_context=mp.get_context('forkserver'),
+    )
+    lock = threading.Lock()
+    active = {}  # Resources taken by each running job
+    pending = {}  # Jobs read from the inbox, by file name
+
+    def _done(name, future):
+        try:
+            result = future.result()
+        except Exception as exc:  # noqa: BLE001 - e.g., the process was killed
+            result = _failed(exc)
+        result['worker'] = worker_id
+        if not _save_owned(running / name, results / name, result):
+            logger.warning(
+                '[SharedFS] Job %s was withdrawn from worker %s, discarding its result.',
+                name,
+                worker_id,
+            )
+        with lock:
+            active.pop(name)
+
+    logger.info(
+        '[SharedFS] Worker %s started (%d processors, %0.2fGB).', worker_id, n_procs, mem_gb
+    )
+    try:
+        while not stop_file.exists():
+            os.utime(info)  # Heartbeat
+            job_files = sorted(inbox.glob('*.pklz'))
+            pending = {path.name: pending.get(path.name) for path in job_files}
+            for job_file in job_files:
+                job = pending[job_file.name]
+                if job is None:
+                    try:
+                        job = pending[job_file.name] = loadpkl(job_file)
+                    except FileNotFoundError:  # Withdrawn by the scheduler
+                        continue
+                    except Exception as exc:  # noqa: BLE001
+                        _save_atomic(results / job_file.name, _failed(exc))
+                        job_file.unlink(missing_ok=True)
+                        continue
+
+                # Resources are clipped to those of the worker, so every job can run
+                job_procs = min(job['n_procs'], n_procs)
+                job_mem_gb = min(job['mem_gb'], mem_gb)
+                with lock:
+                    free_procs = n_procs - sum(procs for procs, _ in active.values())
+                    free_mem_gb = mem_gb - sum(gb for _, gb in active.values())
+                if job_procs > free_procs or job_mem_gb > free_mem_gb:
+                    # Wait until the oldest job fits, rather than starving it
+                    break
+
+                try:
+                    os.rename(job_file, running / job_file.name)
+                except OSError:  # Withdrawn by the scheduler
+                    continue
+                pending.pop(job_file.name)
+                with lock:
+                    active[job_file.name] = (job_procs, job_mem_gb)
+                future = pool.submit(
+                    _run_owned,
+                    running / job_file.name,
+                    poll_secs,
+                    job['node'],
+                    job['updatehash'],
+                    job['taskid'],
+                    job['submitted'],
+                    job['trace_dir'],
+                )
+                future.add_done_callback(lambda f, name=job_file.name: _done(name, f))
+            time.sleep(poll_secs)
+    finally:
+        pool.shutdown(wait=True)
+        info.unlink(missing_ok=True)
+        stop_file.unlink(missing_ok=True)
+    logger.info('[SharedFS] Worker %s stopped.', worker_id)
+
+
+class SharedFSPlugin(DistributedPluginBase):
+    """
+    Execute a workflow on workers pulling nodes from a shared-filesystem queue.
+
+    ``plugin_args`` accepts:
+
+    - queue_dir: directory of the queue, on a filesystem shared with the workers
+      (default: ``queue`` in the current directory)
+    - n_local_workers: number of workers started (and stopped) by the plugin,
+      on this machine (default: 0)
+    - n_procs, memory_gb: resources of each local worker
+      (default: all the processors, and 90% of the memory of this machine)
+    - max_retries: times a failed node is placed again (default: 1)
+    - heartbeat_timeout: seconds without a heartbeat after which a worker
+      is considered lost (default: :data:`HEARTBEAT_TIMEOUT`)
+
+    Nodes are recorded as spans when tracing is enabled (see
+    :mod:`fmriprep.engine.tracing`), as with :class:`~fmriprep.engine.plugin.TracedMultiProcPlugin`.
+
+    """
+
+    def __init__(self, plugin_args=None):
+        super().__init__(plugin_args=plugin_args)
+        self._queue = Path(self.plugin_args.get('queue_dir') or 'queue').absolute()
+        self._n_local = int(self.plugin_args.get('n_local_workers', 0))
+        self._max_retries = int(self.plugin_args.get('max_retries', 1))
+        self._heartbeat_timeout = float(
+            self.plugin_args.get('heartbeat_timeout', HEARTBEAT_TIMEOUT)
+        )
+        # Job files are named after the run, so results of other runs are never collected
+        self._run_id = uuid4().hex[:8]
+        self._taskid = 0
+        self._tasks = {}
+        self._affinity = {}
+        self._local_workers = {}
+        self._heartbeats = {}
+        self._workers_checked = (float('-inf'), {})
+        self._waiting_since = None
+
+    def run(self, graph, config, updatehash=False):
+        try:
+            return super().run(graph, config, updatehash=updatehash)
+        finally:
+            self._withdraw_all()
+            self._stop_local_workers()
+
+    def _prerun_check(self, graph):
+        from .tracing import record_graph
+
+        for path in ('jobs', 'running', 'results', 'workers'):
+            (self._queue / path).mkdir(parents=True, exist_ok=True)
+        self._start_local_workers()
+        record_graph(graph)
+
+    def _start_local_workers(self):
+        ctx = mp.get_context('forkserver')
+        for i in range(self._n_local):
+            worker_id = f'{socket.gethostname()}-local{i}-{self._run_id}'
+            process = ctx.Process(
+                target=run_worker,
+                kwargs={
+                    'queue_dir': str(self._queue),
+                    'worker_id': worker_id,
+                    'n_procs': self.plugin_args.get('n_procs'),
+                    'mem_gb': self.plugin_args.get('memory_gb'),
+                },
+                name=f'SharedFS-{worker_id}',
+            )
+            process.start()
+            self._local_workers[worker_id] = process
+
+        deadline = time.monotonic() + self._heartbeat_timeout
+        while not set(self._local_workers) <= set(self._workers()):
+            if time.monotonic() > deadline:
+                raise RuntimeError('Local workers of the SharedFS plugin did not start.')
+            time.sleep(POLL_SECS)
+
+    def _stop_local_workers(self):
+        for worker_id in self._local_workers:
+            (self._queue / 'workers' / f'{worker_id}{STOP_SUFFIX}').touch()
+        for process in self._local_workers.values():
+            process.join(timeout=self._heartbeat_timeout)
+            if process.is_alive():
+                process.terminate()
+        self._local_workers = {}
+
+    def _workers(self):
+        """
+        Resources of the live workers (read at most once per poll of the workers).
+
+        The modification times of the worker files are only compared with each
+        other, never with the clock of the scheduler: a worker is live from the
+        first change of its heartbeat seen by the scheduler, until its heartbeat
+        has not changed for ``heartbeat_timeout`` seconds.
+
+        """
+        now = time.monotonic()
+        checked, workers = self._workers_checked
+        if now - checked < POLL_SECS:
+            return workers
+
+        workers = {}
+        for info in (self._queue / 'workers').glob('*.json'):
+            worker_id = info.stem
+            if worker_id in self._local_workers and not self._local_workers[worker_id].is_alive():
+                continue
+            try:
+                mtime = info.stat().st_mtime
+                last_mtime, changed = self._heartbeats.get(worker_id, (None, None))
+                if mtime != last_mtime:
+                    # A file found unchanged may be left by a dead worker
+                    changed = None if last_mtime is None else now
+                    self._heartbeats[worker_id] = (mtime, changed)
+                if changed is None or now - changed > self._heartbeat_timeout:
+                    continue
+                workers[worker_id] = json.loads(info.read_text())
+            except (OSError, ValueError):  # Stopping or starting
+                continue
+        self._workers_checked = (now, workers)
+        return workers
+
+    def _place(self, node, exclude=()):
+        """Choose the worker of a node, by data locality and load."""
+        workers = self._workers()
+        if not workers:
+            return None
+        # Other workers are preferred for failed nodes, if any
+        workers = {w: info for w, info in workers.items() if w not in exclude} or workers
+
+        load = {w: [0, 0.0] for w in workers}
+        for task in self._tasks.values():
+            if task['worker'] in load:
+                load[task['worker']][0] += task['n_procs']
+                load[task['worker']][1] += task['mem_gb']
+
+        def usage(worker):
+            n_procs, mem_gb = workers[worker]['n_procs'], workers[worker]['mem_gb']
+            return max(
+                (load[worker][0] + min(node.n_procs, n_procs)) / n_procs,
+                (load[worker][1] + min(node.mem_gb, mem_gb)) / mem_gb,
+            )
+
+        key = locality_key(node)
+        worker = self._affinity.get(key)
+        if worker not in workers or usage(worker) > 1.0:
+            worker = min(workers, key=usage)
+        if key is not None and self._affinity.get(key) not in workers:
+            self._affinity[key] = worker
+        return worker
+
+    def _enqueue(self, task):
+        node = task['node']
+        worker = self._place(node, exclude=task['failed_on'])
+        task['worker'] = worker
+        if worker is None:
+            if self._waiting_since is None:
+                self._waiting_since = time.time()
+                logger.warning('[SharedFS] No live workers in %s, waiting.', self._queue)
+            return
+        self._waiting_since = None
+
+        task['attempts'] += 1
+        task['job'] = f'{self._run_id}-{task["taskid"]:08d}-{task["attempts"]}.pklz'
+        job = {
+            'node': node,
+            'updatehash': task['updatehash'],
+            'taskid': task['taskid'],
+            'submitted': time.time(),
+            'trace_dir': tracing.trace_dir(),
+            'n_procs': task['n_procs'],
+            'mem_gb': task['mem_gb'],
+        }
+        inbox = self._queue / 'jobs' / worker
+        inbox.mkdir(parents=True, exist_ok=True)
+        _save_atomic(inbox / task['job'], job)
+        logger.debug(
+            '[SharedFS] Placed %s (taskid=%d, attempt %d) on %s.',
+            node.fullname,
+            task['taskid'],
+            task['attempts'],
+            worker,
+        )
+
+    def _withdraw(self, task):
+        """Remove a task from the queue of its worker."""
+        for path in ('jobs', 'running'):
+            (self._queue / path / task['worker'] / task['job']).unlink(missing_ok=True)
+        task['withdrawn'].append(task['job'])
+
+    def _discard_withdrawn(self, task):
+        """Remove the results of withdrawn jobs, reported before they were withdrawn."""
+        for job in task['withdrawn']:
+            (self._queue / 'results' / job).unlink(missing_ok=True)
+
+    def _withdraw_all(self):
+        for task in self._tasks.values():
+            if task['worker'] is not None:
+                self._withdraw(task)
+            self._discard_withdrawn(task)
+
+    def _retry(self, task, reason):
+        """Place a task again, unless retries are exhausted or the run stops on crashes."""
+        if str2bool(self._config['execution']['stop_on_first_crash']):
+            return False
+        if task['attempts'] > self._max_retries:
+            return False
+        logger.warning(
+            '[SharedFS] %s (taskid=%d) %s on %s, placing it again.',
+            task['node'].fullname,
+            task['taskid'],
+            reason,
+            task['worker'],
+        )
+        task['failed_on'].add(task['worker'])
+        self._enqueue(task)
+        return True
+
+    def _submit_job(self, node, updatehash=False):
+        self._taskid += 1
+
+        # Don't allow streaming outputs
+        if getattr(node.interface, 'terminal_output', '') == 'stream':
+            node.interface.terminal_output = 'allatonce'
+
+        task = {
+            'node': node,
+            'updatehash': updatehash,
+            'taskid': self._taskid,
+            'job': None,
+            'n_procs': node.n_procs,
+            'mem_gb': node.mem_gb,
+            'worker': None,
+            'attempts': 0,
+            'failed_on': set(),
+            'withdrawn': [],
+        }
+        self._tasks[self._taskid] = task
+        self._enqueue(task)
+        return self._taskid
+
+    def _get_result(self, taskid):
+        task = self._tasks[taskid]
+        self._discard_withdrawn(task)
+        if task['worker'] is None:
+            self._enqueue(task)
+            return None
+
+        # Only the result of the current attempt is collected
+        result_file = self._queue / 'results' / task['job']
+        if result_file.exists():
+            result = loadpkl(result_file)
+            result_file.unlink()
+            result['taskid'] = taskid
+            if result['traceback'] and self._retry(task, 'failed'):
+                return None
+            task['worker'] = None
+            return result
+
+        if task['worker'] not in self._workers():
+            self._withdraw(task)
+            if not self._retry(task, 'was lost'):
+                return {
+                    'result': None,
+                    'traceback': [f'Worker {task["worker"]} was lost running {task["node"]}.'],
+                    'taskid': taskid,
+                }
+        return None
+
+    def _clear_task(self, taskid):
+        self._tasks.pop(taskid, None)
+
+
+def main(argv=None):
+    """Start a worker of :class:`SharedFSPlugin`."""
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=f'{sys.executable} -m {__name__}',
+        description='Run the nodes placed on this worker in a shared-filesystem queue.',
+    )
+    parser.add_argument('queue_dir', type=Path, help='queue directory of the scheduler')
+    parser.add_argument('--worker-id', help='name of the worker (default: hostname and PID)')
+    parser.add_argument('--nprocs', type=int, help='processors available to the worker')
+    parser.add_argument('--mem-gb', type=float, help='memory available to the worker')
+    parser.add_argument('--poll', type=float, default=POLL_SECS, help='seconds between polls')
+    opts = parser.parse_args(argv)
+
+    run_worker(
+        opts.queue_dir,
+        worker_id=opts.worker_id,
+        n_procs=opts.nprocs,
+        mem_gb=opts.mem_gb,
+        poll_secs=opts.poll,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+A *MultiProc* plugin running nodes on a pool of pre-warmed workers.
+
+The stock *MultiProc* plugin starts its workers from a bare interpreter,
+so every worker pays for importing nipype, niworkflows, nibabel, etc.
+before it can run its first node.
+:class:`WarmMultiProcPlugin` instead:
+
+* preloads the heavy imports in the *forkserver* (see :func:`preload_forkserver`)
+  and in each worker's initializer, so no task pays for them;
+* replaces the pool when the resident memory of a worker, once it has run
+  a node, exceeds ``max_worker_rss_gb`` (e.g., because memory was not
+  returned to the system), as workers of *MultiProc* are never replaced;
+* measures the dispatch overhead of each node (the time between submission
+  and start in the worker, plus the time between completion and the result
+  reaching the scheduler), logs a summary and optionally writes it out
+  as a TSV file (``dispatch_log``).
+
+Both :class:`WarmMultiProcPlugin` and :class:`TracedMultiProcPlugin` record
+the execution of nodes as spans, and the execution graph, when tracing is
+enabled (see :mod:`fmriprep.engine.tracing`).
+
+"""
+
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+
+import numpy as np
+from nipype import logging
+from nipype.pipeline.plugins.multiproc import MultiProcPlugin
+from nipype.pipeline.plugins.multiproc import run_node as _run_node
+
+from ..utils import tracing
+
+logger = logging.getLogger('nipype.workflow')
+
+PRELOAD_MODULES = (
+    'numpy',
+    'scipy.ndimage',
+    'pandas',
+    'nibabel',
+    'nitransforms',
+    'nipype.pipeline.engine',
+    'nipype.interfaces.utility',
+    'niworkflows.interfaces.utility',
+    'fmriprep.config',
+)
+"""Modules imported by workers before they receive any task."""
+
+DEFAULT_MAX_RSS_GB = 4.0
+"""Resident memory (GB) of a worker, after running a node, above which the pool is replaced."""
+
+
+def preload_forkserver(modules=PRELOAD_MODULES):
+    """
+    Have the *forkserver* import ``modules``, so workers forked from it start warm.
+
+    This only has an effect if called before the forkserver process is started.
+    """
+    mp.set_forkserver_preload(list(modules))
+
+
+def _rss_gb():
+    """
+    Current resident memory of the calling process, in GB.
+
+    The peak resident memory is reported instead where it cannot be read
+    (i.e., without ``/proc``).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        import resource
+
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        return maxrss / (1024**3 if sys.platform == 'darwin' else 1024**2)
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024**3
+
+
+def _warm_initializer(cwd, modules):
+    """Set up the environment of the worker and import ``modules``."""
+    os.chdir(cwd)
+    os.environ['NIPYPE_NO_ET'] = '1'
+    for module in modules:
+        try:
+            import_module(module)
+        except ImportError:  # Preloading is best-effort
+            pass
+
+
+def run_node(node, updatehash, taskid, submitted=None, trace_dir=None):
+    """
+    Run a node as :func:`nipype.pipeline.plugins.multiproc.run_node` does, timing it.
+
+    If ``trace_dir`` is given, the execution of the node is recorded there, along with
+    the time it waited since it was ``submitted`` (seconds since the epoch).
+    """
+    started = time.time()
+    # Workers may have been started (e.g., by the forkserver) before tracing was enabled
+    if trace_dir != tracing.trace_dir():
+        if trace_dir:
+            tracing.enable(trace_dir)
+        else:
+            tracing.disable()
+
+    if tracing.enabled():
+        from .tracing import instrument_nipype
+
+        instrument_nipype()
+        if submitted is not None:
+            tracing.record(
+                'queue wait',
+                submitted * 1e6,
+                started * 1e6,
+                cat='scheduler',
+                args={'node': node.fullname, 'taskid': taskid},
+            )
+    result = _run_node(node, updatehash, taskid)
+    result.update(
+        started=started,
+        finished=time.time(),
+        pid=os.getpid(),
+        rss_gb=_rss_gb(),
+    )
+    return result
+
+
+class WarmMultiProcPlugin(MultiProcPlugin):
+    """
+    Execute a workflow with *MultiProc*, on long-lived, pre-warmed workers.
+
+    In addition to the options of
+    :class:`~nipype.pipeline.plugins.multiproc.MultiProcPlugin`, ``plugin_args``
+    accepts:
+
+    - preload: modules imported by workers at start-up
+      (default: :data:`PRELOAD_MODULES`)
+    - max_worker_rss_gb: resident memory of a worker (GB), after running a node,
+      above which the pool is replaced once running tasks finish
+      (default: :data:`DEFAULT_MAX_RSS_GB`)
+    - dispatch_log: path of a TSV file where per-node dispatch timings are written
+
+    The multiprocessing context defaults to *forkserver*.
+
+    """
+
+    def __init__(self, plugin_args=None):
+        plugin_args = dict(plugin_args or {})
+        plugin_args.setdefault('mp_context', 'forkserver')
+        super().__init__(plugin_args=plugin_args)
+
+        self._preload = tuple(self.plugin_args.get('preload', PRELOAD_MODULES))
+        self._max_rss_gb = float(self.plugin_args.get('max_worker_rss_gb', DEFAULT_MAX_RSS_GB))
+        self._submitted = {}  # Name, submission time and pool of each task
+        self._dispatch = []
+        self._recycle = False
+        self._recycled = 0
+
+        # Replace the executor set up by MultiProc (workers are started on demand)
+        self.pool.shutdown()
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.processors,
+            initializer=_warm_initializer,
+            initargs=(self._cwd, self._preload),
+            mp_context=mp.get_context(self.plugin_args['mp_context']),
+        )
+
+    def _async_callback(self, args):
+        received = time.time()
+        result = args.result()
+        taskid = result['taskid']
+        name, submitted, pool = self._submitted.pop(taskid)
+        self._dispatch.append(
+            (
+                name,
+                taskid,
+                result['started'] - submitted,
+                received - result['finished'],
+                result['finished'] - result['started'],
+                result['pid'],
+                result['rss_gb'],
+            )
+        )
+        # Tasks of a pool already replaced finish on workers that then exit
+        if result['rss_gb'] > self._max_rss_gb and pool == self._recycled:
+            self._recycle = True
+        self._taskresult[taskid] = result
+
+    def _submit_job(self, node, updatehash=False):
+        self._taskid += 1
+
+        # Don't allow streaming outputs
+        if getattr(node.interface, 'terminal_output', '') == 'stream':
+            node.interface.terminal_output = 'allatonce'
+
+        submitted = time.time()
+        self._submitted[self._taskid] = (node.fullname, submitted, self._recycled)
+        result_future = self.pool.submit(
+            run_node, node, updatehash, self._taskid, submitted, tracing.trace_dir()
+        )
+        result_future.add_done_callback(self._async_callback)
+        self._task_obj[self._taskid] = result_future
+
+        logger.debug('[WarmMultiProc] Submitted task %s (taskid=%d).', node.fullname, self._taskid)
+        return self._taskid
+
+    def _send_procs_to_workers(self, updatehash=False, graph=None):
+        if self._recycle:
+            # Running tasks complete on the old pool, whose workers then exit
+            logger.debug(
+                '[WarmMultiProc] A worker exceeded %0.2fGB of resident memory, '
+                'replacing the pool.',
+                self._max_rss_gb,
+            )
+            self._recycle = False
+            self._recycled += 1
+            self.pool.shutdown(wait=False)
+            self.pool = self._new_pool()
+        return super()._send_procs_to_workers(updatehash=updatehash, graph=graph)
+
+    def _prerun_check(self, graph):
+        from .tracing import record_graph
+
+        super()._prerun_check(graph)
+        record_graph(graph)
+
+    def _postrun_check(self):
+        super()._postrun_check()
+        self.report_dispatch()
+
+    def report_dispatch(self):
+        """Log a summary of the dispatch overhead and write out per-node timings."""
+        if not self._dispatch:
+            return
+
+        overhead = np.array([sub + ret for _, _, sub, ret, *_ in self._dispatch])
+        logger.info(
+            '[WarmMultiProc] Dispatched %d tasks: overhead per node median=%0.3fs, '
+            'max=%0.3fs, total=%0.1fs. Worker pool replaced %d time(s).',
+            len(overhead),
+            np.median(overhead),
+            overhead.max(),
+            overhead.sum(),
+            self._recycled,
+        )
+
+        dispatch_log = self.plugin_args.get('dispatch_log')
+        if dispatch_log:
+            os.makedirs(os.path.dirname(os.path.abspath(dispatch_log)), exist_ok=True)
+            with open(dispatch_log, 'w') as f:
+                f.write('node\ttaskid\tsubmit_s\treturn_s\trun_s\tworker_pid\tworker_rss_gb\n')
+                f.writelines(
+                    f'{name}\t{taskid}\t{sub:.6f}\t{ret:.6f}\t{run:.6f}\t{pid}\t{rss:.3f}\n'
+                    for name, taskid, sub, ret, run, pid, rss in self._dispatch
+                )
+
+
+class TracedMultiProcPlugin(MultiProcPlugin):
+    """
+    Execute a workflow with *MultiProc*, recording the execution of nodes as spans.
+
+    Nodes are run by :func:`run_node`, which records how long each node waited
+    in the queue, and how its execution went (see :mod:`fmriprep.engine.tracing`),
+    while tracing is enabled.
+    The hash checks of the scheduler, the nodes it finds cached (and
+    therefore never submits), and the execution graph are recorded as well.
+
+    """
+
+    def __init__(self, plugin_args=None):
+        from .tracing import instrument_nipype
+
+        instrument_nipype()
+        super().__init__(plugin_args=plugin_args)
+
+    def _prerun_check(self, graph):
+        from .tracing import record_graph
+
+        super()._prerun_check(graph)
+        record_graph(graph)
+
+    def _local_hash_check(self, jobid, graph):
+        from .tracing import node_args
+
+        node = self.procs[jobid]
+        start = tracing.now()
+        cached = super()._local_hash_check(jobid, graph)
+        if cached:
+            tracing.record(
+                node.name,
+                start,
+                tracing.now(),
+                cat='node',
+                args=node_args(node) | {'cached': True},
+            )
+        return cached
+
+    def _submit_job(self, node, updatehash=False):
+        self._taskid += 1
+
+        # Don't allow streaming outputs
+        if getattr(node.interface, 'terminal_output', '') == 'stream':
+            node.interface.terminal_output = 'allatonce'
+
+        result_future = self.pool.submit(
+            run_node, node, updatehash, self._taskid, time.time(), tracing.trace_dir()
+        )
+        result_future.add_done_callback(self._async_callback)
+        self._task_obj[self._taskid] = result_future
+
+        logger.debug(
+            '[TracedMultiProc] Submitted task %s (taskid=%d).', node.fullname, self._taskid
+        )
+        return self._taskid
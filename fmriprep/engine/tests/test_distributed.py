@@ -0,0 +1,203 @@
+import json
+import os
+import time
+
+import pytest
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+from nipype.utils.filemanip import loadpkl
+
+from fmriprep.engine.distributed import POLL_SECS, SharedFSPlugin, _run_owned, _save_owned
+
+
+def _pid(value):
+    import os
+
+    return value, os.getpid()
+
+
+def _parent_pid(value):
+    import os
+
+    # Nodes run in a child of a process of the pool of their worker
+    return value, os.getppid()
+
+
+def _fail_once(marker):
+    from pathlib import Path
+
+    if not Path(marker).exists():
+        Path(marker).touch()
+        raise RuntimeError('First attempt fails')
+    return marker
+
+
+def _withdrawn_while_running(running_file, pid_file):
+    import os
+    import time
+    from pathlib import Path
+
+    Path(pid_file).write_text(str(os.getpid()))
+    Path(running_file).unlink()  # As the scheduler does with the jobs of lost workers
+    time.sleep(60)
+
+
+def _config(tmp_path, stop_on_first_crash=False):
+    return {
+        'execution': {
+            'poll_sleep_duration': 0.1,
+            'crashdump_dir': str(tmp_path / 'crash'),
+            'stop_on_first_crash': stop_on_first_crash,
+            'remove_unnecessary_outputs': False,
+        }
+    }
+
+
+def _heartbeat(plugin, info, mtime):
+    """Change the heartbeat of a worker between two polls of the scheduler."""
+    time.sleep(POLL_SECS + 0.1)
+    plugin._workers()
+    os.utime(info, (mtime, mtime))
+    time.sleep(POLL_SECS + 0.1)
+    return plugin._workers()
+
+
+def test_save_owned(tmp_path):
+    running = tmp_path / 'running'
+    running.mkdir()
+    (running / 'job.pklz').touch()
+
+    assert _save_owned(running / 'job.pklz', tmp_path / 'job.pklz', {'result': 1})
+    assert loadpkl(tmp_path / 'job.pklz') == {'result': 1}
+    assert not list(running.iterdir())
+
+    # Withdrawn by the scheduler: the result is not reported
+    assert not _save_owned(running / 'other.pklz', tmp_path / 'other.pklz', {'result': 2})
+    assert not (tmp_path / 'other.pklz').exists()
+
+
+def test_run_owned(tmp_path):
+    running_file = tmp_path / 'job.pklz'
+    running_file.touch()
+    node = pe.Node(niu.Function(function=_pid, output_names=['value', 'pid']), name='owned')
+    node.base_dir = str(tmp_path / 'work')
+    node.inputs.value = 1
+
+    result = _run_owned(running_file, 0.1, node, False, 1)
+    assert result['traceback'] is None
+    # The node ran in a child of the calling process
+    assert result['result'].outputs.value == 1
+    assert result['result'].outputs.pid != os.getpid()
+
+    pid_file = tmp_path / 'pid'
+    node = pe.Node(niu.Function(function=_withdrawn_while_running), name='withdrawn')
+    node.base_dir = str(tmp_path / 'work')
+    node.inputs.running_file = str(running_file)
+    node.inputs.pid_file = str(pid_file)
+
+    start = time.monotonic()
+    result = _run_owned(running_file, 0.1, node, False, 2)
+    assert time.monotonic() - start < 30
+    assert result['result'] is None
+    assert 'withdrawn' in result['traceback'][0]
+    # The node is not left running
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def test_shared_fs_lost_worker(tmp_path):
+    queue = tmp_path / 'queue'
+    plugin = SharedFSPlugin(plugin_args={'queue_dir': str(queue), 'heartbeat_timeout': 1.0})
+    plugin._config = _config(tmp_path)
+    for path in ('jobs', 'running', 'results', 'workers'):
+        (queue / path).mkdir(parents=True)
+
+    # The file server's clock is an hour behind: only changes of the heartbeat matter
+    skewed = time.time() - 3600
+    stalled = queue / 'workers' / 'stalled.json'
+    stalled.write_text(json.dumps({'n_procs': 1, 'mem_gb': 1.0}))
+    os.utime(stalled, (skewed, skewed))
+    assert not plugin._workers()  # Possibly left by a dead worker
+    assert set(_heartbeat(plugin, stalled, skewed + 1)) == {'stalled'}
+
+    node = pe.Node(niu.Function(function=_pid, output_names=['value', 'pid']), name='node')
+    taskid = plugin._submit_job(node)
+    first = plugin._tasks[taskid]['job']
+    assert first.endswith('-1.pklz')
+    (queue / 'running' / 'stalled').mkdir()
+    os.rename(queue / 'jobs' / 'stalled' / first, queue / 'running' / 'stalled' / first)
+
+    # The heartbeat stops: the job is withdrawn, and waits for another worker
+    time.sleep(1.2)
+    assert plugin._get_result(taskid) is None
+    assert not (queue / 'running' / 'stalled' / first).exists()
+    assert plugin._tasks[taskid]['worker'] is None
+
+    # A result reported by the stalled worker before the withdrawal is discarded
+    (queue / 'results' / first).write_bytes(b'')
+    assert plugin._get_result(taskid) is None
+    assert not (queue / 'results' / first).exists()
+
+    fresh = queue / 'workers' / 'fresh.json'
+    fresh.write_text(json.dumps({'n_procs': 1, 'mem_gb': 1.0}))
+    os.utime(fresh, (skewed, skewed))
+    assert set(_heartbeat(plugin, fresh, skewed + 1)) == {'fresh'}
+    assert plugin._get_result(taskid) is None
+    second = plugin._tasks[taskid]['job']
+    assert second.endswith('-2.pklz')
+    assert (queue / 'jobs' / 'fresh' / second).exists()
+
+
+def test_shared_fs_locality(tmp_path):
+    wf = pe.Workflow(name='fmriprep_wf', base_dir=str(tmp_path / 'work'))
+    for subject in ('01', '02'):
+        subject_wf = pe.Workflow(name=f'sub_{subject}_wf')
+        first = pe.Node(
+            niu.Function(function=_parent_pid, output_names=['value', 'pid']), name='first'
+        )
+        first.inputs.value = subject
+        second = pe.Node(
+            niu.Function(function=_parent_pid, output_names=['value', 'pid']), name='second'
+        )
+        subject_wf.connect([(first, second, [('value', 'value')])])  # fmt:skip
+        wf.add_nodes([subject_wf])
+    wf.config.update(_config(tmp_path))
+
+    plugin = SharedFSPlugin(
+        plugin_args={'queue_dir': str(tmp_path / 'queue'), 'n_local_workers': 2, 'n_procs': 1}
+    )
+    graph = wf.run(plugin=plugin)
+
+    pids = {}
+    for node in graph.nodes():
+        pids.setdefault(node.result.outputs.value, set()).add(node.result.outputs.pid)
+    # The nodes of each subject ran on their own worker
+    assert sorted(pids) == ['01', '02']
+    assert all(len(subject_pids) == 1 for subject_pids in pids.values())
+    assert pids['01'] != pids['02']
+
+    # Local workers are stopped, and the queue is left empty
+    assert not plugin._local_workers
+    assert not list((tmp_path / 'queue' / 'workers').iterdir())
+    assert not list((tmp_path / 'queue' / 'results').iterdir())
+
+
+@pytest.mark.parametrize('stop_on_first_crash', [False, True])
+def test_shared_fs_retry(tmp_path, stop_on_first_crash):
+    wf = pe.Workflow(name='retry_wf', base_dir=str(tmp_path / 'work'))
+    node = pe.Node(niu.Function(function=_fail_once), name='fail_once')
+    node.inputs.marker = str(tmp_path / 'marker')
+    wf.add_nodes([node])
+    wf.config.update(_config(tmp_path, stop_on_first_crash))
+
+    plugin = SharedFSPlugin(
+        plugin_args={'queue_dir': str(tmp_path / 'queue'), 'n_local_workers': 1}
+    )
+    if stop_on_first_crash:
+        # Failed nodes are not placed again
+        with pytest.raises(RuntimeError, match='First attempt fails'):
+            wf.run(plugin=plugin)
+    else:
+        graph = wf.run(plugin=plugin)
+        assert next(iter(graph.nodes())).result.outputs.out == node.inputs.marker
+    assert not plugin._local_workers
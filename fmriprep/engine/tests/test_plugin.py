@@ -0,0 +1,104 @@
+import numpy as np
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+
+from fmriprep.engine.plugin import TracedMultiProcPlugin, WarmMultiProcPlugin, _rss_gb
+from fmriprep.utils import tracing
+
+
+def _add(a, b):
+    return a + b
+
+
+def test_warm_multiproc(tmp_path):
+    wf = pe.Workflow(name='warm', base_dir=str(tmp_path))
+    inputnode = pe.Node(niu.IdentityInterface(fields=['a']), name='inputnode')
+    inputnode.iterables = [('a', list(range(4)))]
+    add = pe.Node(niu.Function(function=_add, output_names=['out']), name='add')
+    add.inputs.b = 1
+    double = pe.Node(niu.Function(function=_add, output_names=['out']), name='double')
+    wf.connect([
+        (inputnode, add, [('a', 'a')]),
+        (add, double, [('out', 'a'), ('out', 'b')]),
+    ])  # fmt:skip
+
+    dispatch_log = tmp_path / 'logs' / 'dispatch.tsv'
+    plugin = WarmMultiProcPlugin(
+        plugin_args={
+            'n_procs': 2,
+            'preload': ['nibabel'],
+            # Any worker exceeds this, forcing the pool to be replaced
+            'max_worker_rss_gb': 1e-6,
+            'dispatch_log': str(dispatch_log),
+        }
+    )
+    graph = wf.run(plugin=plugin)
+
+    results = sorted(node.result.outputs.out for node in graph.nodes() if node.name == 'double')
+    assert results == [2, 4, 6, 8]
+    assert plugin._recycled > 0
+
+    lines = dispatch_log.read_text().splitlines()
+    assert lines[0].split('\t')[:4] == ['node', 'taskid', 'submit_s', 'return_s']
+    assert len(lines) == 9
+
+
+def test_rss_gb():
+    baseline = _rss_gb()
+    data = np.ones(2**25)  # 256 MiB
+    assert _rss_gb() > baseline + 0.2
+    # Memory returned to the system no longer counts, unlike the peak
+    del data
+    assert _rss_gb() < baseline + 0.1
+
+
+class _Done:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+def test_warm_multiproc_recycle():
+    plugin = WarmMultiProcPlugin(plugin_args={'n_procs': 1, 'max_worker_rss_gb': 1.0})
+    result = {'taskid': 1, 'started': 1.0, 'finished': 2.0, 'pid': 1, 'rss_gb': 2.0}
+
+    plugin._submitted[1] = ('node', 0.0, plugin._recycled)
+    plugin._async_callback(_Done(result))
+    assert plugin._recycle
+
+    # Tasks still finishing on the replaced pool do not replace the new one
+    plugin._recycle, plugin._recycled = False, 1
+    plugin._submitted[1] = ('node', 0.0, 0)
+    plugin._async_callback(_Done(result))
+    assert not plugin._recycle
+    plugin.pool.shutdown()
+
+
+def test_traced_multiproc(tmp_path):
+    wf = pe.Workflow(name='traced', base_dir=str(tmp_path / 'work'))
+    add = pe.Node(niu.Function(function=_add, output_names=['out']), name='add')
+    add.inputs.a, add.inputs.b = 1, 2
+    double = pe.Node(niu.Function(function=_add, output_names=['out']), name='double')
+    wf.connect([(add, double, [('out', 'a'), ('out', 'b')])])  # fmt:skip
+
+    tracing.enable(tmp_path / 'trace')
+    try:
+        wf.run(plugin=TracedMultiProcPlugin(plugin_args={'n_procs': 2}))
+        # Rerunning finds every node cached
+        wf.run(plugin=TracedMultiProcPlugin(plugin_args={'n_procs': 2}))
+    finally:
+        tracing.disable()
+
+    spans = tracing.load_spans(
+        tracing.export_chrome_trace(tmp_path / 'trace', tmp_path / 'trace.json')
+    )
+    names = {ev['name'] for ev in spans}
+    assert {'setup', 'hash check', 'interface', 'result pickling', 'queue wait'} <= names
+
+    nodes = [ev for ev in spans if ev['name'] == 'double' and ev['cat'] == 'node']
+    assert [ev['args']['cached'] for ev in nodes] == [False, True]
+    assert nodes[0]['args']['node'] == 'traced.double'
+    assert nodes[0]['args']['interface'] == 'nipype.interfaces.utility.wrappers.Function'
+    assert 'cpu_s' in nodes[0]['args']
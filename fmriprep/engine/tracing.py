@@ -0,0 +1,200 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Tracing of the execution of nipype nodes (see :mod:`fmriprep.utils.tracing`).
+
+Once :func:`instrument_nipype` has been called in a process, every node it runs
+is recorded as a span of category ``node``, named after the node, with the
+following nested spans:
+
+``setup``
+    From the start of the node until its interface runs (or until the node
+    is found cached), including the ``hash check``, the preparation of the
+    working directory and the pickling of the node and its inputs.
+``hash check``
+    Checking the hash of the inputs against the working directory.
+``interface``
+    Running the interface, within which *fMRIPrep*'s interfaces record
+    spans of their own.
+``result pickling``
+    Storing the result file of the node.
+
+The node span holds the full name of the node, its interface, whether it was
+found ``cached``, the CPU time (``cpu_s``, including child processes) and the
+bytes read and written by the process and its children (Linux only).
+The execution plugins of :mod:`fmriprep.engine.plugin` also record the time
+each node waits between its submission and the start of its execution
+(``queue wait``, category ``scheduler``), and
+:class:`~fmriprep.engine.plugin.TracedMultiProcPlugin` records the nodes it
+finds cached before submitting them, as well as the graph they execute
+(see :func:`record_graph`), which allows the analysis of the schedule
+(see :mod:`fmriprep.reports.scheduling`).
+
+"""
+
+import json
+import os
+import threading
+from functools import wraps
+from pathlib import Path
+
+from ..utils import tracing
+
+_local = threading.local()
+
+
+def _stack():
+    if not hasattr(_local, 'nodes'):
+        _local.nodes = []
+    return _local.nodes
+
+
+def _counters():
+    """CPU time and I/O counters of the process and its (finished) child processes."""
+    import resource
+
+    times = os.times()
+    counters = {'cpu_s': times.user + times.system + times.children_user + times.children_system}
+    try:
+        io = dict(line.split(': ') for line in Path('/proc/self/io').read_text().splitlines())
+    except OSError:
+        return counters
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    counters.update(
+        read_bytes=int(io['read_bytes']) + 512 * children.ru_inblock,
+        write_bytes=int(io['write_bytes']) + 512 * children.ru_oublock,
+        rchar=int(io['rchar']),
+        wchar=int(io['wchar']),
+    )
+    return counters
+
+
+def node_args(node):
+    """Arguments identifying a node in its spans."""
+    interface = node.interface
+    return {
+        'node': node.fullname,
+        'interface': f'{interface.__module__}.{interface.__class__.__name__}',
+    }
+
+
+def _traced_run(run):
+    @wraps(run)
+    def wrapper(self, *args, **kwargs):
+        if not tracing.enabled():
+            return run(self, *args, **kwargs)
+
+        span_args = node_args(self)
+        frame = {'start': tracing.now(), 'interface': None}
+        before = _counters()
+        stack = _stack()
+        if stack and stack[-1]['interface'] is None:
+            # The subnodes of a MapNode run in place of its interface
+            stack[-1]['interface'] = frame['start']
+        stack.append(frame)
+        try:
+            return run(self, *args, **kwargs)
+        except Exception:
+            span_args['error'] = True
+            raise
+        finally:
+            _stack().pop()
+            end = tracing.now()
+            tracing.record('setup', frame['start'], frame['interface'] or end, cat='node')
+            after = _counters()
+            span_args['cached'] = frame['interface'] is None
+            span_args.update(
+                {key: round(after[key] - before[key], 3) for key in after.keys() & before.keys()}
+            )
+            tracing.record(self.name, frame['start'], end, cat='node', args=span_args)
+
+    wrapper._fmriprep_traced = True
+    return wrapper
+
+
+def _traced_interface(run):
+    @wraps(run)
+    def wrapper(self, *args, **kwargs):
+        if not tracing.enabled():
+            return run(self, *args, **kwargs)
+        stack = _stack()
+        if stack and stack[-1]['interface'] is None:
+            stack[-1]['interface'] = tracing.now()
+        with tracing.span('interface', cat='node', interface=self.__class__.__name__):
+            return run(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _spanned(func, name):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracing.span(name, cat='node'):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument_nipype():
+    """
+    Record the execution of nipype nodes within this process as spans.
+
+    Spans are only recorded while tracing is enabled (see
+    :func:`fmriprep.utils.tracing.enable`).
+    Calling this function more than once has no further effect.
+    """
+    from nipype.interfaces.base import core
+    from nipype.pipeline.engine import nodes
+
+    if getattr(nodes.Node.run, '_fmriprep_traced', False):
+        return
+
+    nodes.Node.run = _traced_run(nodes.Node.run)
+    nodes.Node.is_cached = _spanned(nodes.Node.is_cached, 'hash check')
+    nodes._save_resultfile = _spanned(nodes._save_resultfile, 'result pickling')
+    core.BaseInterface.run = _traced_interface(core.BaseInterface.run)
+
+
+def record_graph(graph):
+    """
+    Store the nodes (by full name) and edges of an execution graph in the trace directory.
+
+    Does nothing unless tracing is enabled.
+    """
+    if not tracing.enabled():
+        return None
+
+    out_file = Path(os.environ[tracing.TRACE_ENV]) / f'graph-{tracing.now()}.json'
+    out_file.write_text(
+        json.dumps(
+            {
+                'nodes': {
+                    node.fullname: {'n_procs': node.n_procs, 'mem_gb': node.mem_gb}
+                    for node in graph.nodes()
+                },
+                'edges': [[u.fullname, v.fullname] for u, v in graph.edges()],
+            }
+        )
+    )
+    return out_file
@@ -50,10 +50,12 @@ from nipype.interfaces.base import (
 )
 from nipype.utils.filemanip import fname_presuffix
 from nireports.reportlets.modality.func import fMRIPlot
-from niworkflows.utils.timeseries import _cifti_timeseries, _nifti_timeseries
 from scipy import ndimage as ndi
 from scipy.spatial import transform as sst
 
+from ..utils import tracing
+from ..utils.timeseries import carpet_timeseries
+
 LOGGER = logging.getLogger('nipype.interface')
 
 
@@ -63,7 +65,10 @@ class _aCompCorMasksInputSpec(BaseInterfaceInputSpec):
         False, usedefault=True, desc="Whether the input volume fractions come from FS' aseg."
     )
     bold_zooms = traits.Tuple(
-        traits.Float, traits.Float, traits.Float, mandatory=True, desc='BOLD series zooms'
+        traits.Float,
+        traits.Float,
+        traits.Float,
+        desc='BOLD series zooms (only used to refine segmentations from aseg)',
     )
 
 
@@ -85,7 +90,7 @@ class aCompCorMasks(SimpleInterface):
         self._results['out_masks'] = acompcor_masks(
             in_files=self.inputs.in_vfs,
             is_aseg=self.inputs.is_aseg,
-            zooms=self.inputs.bold_zooms,
+            zooms=self.inputs.bold_zooms if isdefined(self.inputs.bold_zooms) else None,
         )
         return runtime
 
@@ -391,6 +396,7 @@ class GatherConfounds(SimpleInterface):
         return runtime
 
 
+@tracing.traced()
 def _gather_confounds(
     signals=None,
     dvars=None,
@@ -521,33 +527,21 @@ class FMRISummary(SimpleInterface):
 
         has_cifti = isdefined(self.inputs.in_cifti)
 
-        # Read input object and create timeseries + segments object
+        # Read only the rows that will be drawn on the carpet
         seg_file = self.inputs.in_segm if isdefined(self.inputs.in_segm) else None
-        dataset, segments = _nifti_timeseries(
-            nb.load(self.inputs.in_nifti),
-            nb.load(seg_file),
+        dataset, segments, vminmax = carpet_timeseries(
+            self.inputs.in_nifti,
+            in_segm=seg_file,
+            in_cifti=self.inputs.in_cifti if has_cifti else None,
             remap_rois=False,
             labels=(
                 ('WM+CSF', 'Edge')
                 if has_cifti
                 else ('Ctx GM', 'dGM', 'sWM+sCSF', 'dWM+dCSF', 'Cb', 'Edge')
             ),
+            drop_trs=self.inputs.drop_trs,
         )
 
-        # Process CIFTI
-        if has_cifti:
-            cifti_data, cifti_segments = _cifti_timeseries(nb.load(self.inputs.in_cifti))
-
-            if seg_file is not None:
-                # Append WM+CSF and Edge masks
-                cifti_length = cifti_data.shape[0]
-                dataset = np.vstack((cifti_data, dataset))
-                segments = {k: np.array(v) + cifti_length for k, v in segments.items()}
-                cifti_segments.update(segments)
-                segments = cifti_segments
-            else:
-                dataset, segments = cifti_data, cifti_segments
-
         dataframe = pd.read_csv(
             self.inputs.confounds_file,
             sep='\t',
@@ -580,14 +574,20 @@ class FMRISummary(SimpleInterface):
 
         data = data.rename(columns=names)
 
-        fig = fMRIPlot(
-            dataset,
-            segments=segments,
-            tr=self.inputs.tr,
-            confounds=data,
-            units=units,
-            nskip=self.inputs.drop_trs,
-            paired_carpet=has_cifti,
-        ).plot()
-        fig.savefig(self._results['out_file'], bbox_inches='tight')
+        with tracing.span('fMRIPlot', cat='reports'):
+            fig = fMRIPlot(
+                dataset,
+                segments=segments,
+                tr=self.inputs.tr,
+                confounds=data,
+                units=units,
+                nskip=self.inputs.drop_trs,
+                paired_carpet=has_cifti,
+            ).plot()
+            # The plot only sees the decimated rows, set the color limits of all of them
+            if vminmax is not None:
+                for ax in fig.axes:
+                    for image in ax.get_images():
+                        image.set_clim(*vminmax)
+            fig.savefig(self._results['out_file'], bbox_inches='tight')
         return runtime
@@ -0,0 +1,49 @@
+"""Interfaces to the cache of fit-stage outputs (see :mod:`fmriprep.utils.fitcache`)."""
+
+from nipype.interfaces.base import (
+    Directory,
+    File,
+    SimpleInterface,
+    TraitedSpec,
+    isdefined,
+    traits,
+)
+
+
+class StoreFitCacheInputSpec(TraitedSpec):
+    cache_dir = Directory(mandatory=True, desc='Root of the fit cache')
+    signature = traits.Dict(
+        mandatory=True, desc='Key of the entry and its inputs (see fit_signature)'
+    )
+    hmc_boldref = File(exists=True, mandatory=True, desc='Head-motion correction reference')
+    motion_xfm = File(exists=True, mandatory=True, desc='Head-motion correction transforms')
+    coreg_boldref = File(exists=True, mandatory=True, desc='Coregistration reference')
+    bold_mask = File(
+        exists=True, mandatory=True, desc='Brain mask of the coregistration reference'
+    )
+    boldref2anat_xfm = File(exists=True, mandatory=True, desc='BOLD-to-anatomical transform')
+    boldref2fmap_xfm = File(exists=True, desc='BOLD-to-fieldmap transform')
+
+
+class StoreFitCacheOutputSpec(TraitedSpec):
+    out_dir = Directory(desc='Cache entry')
+
+
+class StoreFitCache(SimpleInterface):
+    """Store the outputs of the fit stage of a BOLD series in the fit cache"""
+
+    input_spec = StoreFitCacheInputSpec
+    output_spec = StoreFitCacheOutputSpec
+
+    def _run_interface(self, runtime):
+        from fmriprep.utils.fitcache import FIT_OUTPUTS, store_fit_cache
+
+        outputs = {
+            name: getattr(self.inputs, name)
+            for name in FIT_OUTPUTS
+            if isdefined(getattr(self.inputs, name))
+        }
+        self._results['out_dir'] = str(
+            store_fit_cache(self.inputs.cache_dir, self.inputs.signature, outputs)
+        )
+        return runtime
@@ -82,3 +82,40 @@ class Label2Mask(SimpleInterface):
 
         self._results['out_file'] = out_file
         return runtime
+
+
+class BinaryDilationInputSpec(TraitedSpec):
+    in_mask = File(exists=True, mandatory=True, desc='Input mask')
+    radius = traits.Int(2, usedefault=True, desc='Radius (in voxels) of the ball to dilate with')
+
+
+class BinaryDilationOutputSpec(TraitedSpec):
+    out_mask = File(desc='Dilated mask')
+
+
+class BinaryDilation(SimpleInterface):
+    """Dilate a binary mask with a ball
+
+    Produces the same masks as :class:`niworkflows.interfaces.morphology.BinaryDilation`,
+    using :func:`fmriprep.utils.morphology.binary_dilation`.
+    """
+
+    input_spec = BinaryDilationInputSpec
+    output_spec = BinaryDilationOutputSpec
+
+    def _run_interface(self, runtime):
+        import nibabel as nb
+
+        from fmriprep.utils.morphology import binary_dilation
+
+        img = nb.load(self.inputs.in_mask)
+        dilated = binary_dilation(np.asanyarray(img.dataobj) > 0, self.inputs.radius)
+
+        out_img = img.__class__(dilated.astype(np.uint8), img.affine, img.header)
+        out_img.set_data_dtype(np.uint8)
+
+        out_file = os.path.join(runtime.cwd, 'dilated_mask.nii.gz')
+        out_img.to_filename(out_file)
+
+        self._results['out_mask'] = out_file
+        return runtime
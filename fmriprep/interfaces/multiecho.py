@@ -29,12 +29,17 @@ For using multi-echo EPI data.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+import nibabel as nb
+import numpy as np
+from nibabel.openers import ImageOpener
 from nipype import logging
 from nipype.interfaces.base import (
     CommandLine,
     CommandLineInputSpec,
     File,
+    SimpleInterface,
     TraitedSpec,
     traits,
 )
@@ -117,3 +122,399 @@ sub-01_run-01_echo-3_bold.nii.gz -e 13.0 27.0 43.0 --fittype curvefit'
         outputs['s0_map'] = os.path.join(out_dir, 'S0map.nii.gz')
         outputs['optimal_comb'] = os.path.join(out_dir, 'desc-optcom_bold.nii.gz')
         return outputs
+
+
+class T2SFitInputSpec(TraitedSpec):
+    in_files = traits.List(
+        File(exists=True), mandatory=True, minlen=3, desc='multi-echo BOLD EPIs'
+    )
+    echo_times = traits.List(traits.Float, mandatory=True, minlen=3, desc='echo times (s)')
+    mask_file = File(exists=True, desc='mask file')
+    fittype = traits.Enum(
+        'curvefit',
+        'loglin',
+        usedefault=True,
+        desc=(
+            'Desired fitting method: '
+            '"loglin" means that a linear model is fit to the log of the data. '
+            '"curvefit" means that a more computationally demanding '
+            'monoexponential model is fit to the raw data.'
+        ),
+    )
+    n_exclude = traits.Int(
+        0,
+        usedefault=True,
+        desc='Number of volumes from the beginning of the run to exclude from T2*/S0 estimation.',
+    )
+    num_threads = traits.Int(1, usedefault=True, desc='Number of threads for nonlinear fitting')
+    chunk_gb = traits.Float(
+        0.25,
+        usedefault=True,
+        desc='Upper bound (in GB) of each block of data read from the echoes',
+    )
+
+
+class T2SFit(SimpleInterface):
+    """
+    Estimate T2* and S0 maps and optimally combine multi-echo EPI, in-process.
+
+    Reimplements the relevant parts of tedana's T2* workflow
+    (adaptive "dropout" mask, log-linear or monoexponential fit, map
+    clean-up and T2*-weighted combination) without loading whole series
+    into memory: echoes are read in blocks of volumes no larger than
+    ``chunk_gb``, and the optimal combination is written as it is computed.
+    When fitting with ``curvefit``, the masked time series are cached in a
+    memory-mapped array so voxel-wise fits can be distributed over threads.
+
+    Outputs use the same filenames as :class:`T2SMap`.
+
+    """
+
+    input_spec = T2SFitInputSpec
+    output_spec = T2SMapOutputSpec
+
+    def _run_interface(self, runtime):
+        echoes = [nb.load(fname, keep_file_open=True) for fname in self.inputs.in_files]
+        echo_times = np.array(self.inputs.echo_times) * 1000  # Fit in ms, as tedana does
+        if len(echoes) != len(echo_times):
+            raise ValueError(
+                f'Number of echoes ({len(echoes)}) does not match '
+                f'number of echo times ({len(echo_times)}).'
+            )
+
+        ref = echoes[0]
+        shape = ref.shape[:3]
+        nvols = ref.shape[3] if ref.ndim > 3 else 1
+        if self.inputs.n_exclude >= nvols:
+            raise ValueError(
+                f'Cannot exclude {self.inputs.n_exclude} volumes from a series of {nvols}.'
+            )
+
+        if self.inputs.mask_file:
+            mask = np.asanyarray(nb.load(self.inputs.mask_file).dataobj) > 0
+        else:
+            mask = np.ones(shape, dtype=bool)
+        mask_idx = np.flatnonzero(mask)
+
+        step = volume_step(int(np.prod(shape)), len(echoes), int(self.inputs.chunk_gb * 1024**3))
+
+        cache = None
+        if self.inputs.fittype == 'curvefit':
+            cache = np.lib.format.open_memmap(
+                os.path.join(runtime.cwd, 'masked_echoes.npy'),
+                mode='w+',
+                dtype='float32',
+                shape=(len(mask_idx), len(echoes), nvols - self.inputs.n_exclude),
+            )
+
+        means, log_means, bad = echo_statistics(
+            echoes, mask_idx, step, first_vol=self.inputs.n_exclude, cache=cache
+        )
+        adaptive = adaptive_mask(means, bad)
+        in_adaptive = adaptive > 0
+
+        t2s = np.zeros(len(mask_idx))
+        s0 = np.zeros(len(mask_idx))
+        t2s[in_adaptive], s0[in_adaptive] = fit_loglinear(
+            log_means[in_adaptive], echo_times, adaptive[in_adaptive]
+        )
+        if cache is not None:
+            fit_monoexponential(
+                cache,
+                echo_times,
+                adaptive,
+                t2s,
+                s0,
+                nthreads=self.inputs.num_threads,
+                chunk_bytes=int(self.inputs.chunk_gb * 1024**3),
+            )
+            del cache
+            os.unlink(os.path.join(runtime.cwd, 'masked_echoes.npy'))
+
+        t2s[in_adaptive], s0[in_adaptive] = modify_t2s_s0(
+            t2s[in_adaptive], s0[in_adaptive], echo_times
+        )
+
+        out_dir = runtime.cwd
+        self._results['t2star_map'] = os.path.join(out_dir, 'T2starmap.nii.gz')
+        self._results['s0_map'] = os.path.join(out_dir, 'S0map.nii.gz')
+        self._results['optimal_comb'] = os.path.join(out_dir, 'desc-optcom_bold.nii.gz')
+
+        for fname, values in (
+            (self._results['t2star_map'], t2s / 1000),
+            (self._results['s0_map'], s0),
+        ):
+            out = np.zeros(mask.size, dtype='float32')
+            out[mask_idx] = values
+            nii = nb.Nifti1Image(out.reshape(shape), ref.affine, ref.header)
+            nii.set_data_dtype('float32')
+            nii.to_filename(fname)
+
+        write_optcom(
+            self._results['optimal_comb'],
+            echoes,
+            mask_idx,
+            optcom_weights(t2s, echo_times, adaptive),
+            step,
+        )
+        return runtime
+
+
+def volume_step(nvoxels: int, nechoes: int, chunk_bytes: int) -> int:
+    """
+    Calculate how many volumes of all echoes can be read within ``chunk_bytes``.
+
+    >>> volume_step(100, 4, 4000)
+    2
+    >>> volume_step(100, 4, 10)
+    1
+
+    """
+    return max(chunk_bytes // (nvoxels * nechoes * 4), 1)
+
+
+def _read_block(echoes, mask_idx, start, stop):
+    """Read volumes ``start:stop`` of every echo within the mask (N x E x T)."""
+    block = np.zeros((len(mask_idx), len(echoes), stop - start), dtype='float32')
+    for i, echo in enumerate(echoes):
+        data = np.asanyarray(echo.dataobj[..., start:stop], dtype='float32')
+        block[:, i] = data.reshape((-1, stop - start))[mask_idx]
+    return block
+
+
+def echo_statistics(echoes, mask_idx, step, first_vol=0, cache=None):
+    """
+    Calculate the per-echo statistics needed to build the adaptive mask and fit T2*.
+
+    Volumes are read in blocks of ``step``; volumes before ``first_vol`` are skipped.
+    If ``cache`` is given, the masked data are also copied into it.
+
+    Returns
+    -------
+    means : :obj:`numpy.ndarray`
+        Temporal mean of each echo (N x E).
+    log_means : :obj:`numpy.ndarray`
+        Temporal mean of ``log(|data| + 1)`` of each echo (N x E).
+    bad : :obj:`numpy.ndarray`
+        Whether any volume of each echo is NaN or non-positive (N x E).
+
+    """
+    nvols = echoes[0].shape[3] if echoes[0].ndim > 3 else 1
+    shape = (len(mask_idx), len(echoes))
+    sums = np.zeros(shape)
+    log_sums = np.zeros(shape)
+    bad = np.zeros(shape, dtype=bool)
+
+    for start in range(first_vol, nvols, step):
+        stop = min(start + step, nvols)
+        block = _read_block(echoes, mask_idx, start, stop)
+        if cache is not None:
+            cache[..., start - first_vol : stop - first_vol] = block
+        bad |= np.any(np.isnan(block) | (block <= 0), axis=-1)
+        sums += block.sum(axis=-1, dtype='float64')
+        log_sums += np.log(np.abs(block, dtype='float64') + 1).sum(axis=-1)
+
+    return sums / (nvols - first_vol), log_sums / (nvols - first_vol), bad
+
+
+def adaptive_mask(means, bad):
+    """
+    Count the echoes with good signal in each voxel (tedana's "dropout" method).
+
+    A voxel keeps its first echoes up to the first one with NaN or
+    non-positive samples, or whose mean falls below one third of the
+    mean signal of a reference voxel (at the 33rd percentile of the first echo).
+
+    """
+    nechoes = means.shape[1]
+    base = np.zeros(len(means), dtype=int)
+    for echo_idx in range(nechoes):
+        base[(base == echo_idx) & ~bad[:, echo_idx]] = echo_idx + 1
+
+    first_echo = means[means[:, 0] != 0, 0]
+    if not first_echo.size:
+        return np.zeros(len(means), dtype=int)
+
+    perc = np.percentile(first_echo, 33, method='higher')
+    thresholds = np.squeeze(means[means[:, 0] == perc].T) / 3
+    if thresholds.ndim > 1:
+        thresholds = thresholds[:, thresholds.sum(axis=0).argmax()]
+
+    dropout = np.zeros(len(means), dtype=int)
+    for echo_idx in range(nechoes):
+        dropout[np.abs(means[:, echo_idx]) > thresholds[echo_idx]] = echo_idx + 1
+
+    return np.minimum(base, dropout)
+
+
+def _fitted_echoes(adaptive):
+    """Voxels with a single good echo are fit with the first two."""
+    return np.maximum(adaptive, 2)
+
+
+def fit_loglinear(log_means, echo_times, adaptive):
+    """
+    Fit a monoexponential decay to the log of the data with linear least squares.
+
+    Because all volumes share the same design, the least-squares fit of the
+    stacked volumes equals the fit of their temporal mean, so a single
+    pseudo-inverse per number of echoes solves all voxels at once.
+
+    Returns
+    -------
+    t2s, s0 : :obj:`numpy.ndarray`
+        T2* (in the units of ``echo_times``) and S0 estimates.
+
+    """
+    nechoes = _fitted_echoes(adaptive)
+    t2s = np.zeros(len(log_means))
+    s0 = np.zeros(len(log_means))
+    for echo_num in np.unique(nechoes):
+        voxels = nechoes == echo_num
+        design = np.column_stack((np.ones(echo_num), -echo_times[:echo_num]))
+        betas = np.linalg.pinv(design) @ log_means[voxels, :echo_num].T
+        with np.errstate(divide='ignore'):
+            t2s[voxels] = 1.0 / betas[1]
+        s0[voxels] = np.exp(betas[0])
+    return t2s, s0
+
+
+def _monoexponential(tes, s0, t2star):
+    return s0 * np.exp(-tes / t2star)
+
+
+def _fit_voxels(data, echo_times, nechoes, t2s, s0):
+    """Fit the monoexponential model voxel by voxel, keeping initial values on failure."""
+    from scipy.optimize import curve_fit
+
+    nvols = data.shape[-1]
+    failures = 0
+    for i in range(len(data)):
+        echo_num = nechoes[i]
+        values = data[i, :echo_num].reshape(-1)
+        try:
+            popt, _ = curve_fit(
+                _monoexponential,
+                np.repeat(echo_times[:echo_num], nvols),
+                values,
+                p0=(s0[i], t2s[i]),
+                bounds=((np.min(values), 0), (np.inf, np.inf)),
+            )
+        except (RuntimeError, ValueError):
+            failures += 1
+            continue
+        s0[i], t2s[i] = popt
+    return t2s, s0, failures
+
+
+def fit_monoexponential(data, echo_times, adaptive, t2s, s0, nthreads=1, chunk_bytes=2**28):
+    """
+    Refine T2* and S0 by nonlinear fitting of a monoexponential decay.
+
+    ``t2s`` and ``s0`` hold the initial (log-linear) estimates and are
+    updated in place; estimates of voxels where the fit fails are retained.
+    Voxels are processed in chunks no larger than ``chunk_bytes``,
+    distributed across ``nthreads`` threads.
+
+    """
+    voxels = np.flatnonzero(adaptive > 0)
+    if not voxels.size:
+        return t2s, s0
+
+    nechoes = _fitted_echoes(adaptive)
+    voxel_bytes = data.shape[1] * data.shape[2] * data.dtype.itemsize
+    size = max(min(chunk_bytes // voxel_bytes, -(-len(voxels) // nthreads)), 1)
+
+    def _fit_chunk(chunk):
+        t2s[chunk], s0[chunk], failures = _fit_voxels(
+            np.asarray(data[chunk]), echo_times, nechoes[chunk], t2s[chunk], s0[chunk]
+        )
+        return failures
+
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        failures = sum(pool.map(_fit_chunk, np.array_split(voxels, -(-len(voxels) // size))))
+
+    if failures:
+        LOGGER.debug(
+            'Monoexponential fit failed on %d/%d voxels, log-linear estimates were retained.',
+            failures,
+            voxels.size,
+        )
+    return t2s, s0
+
+
+def modify_t2s_s0(t2s, s0, echo_times):
+    """
+    Clean-up T2* (in ms) and S0 estimates as tedana does.
+
+    Infinite T2* values are set to 500 ms, non-positive values to 1 ms, and
+    values for which the decay at any echo underflows are floored.
+    Undefined S0 values are set to zero.
+
+    """
+    t2s = t2s.copy()
+    s0 = s0.copy()
+    t2s[np.isinf(t2s)] = 500.0
+    t2s[t2s <= 0] = 1.0
+
+    nonzero = t2s != 0
+    with np.errstate(over='ignore', under='ignore'):
+        decay = np.exp(-echo_times[:, np.newaxis] / t2s[np.newaxis, nonzero])
+    floor = np.zeros_like(nonzero)
+    floor[nonzero] = np.any(decay == 0, axis=0)
+    t2s[floor] = np.min(-echo_times) / np.log(np.finfo(t2s.dtype).eps)
+
+    s0[np.isnan(s0)] = 0.0
+    return t2s, s0
+
+
+def optcom_weights(t2s, echo_times, adaptive):
+    """
+    Calculate the T2*-weighted optimal combination weights of each echo.
+
+    Only the echoes fitted in each voxel contribute, with weights
+    :math:`TE_e \\exp(-TE_e / T_2^*)` normalized to sum one.
+    Voxels without good signal get null weights.
+
+    """
+    nechoes = _fitted_echoes(adaptive)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        weights = echo_times[np.newaxis] * np.exp(-echo_times[np.newaxis] / t2s[:, np.newaxis])
+    weights[np.arange(len(echo_times))[np.newaxis] >= nechoes[:, np.newaxis]] = 0
+    weights[adaptive == 0] = 0
+    total = weights.sum(axis=1, keepdims=True)
+    np.divide(weights, total, out=weights, where=total > 0)
+    return np.nan_to_num(weights)
+
+
+def write_optcom(out_file, echoes, mask_idx, weights, step):
+    """
+    Write the optimal combination of ``echoes``, one block of ``step`` volumes at a time.
+
+    Blocks are appended to the output file as they are computed, so the
+    combined series is never held in memory.
+
+    """
+    ref = echoes[0]
+    shape = ref.shape[:3]
+    nvols = ref.shape[3] if ref.ndim > 3 else 1
+    nvoxels = int(np.prod(shape))
+
+    header = nb.Nifti1Image(np.zeros((1, 1, 1), dtype='float32'), ref.affine, ref.header).header
+    header.extensions.clear()
+    header.set_data_dtype('float32')
+    header.set_data_shape(ref.shape)
+    header.set_slope_inter(1.0, 0.0)
+    header.set_data_offset(352)
+    dtype = header.get_data_dtype()
+
+    with ImageOpener(out_file, 'wb') as fobj:
+        header.write_to(fobj)
+        fobj.write(b'\x00' * (header.get_data_offset() - fobj.tell()))
+        for start in range(0, nvols, step):
+            stop = min(start + step, nvols)
+            block = _read_block(echoes, mask_idx, start, stop)
+            combined = np.zeros((nvoxels, stop - start), dtype=dtype)
+            combined[mask_idx] = np.einsum('ne,net->nt', weights, block)
+            # NIfTI stores volumes contiguously (Fortran order)
+            fobj.write(combined.reshape((*shape, stop - start)).tobytes(order='F'))
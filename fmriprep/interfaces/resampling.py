@@ -8,9 +8,12 @@ import nibabel as nb
 import nitransforms as nt
 import nitransforms.resampling
 import numpy as np
+from nibabel.openers import ImageOpener
+from nipype import logging
 from nipype.interfaces.base import (
     File,
     InputMultiObject,
+    OutputMultiObject,
     SimpleInterface,
     TraitedSpec,
     traits,
@@ -21,12 +24,28 @@ from scipy.sparse import hstack as sparse_hstack
 from sdcflows.transform import grid_bspline_weights
 from sdcflows.utils.tools import ensure_positive_cosines
 
+from ..utils import tracing
 from ..utils.asynctools import worker
-from ..utils.transforms import load_transforms
+from ..utils.transforms import (
+    cached_coordinates,
+    load_transforms,
+    map_grid_coordinates,
+    split_dense_transforms,
+)
+
+LOGGER = logging.getLogger('nipype.interface')
+
+#: Number of voxels whose temporal statistics are calculated at once
+CHUNK_VOXELS = 2**16
 
 
 class ResampleSeriesInputSpec(TraitedSpec):
-    in_file = File(exists=True, mandatory=True, desc='3D or 4D image file to resample')
+    in_file = InputMultiObject(
+        File(exists=True),
+        mandatory=True,
+        desc='3D or 4D image file to resample. If several files are given (e.g., echoes), '
+        'they are resampled jointly, sharing coordinates and corrections.',
+    )
     ref_file = File(exists=True, mandatory=True, desc='File to resample in_file to')
     transforms = InputMultiObject(
         File(exists=True),
@@ -38,7 +57,22 @@ class ResampleSeriesInputSpec(TraitedSpec):
         usedefault=True,
         desc='Whether to invert each file in transforms',
     )
+    coordinates_cache = traits.Directory(
+        desc='Directory where the coordinates of ref_file, mapped through dense (.h5) '
+        'transforms, are cached for reuse across runs',
+    )
+    transforms_cache = traits.Directory(
+        desc='Directory where dense (.h5) transforms are converted for fast reloading',
+    )
     fieldmap = File(exists=True, desc='Fieldmap file resampled into reference space')
+    mask_file = File(
+        exists=True,
+        desc='Mask of the region to resample. Voxels of ref_file outside it are not '
+        'interpolated, and are set to zero.',
+    )
+    mask_dilation = traits.Int(
+        0, usedefault=True, desc='Dilate mask_file by this number of voxels of ref_file'
+    )
     ro_time = traits.Float(desc='EPI readout time (s).')
     pe_dir = traits.Enum(
         'i',
@@ -52,6 +86,20 @@ class ResampleSeriesInputSpec(TraitedSpec):
     jacobian = traits.Bool(mandatory=True, desc='Whether to apply Jacobian correction')
     num_threads = traits.Int(1, usedefault=True, desc='Number of threads to use for resampling')
     output_data_type = traits.Str('float32', usedefault=True, desc='Data type of output image')
+    quantize = traits.Enum(
+        None,
+        'int16',
+        'uint16',
+        usedefault=True,
+        desc='Store 4D outputs as scaled integers of this type, if the quantization '
+        'error is within quantize_tolerance (see quantize_series)',
+    )
+    quantize_tolerance = traits.Float(
+        0.01,
+        usedefault=True,
+        desc='Maximum quantization error, as a fraction of the median temporal '
+        'standard deviation of the series',
+    )
     order = traits.Int(3, usedefault=True, desc='Order of interpolation (0=nearest, 3=cubic)')
     mode = traits.Enum(
         'grid-constant',
@@ -71,28 +119,72 @@ class ResampleSeriesInputSpec(TraitedSpec):
 
 
 class ResampleSeriesOutputSpec(TraitedSpec):
-    out_file = File(desc='Resampled image or series')
+    out_file = OutputMultiObject(File, desc='Resampled image(s) or series')
+    out_meta = OutputMultiObject(
+        traits.Dict, desc='Sidecar metadata of each output (e.g., quantization)'
+    )
 
 
 class ResampleSeries(SimpleInterface):
     """Resample a time series, applying susceptibility and motion correction
     simultaneously.
+
+    When several series are provided (e.g., the echoes of a multi-echo run),
+    the mapped coordinates, head-motion corrected grids and voxel-shift maps
+    are calculated once per volume and applied to all of them.
+
+    If ``coordinates_cache`` is set, the coordinates of the reference grid mapped
+    through dense transforms (e.g., anatomical to template) are stored on disk
+    and reused by every run resampled with the same transforms.
+
+    If ``mask_file`` is provided, only the voxels of the reference grid within
+    the (dilated) mask are interpolated, and the output is zero-filled
+    elsewhere as it is written out.
+
+    If ``quantize`` is set, series are stored as scaled integers when the
+    quantization error is within ``quantize_tolerance``, and the scaling and
+    errors are reported in ``out_meta``.
     """
 
     input_spec = ResampleSeriesInputSpec
     output_spec = ResampleSeriesOutputSpec
 
     def _run_interface(self, runtime):
-        out_path = fname_presuffix(self.inputs.in_file, suffix='resampled', newpath=runtime.cwd)
+        out_paths = [
+            fname_presuffix(in_file, suffix='resampled', newpath=runtime.cwd)
+            for in_file in self.inputs.in_file
+        ]
 
-        source = nb.load(self.inputs.in_file)
+        sources = [nb.load(in_file) for in_file in self.inputs.in_file]
+        source = sources[0]
         target = nb.load(self.inputs.ref_file)
         fieldmap = nb.load(self.inputs.fieldmap) if self.inputs.fieldmap else None
+        mask = None
+        if self.inputs.mask_file:
+            mask = target_mask(
+                nb.load(self.inputs.mask_file),
+                target,
+                dilation=self.inputs.mask_dilation,
+            )
 
         nvols = source.shape[3] if source.ndim > 3 else 1
 
         # No transforms appear Undefined, pass as empty list
-        transforms = load_transforms(self.inputs.transforms or [], self.inputs.inverse)
+        xfm_paths, inverse = self.inputs.transforms or [], self.inputs.inverse
+        coordinates = None
+        if self.inputs.coordinates_cache:
+            # Map the reference grid through the dense transforms once per subject and space
+            (xfm_paths, inverse), dense = split_dense_transforms(xfm_paths, inverse)
+            if dense[0]:
+                coordinates = cached_coordinates(
+                    target,
+                    *dense,
+                    self.inputs.coordinates_cache,
+                    transforms_cache=self.inputs.transforms_cache or None,
+                )
+        transforms = load_transforms(
+            xfm_paths, inverse or [False], cache_dir=self.inputs.transforms_cache or None
+        )
 
         pe_dir = self.inputs.pe_dir
         ro_time = self.inputs.ro_time
@@ -103,18 +195,23 @@ class ResampleSeries(SimpleInterface):
             pe_flip = pe_dir.endswith('-')
 
             # Nitransforms displacements are positive
-            source, axcodes = ensure_positive_cosines(source)
+            flipped = [ensure_positive_cosines(src) for src in sources]
+            sources = [img for img, _ in flipped]
+            axcodes = flipped[0][1]
             axis_flip = axcodes[pe_axis] in 'LPI'
 
             pe_info = [(pe_axis, -ro_time if (axis_flip ^ pe_flip) else ro_time)] * nvols
 
         resampled = resample_image(
-            source=source,
+            source=sources if len(sources) > 1 else sources[0],
             target=target,
             transforms=transforms,
             fieldmap=fieldmap,
             pe_info=pe_info,
             jacobian=self.inputs.jacobian,
+            mask=mask,
+            compact=mask is not None,
+            target_coordinates=coordinates,
             nthreads=self.inputs.num_threads,
             output_dtype=self.inputs.output_data_type,
             order=self.inputs.order,
@@ -122,9 +219,43 @@ class ResampleSeries(SimpleInterface):
             cval=self.inputs.cval,
             prefilter=self.inputs.prefilter,
         )
-        resampled.to_filename(out_path)
+        if len(sources) == 1:
+            resampled = [resampled]
+        out_meta = []
+        for src, data, out_path in zip(sources, resampled, out_paths, strict=True):
+            array = data if mask is not None else np.asanyarray(data.dataobj)
+            scaling, meta = None, {}
+            if self.inputs.quantize and nvols > 1:
+                scaling, meta = quantize_series(
+                    array,
+                    dtype=self.inputs.quantize,
+                    tolerance=self.inputs.quantize_tolerance,
+                    fill_zero=mask is not None,
+                )
+                if scaling is None:
+                    LOGGER.warning(
+                        'Could not quantize %s within tolerance, storing it as float32',
+                        out_path,
+                    )
+                    meta = {}
+            out_meta.append(meta)
+
+            if mask is None and scaling is None:
+                data.to_filename(out_path)
+                continue
+            # Zero-fill the voxels outside the mask and quantize while writing out
+            write_masked_series(
+                out_path,
+                array,
+                mask,
+                target,
+                zooms=target.header.get_zooms()[:3] + src.header.get_zooms()[3:],
+                dtype=self.inputs.quantize if scaling else 'f4',
+                scaling=scaling,
+            )
 
-        self._results['out_file'] = out_path
+        self._results['out_file'] = out_paths
+        self._results['out_meta'] = out_meta
         return runtime
 
 
@@ -149,6 +280,9 @@ class ReconstructFieldmapInputSpec(TraitedSpec):
         usedefault=True,
         desc='Whether to invert each file in transforms',
     )
+    transforms_cache = traits.Directory(
+        desc='Directory where dense (.h5) transforms are converted for fast reloading',
+    )
 
 
 class ReconstructFieldmapOutputSpec(TraitedSpec):
@@ -174,7 +308,11 @@ class ReconstructFieldmap(SimpleInterface):
         target = nb.load(self.inputs.target_ref_file)
         fmapref = nb.load(self.inputs.fmap_ref_file)
 
-        transforms = load_transforms(self.inputs.transforms, self.inputs.inverse)
+        transforms = load_transforms(
+            self.inputs.transforms,
+            self.inputs.inverse,
+            cache_dir=self.inputs.transforms_cache or None,
+        )
 
         fieldmap = reconstruct_fieldmap(
             coefficients=coefficients,
@@ -233,17 +371,18 @@ class DistortionParameters(SimpleInterface):
 
 
 def resample_vol(
-    data: np.ndarray,
+    data: np.ndarray | list[np.ndarray],
     coordinates: np.ndarray,
     pe_info: tuple[int, float],
     jacobian: bool,
     hmc_xfm: np.ndarray | None,
     fmap_hz: np.ndarray,
-    output: np.dtype | np.ndarray | None = None,
+    output: np.dtype | np.ndarray | list[np.ndarray] | None = None,
     order: int = 3,
     mode: str = 'constant',
     cval: float = 0.0,
     prefilter: bool = True,
+    mask: np.ndarray | None = None,
 ) -> np.ndarray:
     """Resample a volume at specified coordinates
 
@@ -255,7 +394,8 @@ def resample_vol(
     Parameters
     ----------
     data
-        The data array to resample
+        The data array to resample, or a list of arrays (e.g., echoes) sharing
+        the same grid, which are all sampled at the same coordinates
     coordinates
         The first-approximation voxel coordinates to sample from ``data``
         The first dimension should have length ``data.ndim``. The further
@@ -274,6 +414,7 @@ def resample_vol(
     output
         The dtype or a pre-allocated array for sampling into the target space.
         If pre-allocated, ``output.shape == coordinates.shape[1:]``.
+        If ``data`` is a list, a list of pre-allocated arrays may be passed.
     order
         Order of interpolation (default: 3 = cubic)
     mode
@@ -283,11 +424,56 @@ def resample_vol(
         Value to fill past edges of ``data`` if ``mode`` is ``'constant'``.
     prefilter
         Determines if ``data`` is pre-filtered before interpolation.
+    mask
+        Boolean array with the shape of the target array. If given, ``coordinates``
+        only cover the voxels within the mask (i.e., have shape ``(ndim, mask.sum())``),
+        and ``fmap_hz`` still spans the full target array.
+        Voxels outside the mask are zero, or left untouched in pre-allocated arrays.
+        Pre-allocated arrays of shape ``(mask.sum(),)`` receive the masked voxels only.
 
     Returns
     -------
     resampled_array
-        The resampled array, with shape ``coordinates.shape[1:]``.
+        The resampled array, with shape ``coordinates.shape[1:]`` (or ``mask.shape``,
+        unless pre-allocated), or a list of them if ``data`` is a list.
+    """
+    vsm, jacobian_factor = _distortion_terms(fmap_hz, pe_info, jacobian, mask)
+    coordinates = _move_coordinates(coordinates, hmc_xfm, pe_info[0], vsm)
+    return _sample(data, coordinates, jacobian_factor, output, order, mode, cval, prefilter, mask)
+
+
+def _distortion_terms(
+    fmap_hz: np.ndarray,
+    pe_info: tuple[int, float],
+    jacobian: bool,
+    mask: np.ndarray | None = None,
+) -> tuple[np.ndarray | None, np.ndarray | None]:
+    """Calculate the voxel shift map and the Jacobian factor (if requested) of a fieldmap
+
+    Both are restricted to the voxels within ``mask``, if given, and are ``None``
+    if there is no readout time (i.e., no distortion to correct).
+    """
+    if not pe_info[1]:
+        return None, None
+
+    vsm = fmap_hz * pe_info[1]
+    jacobian_factor = 1 + np.gradient(vsm, axis=pe_info[0]) if jacobian else None
+    if mask is not None:
+        vsm = vsm[mask]
+        if jacobian_factor is not None:
+            jacobian_factor = jacobian_factor[mask]
+    return vsm, jacobian_factor
+
+
+def _move_coordinates(
+    coordinates: np.ndarray,
+    hmc_xfm: np.ndarray | None,
+    pe_axis: int,
+    vsm: np.ndarray | None,
+) -> np.ndarray:
+    """Apply head motion and shift coordinates along the phase-encoding axis
+
+    A new array is returned, unless there is neither motion nor shift to apply.
     """
     if hmc_xfm is not None:
         # Move image with the head
@@ -295,31 +481,73 @@ def resample_vol(
         coordinates = nb.affines.apply_affine(
             hmc_xfm, coordinates.reshape(coords_shape[0], -1).T
         ).T.reshape(coords_shape)
-    else:
+    elif vsm is not None:
         # Copy coordinates to avoid interfering with other calls
         coordinates = coordinates.copy()
 
-    vsm = fmap_hz * pe_info[1]
-    coordinates[pe_info[0], ...] += vsm
+    if vsm is not None:
+        coordinates[pe_axis, ...] += vsm
+    return coordinates
 
-    result = ndi.map_coordinates(
-        data,
-        coordinates,
-        output=output,
-        order=order,
-        mode=mode,
-        cval=cval,
-        prefilter=prefilter,
-    )
 
-    if jacobian:
-        result *= 1 + np.gradient(vsm, axis=pe_info[0])
+def _sample(
+    data: np.ndarray | list[np.ndarray],
+    coordinates: np.ndarray,
+    jacobian_factor: np.ndarray | None,
+    output: np.dtype | np.ndarray | list[np.ndarray] | None = None,
+    order: int = 3,
+    mode: str = 'constant',
+    cval: float = 0.0,
+    prefilter: bool = True,
+    mask: np.ndarray | None = None,
+    hmc_xfm: np.ndarray | None = None,
+    pe_axis: int = 0,
+    vsm: np.ndarray | None = None,
+) -> np.ndarray | list[np.ndarray]:
+    """Interpolate one volume (or a list of volumes) at the final coordinates
+
+    See :func:`resample_vol` for the description of the arguments.
+    If any of ``hmc_xfm`` or ``vsm`` are given, ``coordinates`` are first moved
+    with :func:`_move_coordinates`.
+    """
+    if hmc_xfm is not None or vsm is not None:
+        coordinates = _move_coordinates(coordinates, hmc_xfm, pe_axis, vsm)
+
+    multiple = isinstance(data, list)
+    if not multiple:
+        data = [data]
+    if not isinstance(output, list):
+        output = [output] * len(data)
+
+    results = []
+    for volume, out in zip(data, output, strict=True):
+        scatter = mask is not None and (not isinstance(out, np.ndarray) or out.shape == mask.shape)
+        result = ndi.map_coordinates(
+            volume,
+            coordinates,
+            output=out.dtype if scatter and isinstance(out, np.ndarray) else out,
+            order=order,
+            mode=mode,
+            cval=cval,
+            prefilter=prefilter,
+        )
+
+        if jacobian_factor is not None:
+            result *= jacobian_factor
 
-    return result
+        if scatter:
+            if not isinstance(out, np.ndarray):
+                out = np.zeros(mask.shape, dtype=result.dtype)
+            out[mask] = result
+            result = out
+
+        results.append(result)
+
+    return results if multiple else results[0]
 
 
 async def resample_series_async(
-    data: np.ndarray,
+    data: np.ndarray | list[np.ndarray],
     coordinates: np.ndarray,
     pe_info: list[tuple[int, float]],
     jacobian: bool,
@@ -330,6 +558,8 @@ async def resample_series_async(
     mode: str = 'constant',
     cval: float = 0.0,
     prefilter: bool = True,
+    mask: np.ndarray | None = None,
+    compact: bool = False,
     max_concurrent: int = min(os.cpu_count(), 12),
 ) -> np.ndarray:
     """Resample a 4D time series at specified coordinates
@@ -342,7 +572,8 @@ async def resample_series_async(
     Parameters
     ----------
     data
-        The data array to resample
+        The data array to resample, or a list of arrays (e.g., echoes) sharing
+        the same grid and time axis, which are resampled jointly
     coordinates
         The first-approximation voxel coordinates to sample from ``data``.
         The first dimension should have length 3.
@@ -369,6 +600,11 @@ async def resample_series_async(
         Value to fill past edges of ``data`` if ``mode`` is ``'constant'``.
     prefilter
         Determines if ``data`` is pre-filtered before interpolation.
+    mask
+        Boolean array with the shape of the target array. If given, ``coordinates``
+        only cover the voxels within the mask, and the rest of the output is zero.
+    compact
+        Return only the voxels within ``mask``, as arrays of shape ``(mask.sum(), N)``.
     max_concurrent
         Maximum number of volumes to resample concurrently
 
@@ -376,9 +612,22 @@ async def resample_series_async(
     -------
     resampled_array
         The resampled array, with shape ``coordinates.shape[1:] + (N,)``,
-        where N is the number of volumes in ``data``.
+        where N is the number of volumes in ``data``, or a list of them
+        if ``data`` is a list.
     """
-    if data.ndim == 3:
+    multiple = isinstance(data, list)
+    series = data if multiple else [data]
+
+    if compact:
+        grid_shape = (int(mask.sum()),)
+    else:
+        grid_shape = coordinates.shape[1:] if mask is None else mask.shape
+
+    if series[0].ndim == 3:
+        output = output_dtype
+        if compact:
+            output = [np.zeros(grid_shape, dtype=output_dtype or arr.dtype) for arr in series]
+            output = output if multiple else output[0]
         return resample_vol(
             data,
             coordinates,
@@ -386,49 +635,80 @@ async def resample_series_async(
             jacobian,
             hmc_xfms[0] if hmc_xfms else None,
             fmap_hz,
-            output_dtype,
+            output,
             order,
             mode,
             cval,
             prefilter,
+            mask,
         )
 
     semaphore = asyncio.Semaphore(max_concurrent)
 
     # Order F ensures individual volumes are contiguous in memory
     # Also matches NIfTI, making final save more efficient
-    out_array = np.zeros(coordinates.shape[1:] + data.shape[-1:], dtype=output_dtype, order='F')
+    out_arrays = [
+        np.zeros(grid_shape + series[0].shape[-1:], dtype=output_dtype, order='F') for _ in series
+    ]
 
+    if all(info == pe_info[0] for info in pe_info):
+        # The distortion is the same for all volumes: calculate it once and,
+        # without head motion, shift the coordinates once as well
+        vsm, jacobian_factor = _distortion_terms(fmap_hz, pe_info[0], jacobian, mask)
+        if not hmc_xfms:
+            coordinates = _move_coordinates(coordinates, None, pe_info[0][0], vsm)
+            vsm = None
+
+        def resample(volid, **kwargs):
+            return _sample(
+                coordinates=coordinates,
+                jacobian_factor=jacobian_factor,
+                hmc_xfm=hmc_xfms[volid] if hmc_xfms else None,
+                pe_axis=pe_info[0][0],
+                vsm=vsm,
+                **kwargs,
+            )
+    else:
+
+        def resample(volid, **kwargs):
+            return resample_vol(
+                coordinates=coordinates,
+                pe_info=pe_info[volid],
+                jacobian=jacobian,
+                hmc_xfm=hmc_xfms[volid] if hmc_xfms else None,
+                fmap_hz=fmap_hz,
+                **kwargs,
+            )
+
+    # Each task resamples one volume of every series, so coordinates are only mapped once
     tasks = [
         asyncio.create_task(
             worker(
                 partial(
-                    resample_vol,
-                    data=volume,
-                    coordinates=coordinates,
-                    pe_info=pe_info[volid],
-                    jacobian=jacobian,
-                    hmc_xfm=hmc_xfms[volid] if hmc_xfms else None,
-                    fmap_hz=fmap_hz,
-                    output=out_array[..., volid],
+                    resample,
+                    volid,
+                    data=[arr[..., volid] for arr in series],
+                    output=[out_array[..., volid] for out_array in out_arrays],
                     order=order,
                     mode=mode,
                     cval=cval,
                     prefilter=prefilter,
+                    mask=mask,
                 ),
                 semaphore,
             )
         )
-        for volid, volume in enumerate(np.rollaxis(data, -1, 0))
+        for volid in range(series[0].shape[-1])
     ]
 
     await asyncio.gather(*tasks)
 
-    return out_array
+    return out_arrays if multiple else out_arrays[0]
 
 
+@tracing.traced()
 def resample_series(
-    data: np.ndarray,
+    data: np.ndarray | list[np.ndarray],
     coordinates: np.ndarray,
     pe_info: list[tuple[int, float]],
     jacobian: bool,
@@ -439,6 +719,8 @@ def resample_series(
     mode: str = 'constant',
     cval: float = 0.0,
     prefilter: bool = True,
+    mask: np.ndarray | None = None,
+    compact: bool = False,
     nthreads: int = 1,
 ) -> np.ndarray:
     """Resample a 4D time series at specified coordinates
@@ -451,7 +733,8 @@ def resample_series(
     Parameters
     ----------
     data
-        The data array to resample
+        The data array to resample, or a list of arrays (e.g., echoes) sharing
+        the same grid and time axis, which are resampled jointly
     coordinates
         The first-approximation voxel coordinates to sample from ``data``.
         The first dimension should have length 3.
@@ -478,6 +761,11 @@ def resample_series(
         Value to fill past edges of ``data`` if ``mode`` is ``'constant'``.
     prefilter
         Determines if ``data`` is pre-filtered before interpolation.
+    mask
+        Boolean array with the shape of the target array. If given, ``coordinates``
+        only cover the voxels within the mask, and the rest of the output is zero.
+    compact
+        Return only the voxels within ``mask``, as arrays of shape ``(mask.sum(), N)``.
     nthreads
         Number of threads to use for parallel resampling
 
@@ -485,7 +773,8 @@ def resample_series(
     -------
     resampled_array
         The resampled array, with shape ``coordinates.shape[1:] + (N,)``,
-        where N is the number of volumes in ``data``.
+        where N is the number of volumes in ``data``, or a list of them
+        if ``data`` is a list.
     """
     return asyncio.run(
         resample_series_async(
@@ -500,18 +789,24 @@ def resample_series(
             mode=mode,
             cval=cval,
             prefilter=prefilter,
+            mask=mask,
+            compact=compact,
             max_concurrent=nthreads,
         )
     )
 
 
+@tracing.traced()
 def resample_image(
-    source: nb.Nifti1Image,
+    source: nb.Nifti1Image | list[nb.Nifti1Image],
     target: nb.Nifti1Image,
     transforms: nt.TransformChain,
     fieldmap: nb.Nifti1Image | None,
     pe_info: list[tuple[int, float]] | None,
     jacobian: bool = True,
+    mask: np.ndarray | None = None,
+    compact: bool = False,
+    target_coordinates: np.ndarray | None = None,
     nthreads: int = 1,
     output_dtype: np.dtype | str | None = 'f4',
     order: int = 3,
@@ -525,7 +820,8 @@ def resample_image(
     Parameters
     ----------
     source
-        The 3D bold image or 4D bold series to resample.
+        The 3D bold image or 4D bold series to resample, or a list of them
+        (e.g., echoes) sharing the same grid, which are resampled jointly.
     target
         An image sampled in the target space.
     transforms
@@ -538,6 +834,17 @@ def resample_image(
         ``(1, -0.04)`` becomes ``[0, -0.04, 0]``, which indicates that a
         +1 Hz deflection in the field shifts 0.04 voxels toward the start
         of the data array in the second dimension.
+    mask
+        Boolean array with the shape of ``target``. Only voxels within the mask
+        are resampled, the rest of the output is zero.
+    compact
+        Return the voxels within ``mask`` as arrays of shape ``(mask.sum(), N)``,
+        instead of images (see :func:`write_masked_series`).
+    target_coordinates
+        Physical coordinates of the ``target`` grid (``(N, 3)``, C-ordered), already
+        mapped through the leading part of the transforms (see
+        :func:`~fmriprep.utils.transforms.cached_coordinates`), which must then be
+        left out of ``transforms``.
     nthreads
         Number of threads to use for parallel resampling
     output_dtype
@@ -555,7 +862,8 @@ def resample_image(
     Returns
     -------
     resampled_bold
-        The BOLD series resampled into the target space
+        The BOLD series resampled into the target space (or its ``compact`` array),
+        or a list of them if ``source`` is a list.
     """
     if not isinstance(transforms, nt.TransformChain):
         transforms = nt.TransformChain([transforms])
@@ -568,8 +876,9 @@ def resample_image(
         transform_list: list = transforms.transforms
         hmc = []
 
-    # Retrieve the RAS coordinates of the target space
-    coordinates = nt.base.SpatialReference.factory(target).ndcoords.astype('f4')
+    multiple = isinstance(source, list)
+    sources = source if multiple else [source]
+    source = sources[0]
 
     # We will operate in voxel space, so get the source affine
     vox2ras = source.affine
@@ -580,8 +889,12 @@ def resample_image(
     # After removing the head-motion transforms, add a mapping from boldref
     # world space to voxels. This new transform maps from world coordinates
     # in the target space to voxel coordinates in the source space.
+    # The RAS coordinates of the target space are generated and mapped in chunks,
+    # so only the final voxel coordinates are held for the whole target
     ref2vox = nt.TransformChain(transform_list + [nt.Affine(ras2vox)])
-    mapped_coordinates = ref2vox.map(coordinates)
+    coordinates = map_grid_coordinates(target, ref2vox, coordinates=target_coordinates, mask=mask)
+    if mask is None:
+        coordinates = coordinates.reshape((3, *target.shape[:3]))
 
     # Some identities to reduce special casing downstream
     if fieldmap is None:
@@ -590,8 +903,8 @@ def resample_image(
         pe_info = [[0, 0] for _ in range(source.shape[-1])]
 
     resampled_data = resample_series(
-        data=source.get_fdata(dtype='f4'),
-        coordinates=mapped_coordinates.T.reshape((3, *target.shape[:3])),
+        data=[src.get_fdata(dtype='f4') for src in sources],
+        coordinates=coordinates,
         pe_info=pe_info,
         jacobian=jacobian,
         hmc_xfms=hmc_xfms,
@@ -602,13 +915,237 @@ def resample_image(
         mode=mode,
         cval=cval,
         prefilter=prefilter,
+        mask=mask,
+        compact=compact,
     )
-    resampled_img = nb.Nifti1Image(resampled_data, target.affine, target.header)
-    resampled_img.set_data_dtype('f4')
-    # Preserve zooms of additional dimensions
-    resampled_img.header.set_zooms(target.header.get_zooms()[:3] + source.header.get_zooms()[3:])
+    if compact:
+        return resampled_data if multiple else resampled_data[0]
+
+    resampled_imgs = []
+    for src, data in zip(sources, resampled_data, strict=True):
+        resampled_img = nb.Nifti1Image(data, target.affine, target.header)
+        resampled_img.set_data_dtype('f4')
+        # Preserve zooms of additional dimensions
+        resampled_img.header.set_zooms(target.header.get_zooms()[:3] + src.header.get_zooms()[3:])
+        resampled_imgs.append(resampled_img)
 
-    return resampled_img
+    return resampled_imgs if multiple else resampled_imgs[0]
+
+
+@tracing.traced()
+def write_masked_series(
+    out_file: str,
+    data: np.ndarray,
+    mask: np.ndarray | None,
+    reference: nb.Nifti1Image,
+    zooms: tuple[float, ...] | None = None,
+    dtype: np.dtype | str = 'f4',
+    scaling: tuple[float, float] | None = None,
+) -> str:
+    """Write a series stored as the voxels within a mask, one volume at a time
+
+    Voxels outside ``mask`` are filled with zeros as volumes are written, so
+    the full-size series is never held in memory.
+
+    Parameters
+    ----------
+    out_file
+        Path of the NIfTI file to write.
+    data
+        Array of shape ``(mask.sum(),)`` or ``(mask.sum(), N)``, or with the
+        shape of ``reference`` (plus ``N``) if ``mask`` is ``None``.
+    mask
+        Boolean array with the shape of ``reference``, or ``None``.
+    reference
+        An image defining the target grid.
+    zooms
+        Voxel sizes (and repetition time) of the output.
+    dtype
+        Data type stored on disk.
+    scaling
+        Slope and intercept of the stored values, as calculated by
+        :func:`quantize_series`, if ``dtype`` is an integer type.
+
+    Returns
+    -------
+    out_file
+        The path of the written file.
+    """
+    grid_shape = reference.shape[:3] if mask is None else mask.shape
+    is_series = data.ndim > (1 if mask is not None else 3)
+    nvols = data.shape[-1] if is_series else 1
+    shape = grid_shape + ((nvols,) if is_series else ())
+    slope, inter = scaling or (1.0, 0.0)
+
+    header = nb.Nifti1Image(np.zeros((1, 1, 1), dtype='f4'), reference.affine, reference.header)
+    header = header.header
+    header.extensions.clear()
+    header.set_data_dtype(dtype)
+    header.set_data_shape(shape)
+    if zooms is not None:
+        header.set_zooms(zooms[: len(shape)])
+    header.set_slope_inter(slope, inter)
+    header.set_data_offset(352)
+
+    volume = np.zeros(grid_shape, dtype='f4', order='F') if mask is not None else None
+    with ImageOpener(out_file, 'wb') as fobj:
+        header.write_to(fobj)
+        fobj.write(b'\x00' * (header.get_data_offset() - fobj.tell()))
+        for volid in range(nvols):
+            values = data[..., volid] if is_series else data
+            if mask is not None:
+                volume[mask] = values
+                values = volume
+            if scaling is not None:
+                values = _quantize(values, slope, inter, dtype)
+            # NIfTI stores volumes contiguously (Fortran order)
+            fobj.write(np.asarray(values, dtype=dtype).tobytes(order='F'))
+    return out_file
+
+
+def _quantize(data: np.ndarray, slope: float, inter: float, dtype: np.dtype | str) -> np.ndarray:
+    info = np.iinfo(dtype)
+    raw = np.rint((data - np.float64(inter)) / np.float64(slope))
+    return np.clip(raw, info.min, info.max).astype(dtype)
+
+
+@tracing.traced()
+def quantize_series(
+    data: np.ndarray,
+    dtype: np.dtype | str = 'int16',
+    tolerance: float = 0.01,
+    fill_zero: bool = False,
+) -> tuple[tuple[float, float] | None, dict]:
+    """Calculate the scaling that stores a series as integers of type ``dtype``
+
+    The slope and intercept (``scl_slope`` and ``scl_inter`` of the NIfTI header)
+    map the range of ``data`` onto the range of ``dtype``, so values are stored
+    with an absolute error of at most half the slope.
+    The quantization is accepted only if that error does not exceed ``tolerance``
+    times the median temporal standard deviation of the (nonconstant) voxels,
+    so it remains negligible against the fluctuations analyzed downstream.
+
+    Parameters
+    ----------
+    data
+        The series, with volumes along the last axis.
+    dtype
+        The integer data type stored on disk.
+    tolerance
+        Maximum quantization error, as a fraction of the median temporal
+        standard deviation.
+    fill_zero
+        Whether zero must be represented (e.g., to fill voxels outside a mask).
+
+    Returns
+    -------
+    scaling
+        The slope and intercept, or ``None`` if the error bound is not met
+        (or ``data`` has non-finite values).
+    metadata
+        Sidecar metadata describing the quantization and its error.
+
+    >>> rng = np.random.default_rng(0)
+    >>> data = (1000 + rng.normal(0, 10, (10, 10, 10, 20))).astype('f4')
+    >>> scaling, meta = quantize_series(data)
+    >>> meta['Quantization']['MaxAbsoluteError'] <= meta['Quantization']['ErrorBound']
+    True
+    >>> quantize_series(data, tolerance=1e-6)[0] is None
+    True
+
+    """
+    info = np.iinfo(dtype)
+    lo, hi = float(data.min()), float(data.max())
+    if not np.isfinite(lo + hi):
+        return None, {}
+    if fill_zero:
+        lo, hi = min(lo, 0.0), max(hi, 0.0)
+    # One step of slack keeps the maximum within range after rounding the intercept
+    slope = np.float32((hi - lo) / (info.max - info.min - 1) or 1.0)
+    inter = np.float32((np.floor(lo / slope) - info.min) * slope)
+
+    # Voxels are along the first axis without copying (series are Fortran-ordered)
+    voxels = data.reshape(-1, data.shape[-1], order='A')
+    std = np.concatenate(
+        [
+            voxels[start : start + CHUNK_VOXELS].std(axis=-1)
+            for start in range(0, len(voxels), CHUNK_VOXELS)
+        ]
+    )
+    bound = tolerance * float(np.median(std[std > 0])) if np.any(std > 0) else 0.0
+
+    # Measure the error of the stored values, one volume at a time
+    max_error, sq_error = 0.0, 0.0
+    for volid in range(data.shape[-1]):
+        volume = data[..., volid].astype('f8')
+        error = _quantize(volume, slope, inter, dtype) * np.float64(slope) + inter - volume
+        max_error = max(max_error, float(np.abs(error).max()))
+        sq_error += float(np.square(error).sum())
+
+    metadata = {
+        'Quantization': {
+            'DataType': np.dtype(dtype).name,
+            'ScaleSlope': float(slope),
+            'ScaleIntercept': float(inter),
+            'MaxAbsoluteError': max_error,
+            'RMSError': (sq_error / data.size) ** 0.5,
+            'ErrorBound': bound,
+            'ErrorBoundDescription': (
+                f'{tolerance:g} times the median temporal standard deviation of the series'
+            ),
+        }
+    }
+    if max_error > bound:
+        return None, metadata
+    return (float(slope), float(inter)), metadata
+
+
+@tracing.traced()
+def target_mask(mask: nb.Nifti1Image, target: nb.Nifti1Image, dilation: int = 0) -> np.ndarray:
+    """Project a mask onto the grid of ``target``
+
+    A voxel of ``target`` is selected if its center falls within ``mask``,
+    or if it contains the center of any voxel of ``mask``, so thin masks
+    (e.g., the cortical ribbon) are not lost when the target grid is coarser.
+
+    Parameters
+    ----------
+    mask
+        Binary image in the same physical space as ``target``.
+    target
+        An image sampled in the target space.
+    dilation
+        Number of voxels of ``target`` to dilate the projected mask by.
+
+    Returns
+    -------
+    mask_array
+        Boolean array with the shape of ``target``.
+    """
+    shape = target.shape[:3]
+    data = np.asanyarray(mask.dataobj).reshape(mask.shape[:3]) > 0
+
+    if shape == data.shape and np.allclose(mask.affine, target.affine):
+        out = data
+    else:
+        # Pull: sample the mask at the centers of target voxels
+        pull = np.linalg.inv(mask.affine) @ target.affine
+        ijk = np.rint(nb.affines.apply_affine(pull, np.indices(shape).reshape(3, -1).T))
+        ijk = ijk.astype(int)
+        inside = np.all((ijk >= 0) & (ijk < data.shape), axis=1)
+        out = np.zeros(len(ijk), dtype=bool)
+        out[inside] = data[tuple(ijk[inside].T)]
+        out = out.reshape(shape)
+
+        # Push: mark target voxels containing centers of mask voxels
+        push = np.linalg.inv(target.affine) @ mask.affine
+        ijk = np.rint(nb.affines.apply_affine(push, np.argwhere(data))).astype(int)
+        ijk = ijk[np.all((ijk >= 0) & (ijk < shape), axis=1)]
+        out[tuple(ijk.T)] = True
+
+    if dilation > 0:
+        out = ndi.binary_dilation(out, iterations=dilation)
+    return out
 
 
 def aligned(aff1: np.ndarray, aff2: np.ndarray) -> bool:
@@ -634,6 +1171,7 @@ def as_affine(xfm: nt.base.TransformBase) -> nt.Affine | None:
     return None
 
 
+@tracing.traced()
 def reconstruct_fieldmap(
     coefficients: list[nb.Nifti1Image],
     fmap_reference: nb.Nifti1Image,
@@ -2,7 +2,7 @@ import nibabel as nb
 import numpy as np
 from nipype.pipeline import engine as pe
 
-from fmriprep.interfaces.maths import Clip
+from fmriprep.interfaces.maths import BinaryDilation, Clip
 
 
 def test_Clip(tmp_path):
@@ -41,3 +41,30 @@ def test_Clip(tmp_path):
     assert ret.outputs.out_file == str(tmp_path / 'nonpositive/input_clipped.nii')
     out_img = nb.load(ret.outputs.out_file)
     assert np.allclose(out_img.get_fdata(), [[[-1.0, 0.0], [-2.0, 0.0]]])
+
+
+def test_BinaryDilation(tmp_path):
+    from niworkflows.interfaces.morphology import BinaryDilation as NiworkflowsDilation
+
+    in_file = str(tmp_path / 'mask.nii.gz')
+    data = np.zeros((12, 12, 12), dtype='uint8')
+    data[3:6, 4:9, 0:2] = 1
+    nb.Nifti1Image(data, np.eye(4)).to_filename(in_file)
+
+    for radius in (1, 2, 3):
+        ret = pe.Node(
+            BinaryDilation(in_mask=in_file, radius=radius),
+            name=f'dilate{radius}',
+            base_dir=tmp_path,
+        ).run()
+        ref = pe.Node(
+            NiworkflowsDilation(in_mask=in_file, radius=radius),
+            name=f'ref{radius}',
+            base_dir=tmp_path,
+        ).run()
+
+        out_img = nb.load(ret.outputs.out_mask)
+        assert out_img.get_data_dtype() == np.uint8
+        assert np.array_equal(
+            np.asanyarray(out_img.dataobj), np.asanyarray(nb.load(ref.outputs.out_mask).dataobj)
+        )
@@ -0,0 +1,70 @@
+import nibabel as nb
+import numpy as np
+import pytest
+from nipype.pipeline import engine as pe
+
+from fmriprep.interfaces.multiecho import T2SFit
+
+ECHO_TIMES = (0.012, 0.028, 0.044)
+
+
+def _echoes(tmp_path, shape=(8, 8, 6), nvols=12):
+    rng = np.random.default_rng(0)
+    s0 = rng.uniform(800, 1200, shape)
+    # Signal drop-out in the first slab
+    s0[:2] = rng.uniform(0, 5, (2, *shape[1:]))
+    t2s = rng.uniform(0.02, 0.06, shape)
+
+    in_files = []
+    for i, te in enumerate(ECHO_TIMES):
+        noise = 1 + 0.02 * rng.standard_normal((*shape, nvols))
+        data = s0[..., np.newaxis] * np.exp(-te / t2s[..., np.newaxis]) * noise
+        in_files.append(str(tmp_path / f'echo-{i + 1}_bold.nii.gz'))
+        nb.Nifti1Image(data.astype('float32'), np.eye(4)).to_filename(in_files[-1])
+
+    mask = np.zeros(shape, dtype='uint8')
+    mask[1:-1, 1:-1, 1:-1] = 1
+    nb.Nifti1Image(mask, np.eye(4)).to_filename(tmp_path / 'mask.nii.gz')
+    return in_files, str(tmp_path / 'mask.nii.gz')
+
+
+@pytest.mark.parametrize('fittype', ['loglin', 'curvefit'])
+def test_T2SFit(tmp_path, fittype):
+    from tedana.workflows import t2smap_workflow
+
+    in_files, mask_file = _echoes(tmp_path)
+    t2smap_workflow(
+        in_files,
+        [te * 1000 for te in ECHO_TIMES],
+        out_dir=str(tmp_path / 'tedana'),
+        mask=mask_file,
+        fittype=fittype,
+        exclude='0:2',
+    )
+
+    # Tiny blocks, so the series is read and written in several chunks
+    t2sfit = pe.Node(
+        T2SFit(
+            in_files=in_files,
+            echo_times=list(ECHO_TIMES),
+            mask_file=mask_file,
+            fittype=fittype,
+            n_exclude=2,
+            num_threads=2,
+            chunk_gb=2e-6,
+        ),
+        name='t2sfit',
+        base_dir=tmp_path,
+    )
+    result = t2sfit.run()
+
+    for expected, output in (
+        ('T2starmap.nii.gz', 't2star_map'),
+        ('S0map.nii.gz', 's0_map'),
+        ('desc-optcom_bold.nii.gz', 'optimal_comb'),
+    ):
+        ref = nb.load(tmp_path / 'tedana' / expected)
+        out = nb.load(getattr(result.outputs, output))
+        assert out.shape == ref.shape
+        assert np.allclose(out.affine, ref.affine)
+        assert np.allclose(out.get_fdata(), ref.get_fdata(), rtol=1e-4, atol=1e-5)
@@ -0,0 +1,252 @@
+import nibabel as nb
+import nitransforms as nt
+import numpy as np
+import pytest
+
+from fmriprep.interfaces.resampling import ResampleSeries, resample_image, target_mask
+
+
+def _series(rng, shape=(10, 12, 8), nvols=4):
+    affine = np.diag([2.0, 2.0, 2.5, 1.0])
+    return nb.Nifti1Image(rng.uniform(100, 200, (*shape, nvols)).astype('f4'), affine)
+
+
+def test_resample_image_echoes():
+    rng = np.random.default_rng(0)
+    echoes = [_series(rng) for _ in range(3)]
+    target = nb.Nifti1Image(np.zeros((9, 11, 8), dtype='f4'), echoes[0].affine)
+    fieldmap = nb.Nifti1Image(rng.normal(0, 20, target.shape).astype('f4'), target.affine)
+    hmc = nt.linear.LinearTransformsMapping(
+        [nb.affines.from_matvec(np.eye(3), shift) for shift in rng.normal(0, 0.5, (4, 3))]
+    )
+    kwargs = {
+        'target': target,
+        'transforms': nt.TransformChain([hmc]),
+        'fieldmap': fieldmap,
+        'pe_info': [(1, 0.03)] * 4,
+        'jacobian': True,
+        'nthreads': 2,
+    }
+
+    joint = resample_image(source=echoes, **kwargs)
+    assert isinstance(joint, list)
+    assert len(joint) == len(echoes)
+    for echo, resampled in zip(echoes, joint, strict=True):
+        expected = resample_image(source=echo, **kwargs)
+        assert resampled.shape == expected.shape
+        assert np.array_equal(resampled.dataobj, expected.dataobj)
+
+
+def test_ResampleSeries_echoes(tmp_path):
+    rng = np.random.default_rng(1)
+    in_files = []
+    for i in range(3):
+        in_files.append(str(tmp_path / f'echo-{i + 1}_bold.nii.gz'))
+        _series(rng).to_filename(in_files[-1])
+
+    result = ResampleSeries(in_file=in_files, ref_file=in_files[0], jacobian=False, order=1).run(
+        cwd=tmp_path
+    )
+    assert len(result.outputs.out_file) == len(in_files)
+    for in_file, out_file in zip(in_files, result.outputs.out_file, strict=True):
+        assert np.allclose(nb.load(out_file).get_fdata(), nb.load(in_file).get_fdata(), atol=1e-3)
+
+    # A single series still produces a single file
+    result = ResampleSeries(
+        in_file=in_files[0], ref_file=in_files[0], jacobian=False, order=1
+    ).run(cwd=tmp_path)
+    assert isinstance(result.outputs.out_file, str)
+
+
+def test_resample_image_mask():
+    rng = np.random.default_rng(2)
+    source = _series(rng)
+    target = nb.Nifti1Image(np.zeros((9, 11, 8), dtype='f4'), source.affine)
+    mask = np.zeros(target.shape, dtype=bool)
+    mask[2:6, 3:9, 1:7] = True
+    kwargs = {
+        'source': source,
+        'target': target,
+        'transforms': nt.TransformChain([nt.Affine()]),
+        'fieldmap': nb.Nifti1Image(rng.normal(0, 20, target.shape).astype('f4'), target.affine),
+        'pe_info': [(1, 0.03)] * 4,
+        'jacobian': True,
+    }
+
+    full = np.asanyarray(resample_image(**kwargs).dataobj)
+    masked = np.asanyarray(resample_image(mask=mask, **kwargs).dataobj)
+    assert masked.shape == full.shape
+    assert np.allclose(masked[mask], full[mask])
+    assert not masked[~mask].any()
+
+
+def test_resample_image_chunks(monkeypatch):
+    from functools import partial
+
+    from fmriprep.interfaces import resampling
+    from fmriprep.utils.transforms import map_grid_coordinates
+
+    rng = np.random.default_rng(3)
+    source = _series(rng)
+    target = nb.Nifti1Image(np.zeros((9, 11, 8), dtype='f4'), np.diag([2.2, 2.2, 2.6, 1.0]))
+    coreg = nt.Affine(nb.affines.from_matvec(np.eye(3), rng.normal(0, 1, 3)))
+    mask = rng.uniform(size=target.shape) > 0.3
+    kwargs = {
+        'target': target,
+        'transforms': nt.TransformChain([coreg]),
+        'fieldmap': None,
+        'pe_info': None,
+        'order': 1,
+    }
+
+    expected = resample_image(source, **kwargs).get_fdata()
+    expected_masked = resample_image(source, mask=mask, compact=True, **kwargs)
+    # Mapping the coordinates a few voxels at a time does not change the result
+    monkeypatch.setattr(
+        resampling, 'map_grid_coordinates', partial(map_grid_coordinates, chunk_size=7)
+    )
+    assert np.allclose(resample_image(source, **kwargs).get_fdata(), expected, atol=1e-4)
+    assert np.allclose(
+        resample_image(source, mask=mask, compact=True, **kwargs), expected_masked, atol=1e-4
+    )
+
+
+def test_target_mask():
+    target = nb.Nifti1Image(np.zeros((10, 10, 10), dtype='u1'), np.diag([3.0, 3.0, 3.0, 1.0]))
+    # A one-voxel thick sheet at 1mm, thinner than the target voxels
+    sheet = np.zeros((30, 30, 30), dtype='u1')
+    sheet[:, :, 14] = 1
+    mask = target_mask(nb.Nifti1Image(sheet, np.eye(4)), target)
+    assert mask[:, :, 5].all()
+    assert mask.sum() == 100
+
+    dilated = target_mask(nb.Nifti1Image(sheet, np.eye(4)), target, dilation=1)
+    assert dilated[:, :, 4:7].all()
+    assert dilated.sum() == 300
+
+
+def test_ResampleSeries_mask(tmp_path):
+    rng = np.random.default_rng(3)
+    in_file = str(tmp_path / 'bold.nii.gz')
+    source = _series(rng)
+    source.header.set_zooms((2.0, 2.0, 2.5, 1.5))
+    source.to_filename(in_file)
+    mask = np.zeros(source.shape[:3], dtype='u1')
+    mask[3:7, 4:8, 2:6] = 1
+    mask_file = str(tmp_path / 'mask.nii.gz')
+    nb.Nifti1Image(mask, source.affine).to_filename(mask_file)
+
+    kwargs = {'in_file': in_file, 'ref_file': in_file, 'jacobian': False}
+    full = nb.load(ResampleSeries(**kwargs).run(cwd=tmp_path).outputs.out_file)
+    result = ResampleSeries(mask_file=mask_file, mask_dilation=1, **kwargs).run(cwd=tmp_path)
+    masked = nb.load(result.outputs.out_file)
+
+    assert masked.shape == full.shape
+    assert masked.header.get_zooms() == full.header.get_zooms()
+    assert np.allclose(masked.affine, full.affine)
+
+    roi = target_mask(nb.load(mask_file), source, dilation=1)
+    assert roi.sum() > mask.sum()
+    masked_data, full_data = masked.get_fdata(), full.get_fdata()
+    assert np.allclose(masked_data[roi], full_data[roi])
+    assert not masked_data[~roi].any()
+
+
+@pytest.mark.parametrize('dtype', ['int16', 'uint16'])
+@pytest.mark.parametrize('masked', [True, False])
+def test_ResampleSeries_quantize(tmp_path, dtype, masked):
+    rng = np.random.default_rng(4)
+    in_file = str(tmp_path / 'bold.nii.gz')
+    source = _series(rng, nvols=6)
+    source.header.set_zooms((2.0, 2.0, 2.5, 1.5))
+    source.to_filename(in_file)
+    kwargs = {'in_file': in_file, 'ref_file': in_file, 'jacobian': False}
+    if masked:
+        mask = np.zeros(source.shape[:3], dtype='u1')
+        mask[3:7, 4:8, 2:6] = 1
+        kwargs['mask_file'] = str(tmp_path / 'mask.nii.gz')
+        nb.Nifti1Image(mask, source.affine).to_filename(kwargs['mask_file'])
+
+    result = ResampleSeries(**kwargs).run(cwd=tmp_path)
+    expected = nb.load(result.outputs.out_file).get_fdata()
+    assert result.outputs.out_meta == {}
+
+    result = ResampleSeries(quantize=dtype, **kwargs).run(cwd=tmp_path)
+    img = nb.load(result.outputs.out_file)
+    meta = result.outputs.out_meta['Quantization']
+    assert img.get_data_dtype() == np.dtype(dtype)
+    assert img.header.get_zooms() == (2.0, 2.0, 2.5, 1.5)
+    assert np.allclose(
+        (img.dataobj.slope, img.dataobj.inter), (meta['ScaleSlope'], meta['ScaleIntercept'])
+    )
+
+    # The reported error is the error of the stored values, within the hard bound
+    error = np.abs(img.get_fdata() - expected)
+    assert np.isclose(error.max(), meta['MaxAbsoluteError'], atol=1e-6)
+    assert meta['MaxAbsoluteError'] <= meta['ErrorBound']
+    assert meta['MaxAbsoluteError'] <= meta['ScaleSlope'] / 2 * 1.001
+    if masked:
+        assert error[expected == 0].max() < 1e-3
+
+    # Series that cannot be quantized within tolerance are stored as float32
+    result = ResampleSeries(quantize=dtype, quantize_tolerance=1e-9, **kwargs).run(cwd=tmp_path)
+    img = nb.load(result.outputs.out_file)
+    assert img.get_data_dtype() == np.float32
+    assert result.outputs.out_meta == {}
+    assert np.allclose(img.get_fdata(), expected)
+
+
+@pytest.mark.parametrize('hmc', [True, False])
+@pytest.mark.parametrize('masked', [True, False])
+def test_resample_series_invariant(hmc, masked):
+    from fmriprep.interfaces.resampling import resample_series, resample_vol
+
+    rng = np.random.default_rng(3)
+    data = rng.uniform(100, 200, (10, 12, 8, 4)).astype('f4')
+    coordinates = (np.indices((9, 11, 8)) + rng.uniform(-0.5, 0.5, (3, 9, 11, 8))).astype('f4')
+    fmap_hz = rng.normal(0, 20, (9, 11, 8)).astype('f4')
+    hmc_xfms = (
+        [nb.affines.from_matvec(np.eye(3), shift) for shift in rng.normal(0, 0.5, (4, 3))]
+        if hmc
+        else None
+    )
+    mask = None
+    if masked:
+        mask = np.zeros((9, 11, 8), dtype=bool)
+        mask[2:6, 3:9, 1:7] = True
+        coordinates = coordinates[:, mask]
+
+    kwargs = {
+        'jacobian': True,
+        'hmc_xfms': hmc_xfms,
+        'fmap_hz': fmap_hz,
+        'mask': mask,
+        'output_dtype': 'f4',
+    }
+    expected = np.stack(
+        [
+            resample_vol(
+                data[..., i],
+                coordinates,
+                (1, 0.03),
+                True,
+                hmc_xfms[i] if hmc else None,
+                fmap_hz,
+                np.float32,
+                mask=mask,
+            )
+            for i in range(4)
+        ],
+        axis=-1,
+    )
+    coords_before = coordinates.copy()
+
+    # The same distortion for all volumes is only calculated once
+    invariant = resample_series(data, coordinates, [(1, 0.03)] * 4, **kwargs)
+    assert np.array_equal(invariant, expected)
+    # Per-volume distortions
+    variable = resample_series(data, coordinates, [(1, 0.03)] * 3 + [(1, 0.0)], **kwargs)
+    assert np.array_equal(variable[..., :3], expected[..., :3])
+    assert not np.array_equal(variable[..., 3], expected[..., 3])
+    # Coordinates are never modified in place
+    assert np.array_equal(coordinates, coords_before)
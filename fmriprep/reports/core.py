@@ -20,6 +20,7 @@
 #
 #     https://www.nipreps.org/community/licensing/
 #
+import time
 from pathlib import Path
 
 from nireports.assembler.report import Report
@@ -67,26 +68,139 @@ def run_reports(
     return None
 
 
-def generate_reports(
-    subject_list: list[str] | str,
+def report_fingerprint(
+    output_dir,
+    subject_label,
+    run_uuid,
+    bootstrap_file=None,
+    out_filename='report.html',
+    reportlets_dir=None,
+    **entities,
+):
+    """
+    Describe the inputs a report is generated from.
+
+    The fingerprint records the size and checksum of every reportlet of the
+    subject, of the boilerplate and of the crashfiles of this run,
+    together with the contents of the bootstrap file and the versions of the
+    software assembling the report.
+    Two reports with equal fingerprints are rendered from the same inputs.
+    Checksums are used rather than modification times because the report
+    assembler rewrites the reportlets it places in the output directory.
+    """
+    import hashlib
+
+    import nireports
+
+    from .. import __version__
+
+    output_dir = Path(output_dir)
+    roots = {
+        'reportlets': Path(reportlets_dir or output_dir) / f'sub-{subject_label}' / 'figures',
+        'logs': output_dir / 'logs',
+        'crashfiles': output_dir / f'sub-{subject_label}' / 'log' / run_uuid,
+    }
+    patterns = {'reportlets': '*', 'logs': 'CITATION.*', 'crashfiles': 'crash*'}
+
+    inputs = {}
+    for key, root in roots.items():
+        for path in sorted(root.rglob(patterns[key]) if root.is_dir() else []):
+            if path.is_file():
+                inputs[f'{key}/{path.relative_to(root)}'] = [
+                    path.stat().st_size,
+                    hashlib.sha256(path.read_bytes()).hexdigest(),
+                ]
+
+    bootstrap_file = Path(bootstrap_file) if bootstrap_file is not None else None
+    return {
+        'report': report_path(output_dir, out_filename, **entities).name,
+        'entities': entities,
+        'versions': {'fmriprep': __version__, 'nireports': nireports.__version__},
+        'bootstrap': (
+            hashlib.sha256(bootstrap_file.read_bytes()).hexdigest()
+            if bootstrap_file is not None
+            else None
+        ),
+        'inputs': inputs,
+    }
+
+
+def report_path(output_dir, out_filename='report.html', **entities):
+    """
+    Calculate the path where :class:`~nireports.assembler.report.Report` writes out.
+
+    >>> str(report_path('/out', subject='01'))
+    '/out/sub-01.html'
+    >>> str(report_path('/out', 'sub-01_ses-A_func.html', subject='01', session='A'))
+    '/out/sub-01_ses-A_func.html'
+
+    """
+    from bids.layout.writing import build_path
+    from nireports.assembler.report import OUTPUT_NAME_PATTERN
+
+    if entities and out_filename == 'report.html':
+        out_filename = build_path(entities, OUTPUT_NAME_PATTERN)
+    return Path(output_dir) / out_filename
+
+
+def fingerprint_path(out_file):
+    """
+    Calculate the path of the fingerprint manifest next to a report.
+
+    >>> str(fingerprint_path('/out/sub-01_anat.html'))
+    '/out/sub-01_anat.fingerprint.json'
+
+    """
+    return Path(out_file).with_suffix('.fingerprint.json')
+
+
+def _run_report_job(job, incremental=False):
+    """
+    Run a single report job.
+
+    Returns the failed subject (if any), the elapsed time, and whether the report
+    was skipped because its fingerprint manifest is up to date.
+    """
+    import json
+
+    tic = time.perf_counter()
+    manifest = None
+    fingerprint_args = {k: v for k, v in job.items() if k != 'errorname'}
+    if incremental:
+        fingerprint = report_fingerprint(**fingerprint_args)
+        out_file = Path(job['output_dir']) / fingerprint['report']
+        manifest = fingerprint_path(out_file)
+        try:
+            if out_file.exists() and json.loads(manifest.read_text()) == fingerprint:
+                return None, time.perf_counter() - tic, True
+        except (OSError, ValueError):
+            pass
+        # Never leave a stale manifest behind if generation fails
+        manifest.unlink(missing_ok=True)
+
+    report_error = run_reports(**job)
+    if manifest is not None and report_error is None:
+        # The assembler rewrites the reportlets in place, so describe them as left
+        manifest.write_text(json.dumps(report_fingerprint(**fingerprint_args), indent=2))
+    return report_error, time.perf_counter() - tic, False
+
+
+def _run_subject_report_jobs(jobs, incremental=False):
+    """Run the report jobs of a subject serially (see :func:`_run_report_job`)."""
+    return [_run_report_job(job, incremental) for job in jobs]
+
+
+def _plan_reports(
+    subject_list: list[str],
     output_dir: Path | str,
     run_uuid: str,
-    session_list: list[str] | str | None = None,
+    session_list: list[str] | None = None,
     bootstrap_file: Path | str | None = None,
-    work_dir: Path | str | None = None,
+    reportlets_dir: Path | None = None,
     sessionwise: bool = False,
 ):
-    """Generate reports for a list of subjects."""
-    reportlets_dir = None
-    if work_dir is not None:
-        reportlets_dir = Path(work_dir) / 'reportlets'
-
-    if isinstance(subject_list, str):
-        subject_list = [subject_list]
-    if isinstance(session_list, str):
-        session_list = [session_list]
-
-    errors = []
+    """Calculate the keyword arguments to :func:`run_reports` for every report."""
+    jobs = []
     for subject_label in subject_list:
         subject_label = subject_label.removeprefix('sub-')
         # The number of sessions is intentionally not based on session_list but
@@ -96,65 +210,153 @@ def generate_reports(
 
         if bootstrap_file is not None:
             # If a config file is precised, we do not override it
+            subject_bootstrap = bootstrap_file
             html_report = 'report.html'
         elif n_ses <= config.execution.aggr_ses_reports:
             # If there are only a few session for this subject,
             # we aggregate them in a single visual report.
-            bootstrap_file = data.load('reports-spec.yml')
+            subject_bootstrap = data.load('reports-spec.yml')
             html_report = 'report.html'
         else:
             # Beyond a threshold, we separate the anatomical report from the functional.
-            bootstrap_file = data.load('reports-spec-anat.yml')
+            subject_bootstrap = data.load('reports-spec-anat.yml')
             html_report = f'sub-{subject_label}_anat.html'
 
         if not sessionwise:
-            report_error = run_reports(
-                output_dir,
-                subject_label,
-                run_uuid,
-                bootstrap_file=bootstrap_file,
-                out_filename=html_report,
-                reportlets_dir=reportlets_dir,
-                errorname=f'report-{run_uuid}-{subject_label}.err',
-                subject=subject_label,
+            jobs.append(
+                {
+                    'output_dir': output_dir,
+                    'subject_label': subject_label,
+                    'run_uuid': run_uuid,
+                    'bootstrap_file': subject_bootstrap,
+                    'out_filename': html_report,
+                    'reportlets_dir': reportlets_dir,
+                    'errorname': f'report-{run_uuid}-{subject_label}.err',
+                    'subject': subject_label,
+                }
             )
-            # If the report generation failed, append the subject label for which it failed
-            if report_error is not None:
-                errors.append(report_error)
 
         if (n_ses > config.execution.aggr_ses_reports) or sessionwise:
             # Beyond a certain number of sessions per subject,
             # we separate the functional reports per session
-            if session_list is None:
+            subject_sessions = session_list
+            if subject_sessions is None:
                 all_filters = config.execution.bids_filters or {}
                 filters = all_filters.get('bold', {})
-                session_list = config.execution.layout.get_sessions(
+                subject_sessions = config.execution.layout.get_sessions(
                     subject=subject_label, **filters
                 )
 
-            for session_label in session_list:
+            for session_label in subject_sessions:
                 session_label = session_label.removeprefix('ses-')
                 if sessionwise:
                     # Include the anatomical as well
-                    bootstrap_file = data.load('reports-spec.yml')
+                    session_bootstrap = data.load('reports-spec.yml')
                     html_report = f'sub-{subject_label}_ses-{session_label}.html'
                 else:
-                    bootstrap_file = data.load('reports-spec-func.yml')
+                    session_bootstrap = data.load('reports-spec-func.yml')
                     html_report = f'sub-{subject_label}_ses-{session_label}_func.html'
 
-                report_error = run_reports(
-                    output_dir,
-                    subject_label,
-                    run_uuid,
-                    bootstrap_file=bootstrap_file,
-                    out_filename=html_report,
-                    reportlets_dir=reportlets_dir,
-                    errorname=f'report-{run_uuid}-{subject_label}-func.err',
-                    subject=subject_label,
-                    session=session_label,
+                jobs.append(
+                    {
+                        'output_dir': output_dir,
+                        'subject_label': subject_label,
+                        'run_uuid': run_uuid,
+                        'bootstrap_file': session_bootstrap,
+                        'out_filename': html_report,
+                        'reportlets_dir': reportlets_dir,
+                        'errorname': f'report-{run_uuid}-{subject_label}-func.err',
+                        'subject': subject_label,
+                        'session': session_label,
+                    }
                 )
-                # If the report generation failed, append the subject label for which it failed
-                if report_error is not None:
-                    errors.append(report_error)
+    return jobs
+
+
+def generate_reports(
+    subject_list: list[str] | str,
+    output_dir: Path | str,
+    run_uuid: str,
+    session_list: list[str] | str | None = None,
+    bootstrap_file: Path | str | None = None,
+    work_dir: Path | str | None = None,
+    sessionwise: bool = False,
+    n_procs: int | None = None,
+    incremental: bool = False,
+):
+    """
+    Generate reports for a list of subjects.
+
+    Reports are generated serially, unless ``n_procs`` is larger than one,
+    in which case subjects are distributed over a pool of worker processes.
+    The reports of a subject are generated one after the other, because the
+    report assembler rewrites the reportlets they share.
+    Failures are isolated per report, and the list of subjects for which
+    any report failed is returned.
+
+    With ``incremental``, a fingerprint manifest (see :func:`report_fingerprint`)
+    is stored next to each report, and reports whose manifest matches
+    their current inputs are not regenerated.
+    """
+    reportlets_dir = None
+    if work_dir is not None:
+        reportlets_dir = Path(work_dir) / 'reportlets'
+
+    if isinstance(subject_list, str):
+        subject_list = [subject_list]
+    if isinstance(session_list, str):
+        session_list = [session_list]
+
+    jobs = _plan_reports(
+        subject_list,
+        output_dir,
+        run_uuid,
+        session_list=session_list,
+        bootstrap_file=bootstrap_file,
+        reportlets_dir=reportlets_dir,
+        sessionwise=sessionwise,
+    )
+
+    subject_jobs = {}
+    for job in jobs:
+        subject_jobs.setdefault(job['subject_label'], []).append(job)
+    jobs = [job for group in subject_jobs.values() for job in group]
+
+    n_procs = min(n_procs or 1, len(subject_jobs))
+    if n_procs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=n_procs) as pool:
+            futures = [
+                pool.submit(_run_subject_report_jobs, group, incremental)
+                for group in subject_jobs.values()
+            ]
+            results = []
+            for (subject_label, group), future in zip(subject_jobs.items(), futures, strict=True):
+                try:
+                    results.extend(future.result())
+                except Exception as e:  # noqa: BLE001
+                    # The worker died before run_reports could record the failure
+                    config.loggers.cli.error(
+                        f'Generating the reports of sub-{subject_label} crashed a report worker: {e}'
+                    )
+                    results.extend((subject_label, float('nan'), False) for _ in group)
+    else:
+        results = (_run_report_job(job, incremental) for job in jobs)
+
+    errors = []
+    for job, (report_error, elapsed, skipped) in zip(jobs, results, strict=True):
+        if skipped:
+            config.loggers.cli.info(
+                f'Report {job["out_filename"]} is up to date (checked in {elapsed:.2f}s).'
+            )
+            continue
+        config.loggers.cli.info(
+            f'Report {job["out_filename"]} ({"failed" if report_error else "done"}) '
+            f'generated in {elapsed:.2f}s.'
+        )
+        # If the report generation failed, append the subject label for which it failed
+        if report_error is not None:
+            errors.append(report_error)
 
     return errors
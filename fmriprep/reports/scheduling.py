@@ -0,0 +1,428 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Analysis of the schedule of a traced run.
+
+The node spans and execution graphs recorded with ``--trace``
+(see :mod:`fmriprep.engine.tracing`) are combined to find, for each subject:
+
+* the critical path: the chain of dependent nodes with the longest total
+  runtime, which bounds the wall time of the subject however many
+  processors are available;
+* the slack of each stage (a sub-workflow of the subject's workflow), i.e.,
+  how much longer its nodes could have run without lengthening the critical
+  path;
+* the time each node on the critical path waited after its inputs were ready,
+  which is lost to the scheduler or to the lack of free processors.
+
+The CPU utilization of the run over time is estimated by spreading the CPU
+time of every node evenly over its execution.
+
+>>> summary = analyze_runtime(
+...     {
+...         'wf.sub_01_wf.anat_wf.a': {'start': 0.0, 'end': 4.0, 'cpu_s': 4.0},
+...         'wf.sub_01_wf.bold_wf.b': {'start': 4.0, 'end': 6.0, 'cpu_s': 2.0},
+...         'wf.sub_01_wf.bold_wf.c': {'start': 0.0, 'end': 1.0, 'cpu_s': 1.0},
+...         'wf.sub_01_wf.bold_wf.d': {'start': 2.0, 'end': 3.0, 'cpu_s': 1.0},
+...     },
+...     [
+...         ('wf.sub_01_wf.anat_wf.a', 'wf.sub_01_wf.bold_wf.b'),
+...         ('wf.sub_01_wf.bold_wf.c', 'wf.sub_01_wf.bold_wf.d'),
+...     ],
+...     nprocs=2,
+...     nbins=3,
+... )
+>>> summary['cpu_utilization']
+0.6667
+>>> [bin['utilization'] for bin in summary['timeline']]
+[0.75, 0.75, 0.5]
+>>> subject = summary['subjects']['01']
+>>> subject['critical_path_s'], [step['node'] for step in subject['critical_path']]
+(6.0, ['anat_wf.a', 'bold_wf.b'])
+>>> [(stage['stage'], stage['slack_s']) for stage in subject['stages']]
+[('anat_wf', 0.0), ('bold_wf', 0.0)]
+>>> subject['slack']['bold_wf.d'], subject['critical_path'][1]['wait_s']
+(4.0, 0.0)
+
+"""
+
+import json
+import re
+from collections import defaultdict
+from html import escape
+from pathlib import Path
+
+from ..utils import tracing
+
+SUBJECT_WF = re.compile(r'^sub_(?P<subject>[a-zA-Z0-9]+)(?:_ses_[a-zA-Z0-9]+)?_wf$')
+"""Name of the workflow of a subject (see :func:`~fmriprep.workflows.base.init_fmriprep_wf`)."""
+
+STAGE_DEPTH = 2
+"""Number of levels of sub-workflows (below the subject's) that define a stage."""
+
+TIMELINE_BINS = 60
+"""Number of intervals the CPU utilization of a run is reported over."""
+
+REPORT_TEMPLATE = """\
+\t<ul class="elem-desc">
+\t\t<li>Run: {run_uuid} ({nprocs:d} processors)</li>
+\t\t<li>Wall time of the run: {makespan}; mean CPU utilization: {cpu_utilization:.0%}</li>
+\t\t<li>Wall time of the subject: {subject_makespan}; \
+critical path: {critical_path} ({critical_ratio:.0%} of the wall time)</li>
+\t\t<li>Waiting along the critical path: {wait}</li>
+\t</ul>
+\t<details open>
+\t<summary>Critical path</summary>
+\t<table class="table table-sm">
+\t\t<tr><th>Node</th><th>Started</th><th>Runtime</th><th>Waited</th></tr>
+{path_rows}
+\t</table>
+\t</details>
+\t<details>
+\t<summary>Stages, by slack</summary>
+\t<table class="table table-sm">
+\t\t<tr><th>Stage</th><th>Nodes</th><th>Runtime</th><th>CPU time</th><th>Slack</th></tr>
+{stage_rows}
+\t</table>
+\t</details>
+\t<details>
+\t<summary>CPU utilization over time</summary>
+{timeline}
+\t</details>
+"""
+
+
+def load_runtime(trace_dir):
+    """
+    Read the runtime of nodes, and the dependencies between them, from a trace directory.
+
+    Returns
+    -------
+    runtime : dict
+        Start and end times (in seconds since the epoch), CPU time and whether
+        the node was found cached, by full name of the node.
+        Only the last execution of each node is kept.
+    edges : list of tuple
+        Dependencies between nodes, by full name.
+    """
+    nodes, edges = set(), set()
+    for graph_file in sorted(Path(trace_dir).glob('graph-*.json')):
+        graph = json.loads(graph_file.read_text())
+        nodes.update(graph['nodes'])
+        edges.update(tuple(edge) for edge in graph['edges'])
+
+    runtime = {}
+    for span in tracing.load_spans(trace_dir, cat='node'):
+        name = span['args'].get('node')
+        # Skip spans nested within nodes, and the subnodes of MapNodes
+        if name is None or (nodes and name not in nodes):
+            continue
+        runtime[name] = {
+            'start': span['ts'] / 1e6,
+            'end': (span['ts'] + span['dur']) / 1e6,
+            'cpu_s': span['args'].get('cpu_s', 0.0),
+            'cached': span['args'].get('cached', False),
+        }
+    return runtime, sorted(edges)
+
+
+def split_name(fullname, depth=STAGE_DEPTH):
+    """
+    Find the subject and the stage of a node from its full name.
+
+    >>> split_name('fmriprep_wf.sub_01_ses_A_wf.bold_task_rest_wf.bold_fit_wf.hmc_wf.mcflirt')
+    ('01', 'bold_task_rest_wf.bold_fit_wf', 'bold_task_rest_wf.bold_fit_wf.hmc_wf.mcflirt')
+    >>> split_name('fmriprep_wf.sub_01_wf.ds_report_about')
+    ('01', 'sub_01_wf', 'ds_report_about')
+    >>> split_name('wf.node')
+    (None, 'wf', 'wf.node')
+
+    """
+    parts = fullname.split('.')
+    for i, part in enumerate(parts[:-1]):
+        if match := SUBJECT_WF.match(part):
+            workflows = parts[i + 1 : -1]
+            stage = '.'.join(workflows[:depth]) or part
+            return match['subject'], stage, '.'.join(parts[i + 1 :])
+    return None, '.'.join(parts[:-1][:depth]), fullname
+
+
+def critical_path(durations, edges):
+    """
+    Find the critical path of a graph of tasks of known durations.
+
+    Returns
+    -------
+    length : float
+        The total duration of the critical path.
+    path : list
+        The tasks on the critical path, in order of execution.
+    earliest : dict
+        The earliest time each task could start at, after its dependencies.
+    slack : dict
+        How much each task could be delayed without delaying the critical path.
+
+    >>> critical_path({'a': 2, 'b': 1, 'c': 2}, [('a', 'c'), ('b', 'c')])
+    (4, ['a', 'c'], {'a': 0, 'b': 0, 'c': 2}, {'a': 0, 'b': 1, 'c': 0})
+
+    """
+    preds, succs = defaultdict(list), defaultdict(list)
+    for src, dst in edges:
+        if src in durations and dst in durations:
+            preds[dst].append(src)
+            succs[src].append(dst)
+
+    # Topological order (Kahn's algorithm)
+    indegree = {task: len(preds[task]) for task in durations}
+    order = [task for task, degree in indegree.items() if not degree]
+    for task in order:
+        for succ in succs[task]:
+            indegree[succ] -= 1
+            if not indegree[succ]:
+                order.append(succ)
+
+    earliest = {}
+    for task in order:
+        earliest[task] = max((earliest[p] + durations[p] for p in preds[task]), default=0)
+    length = max((earliest[t] + durations[t] for t in order), default=0)
+
+    latest = {}
+    for task in reversed(order):
+        latest[task] = min((latest[s] for s in succs[task]), default=length) - durations[task]
+    slack = {task: latest[task] - earliest[task] for task in order}
+
+    path = []
+    if order:
+        task = max(order, key=lambda t: earliest[t] + durations[t])
+        while True:
+            path.append(task)
+            if not preds[task]:
+                break
+            task = max(preds[task], key=lambda p: earliest[p] + durations[p])
+    return length, path[::-1], earliest, slack
+
+
+def cpu_timeline(runtime, nprocs, nbins=TIMELINE_BINS):
+    """
+    Estimate the number of running nodes and the CPU utilization over time.
+
+    The CPU time of every node is spread evenly over its execution.
+    """
+    if not runtime:
+        return []
+    t0 = min(node['start'] for node in runtime.values())
+    t1 = max(node['end'] for node in runtime.values())
+    width = (t1 - t0) / nbins or 1.0
+
+    running, cpu = [0.0] * nbins, [0.0] * nbins
+    for node in runtime.values():
+        duration = node['end'] - node['start']
+        first = min(int((node['start'] - t0) / width), nbins - 1)
+        last = min(int((node['end'] - t0) / width), nbins - 1)
+        for i in range(first, last + 1):
+            overlap = min(node['end'], t0 + (i + 1) * width) - max(node['start'], t0 + i * width)
+            if overlap <= 0 or duration <= 0:
+                continue
+            running[i] += overlap / width
+            cpu[i] += node['cpu_s'] * overlap / duration / width
+
+    return [
+        {
+            'start_s': round(i * width, 3),
+            'running': round(running[i], 3),
+            'utilization': round(cpu[i] / nprocs, 4),
+        }
+        for i in range(nbins)
+    ]
+
+
+def analyze_runtime(runtime, edges, nprocs, depth=STAGE_DEPTH, nbins=TIMELINE_BINS):
+    """
+    Analyze the schedule of a run (see :func:`load_runtime`).
+
+    Returns a dictionary with the wall time (``makespan_s``), mean CPU
+    utilization and timeline (see :func:`cpu_timeline`) of the run, and,
+    for each subject, the critical path, the slack of each stage (sorted
+    by slack, then by runtime) and the slack of each node.
+    """
+    nprocs = max(int(nprocs), 1)
+    summary = {
+        'nprocs': nprocs,
+        'makespan_s': 0.0,
+        'cpu_utilization': 0.0,
+        'timeline': cpu_timeline(runtime, nprocs, nbins=nbins),
+        'subjects': {},
+    }
+    if not runtime:
+        return summary
+
+    t0 = min(node['start'] for node in runtime.values())
+    makespan = max(node['end'] for node in runtime.values()) - t0
+    summary['makespan_s'] = round(makespan, 3)
+    summary['cpu_utilization'] = round(
+        sum(node['cpu_s'] for node in runtime.values()) / ((makespan or 1.0) * nprocs), 4
+    )
+
+    by_subject = defaultdict(dict)
+    for fullname, node in runtime.items():
+        subject, stage, name = split_name(fullname, depth=depth)
+        by_subject[subject][name] = dict(node, stage=stage, fullname=fullname)
+
+    preds = defaultdict(list)
+    for src, dst in edges:
+        preds[dst].append(src)
+
+    for subject, nodes in by_subject.items():
+        if subject is None:
+            continue
+        local = {node['fullname']: name for name, node in nodes.items()}
+        durations = {name: node['end'] - node['start'] for name, node in nodes.items()}
+        sub_edges = [(local[s], local[d]) for s, d in edges if s in local and d in local]
+        length, path, _, slack = critical_path(durations, sub_edges)
+        sub_start = min(node['start'] for node in nodes.values())
+
+        steps = []
+        for name in path:
+            node = nodes[name]
+            ready = max(
+                (runtime[p]['end'] for p in preds[node['fullname']] if p in runtime),
+                default=sub_start,
+            )
+            steps.append(
+                {
+                    'node': name,
+                    'stage': node['stage'],
+                    'start_s': round(node['start'] - sub_start, 3),
+                    'duration_s': round(durations[name], 3),
+                    'wait_s': round(max(node['start'] - ready, 0.0), 3),
+                    'cached': node.get('cached', False),
+                }
+            )
+
+        stages = defaultdict(lambda: {'nodes': 0, 'duration_s': 0.0, 'cpu_s': 0.0, 'slack_s': []})
+        for name, node in nodes.items():
+            stage = stages[node['stage']]
+            stage['nodes'] += 1
+            stage['duration_s'] += durations[name]
+            stage['cpu_s'] += node['cpu_s']
+            stage['slack_s'].append(slack[name])
+
+        summary['subjects'][subject] = {
+            'makespan_s': round(max(node['end'] for node in nodes.values()) - sub_start, 3),
+            'critical_path_s': round(length, 3),
+            'critical_path': steps,
+            'stages': sorted(
+                (
+                    {
+                        'stage': name,
+                        'nodes': stage['nodes'],
+                        'duration_s': round(stage['duration_s'], 3),
+                        'cpu_s': round(stage['cpu_s'], 3),
+                        'slack_s': round(min(stage['slack_s']), 3),
+                    }
+                    for name, stage in stages.items()
+                ),
+                key=lambda stage: (stage['slack_s'], -stage['duration_s']),
+            ),
+            'slack': {name: round(value, 3) for name, value in slack.items()},
+        }
+    return summary
+
+
+def _fmt_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f'{hours:d}:{minutes:02d}:{seconds:04.1f}'
+
+
+def _timeline_svg(timeline, width=600, height=80):
+    """Draw the CPU utilization over time as an inline SVG bar chart."""
+    if not timeline:
+        return ''
+    step = width / len(timeline)
+    bars = ''.join(
+        f'<rect x="{i * step:.1f}" y="{height * (1 - min(b["utilization"], 1)):.1f}" '
+        f'width="{step:.1f}" height="{height * min(b["utilization"], 1):.1f}" fill="#4682b4">'
+        f'<title>{_fmt_time(b["start_s"])}: {b["utilization"]:.0%} CPU, '
+        f'{b["running"]:.1f} nodes running</title></rect>'
+        for i, b in enumerate(timeline)
+    )
+    return (
+        f'\t<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+        f'style="border: 1px solid #ccc">{bars}</svg>'
+    )
+
+
+def render_report(summary, subject, run_uuid):
+    """Render the analysis of a subject's schedule as an HTML reportlet."""
+    sub = summary['subjects'][subject]
+    path_rows = '\n'.join(
+        f'\t\t<tr><td><code>{escape(step["node"])}</code>{" (cached)" * step["cached"]}</td>'
+        f'<td>{_fmt_time(step["start_s"])}</td><td>{_fmt_time(step["duration_s"])}</td>'
+        f'<td>{_fmt_time(step["wait_s"])}</td></tr>'
+        for step in sub['critical_path']
+    )
+    stage_rows = '\n'.join(
+        f'\t\t<tr><td><code>{escape(stage["stage"])}</code></td><td>{stage["nodes"]}</td>'
+        f'<td>{_fmt_time(stage["duration_s"])}</td><td>{_fmt_time(stage["cpu_s"])}</td>'
+        f'<td>{_fmt_time(stage["slack_s"])}</td></tr>'
+        for stage in sub['stages']
+    )
+    return REPORT_TEMPLATE.format(
+        run_uuid=escape(run_uuid),
+        nprocs=summary['nprocs'],
+        makespan=_fmt_time(summary['makespan_s']),
+        cpu_utilization=summary['cpu_utilization'],
+        subject_makespan=_fmt_time(sub['makespan_s']),
+        critical_path=_fmt_time(sub['critical_path_s']),
+        critical_ratio=sub['critical_path_s'] / (sub['makespan_s'] or 1.0),
+        wait=_fmt_time(sum(step['wait_s'] for step in sub['critical_path'])),
+        path_rows=path_rows,
+        stage_rows=stage_rows,
+        timeline=_timeline_svg(summary['timeline']),
+    )
+
+
+def write_scheduling_report(trace_dir, output_dir, run_uuid, nprocs):
+    """
+    Analyze the schedule of a traced run, and write out the results.
+
+    The analysis is stored as ``scheduling.json`` next to the trace directory,
+    and a reportlet (``sub-<label>_desc-scheduling_T1w.html``) is written
+    into the figures of each subject, for :func:`~fmriprep.reports.core.generate_reports`
+    to include in the *About* section.
+
+    Returns the analysis (see :func:`analyze_runtime`).
+    """
+    trace_dir = Path(trace_dir)
+    runtime, edges = load_runtime(trace_dir)
+    summary = analyze_runtime(runtime, edges, nprocs)
+    (trace_dir.parent / 'scheduling.json').write_text(json.dumps(summary, indent=2))
+
+    for subject in summary['subjects']:
+        figures_dir = Path(output_dir) / f'sub-{subject}' / 'figures'
+        figures_dir.mkdir(parents=True, exist_ok=True)
+        (figures_dir / f'sub-{subject}_desc-scheduling_T1w.html').write_text(
+            render_report(summary, subject, run_uuid)
+        )
+    return summary
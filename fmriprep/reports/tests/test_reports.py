@@ -109,3 +109,93 @@ def test_ReportSeparation(
         assert 'One or more execution steps failed' in html_content, (
             f'The file {expected_files[0]} did not contain the reported error.'
         )
+
+
+@pytest.mark.skipif(
+    not Path.exists(data_dir / 'work'),
+    reason='Package installed - large test data directory excluded from wheel',
+)
+def test_generate_reports_parallel(tmp_path, monkeypatch):
+    fake_uuid = 'fake_uuid'
+    for subject in ('001', '002'):
+        figures = tmp_path / f'sub-{subject}' / 'figures'
+        figures.mkdir(parents=True)
+        for reportlet in (data_dir / 'work/reportlets/fmriprep/sub-001/figures').iterdir():
+            shutil.copy(reportlet, figures / reportlet.name.replace('sub-001', f'sub-{subject}'))
+
+    monkeypatch.setattr(config.execution, 'aggr_ses_reports', 3)
+    config.execution.layout = BIDSLayout(data_dir / 'ds000005')
+    monkeypatch.setattr(
+        config.execution.layout, 'get_sessions', lambda *a, **kw: ['001', '003', '004', '005']
+    )
+    monkeypatch.setattr(config.execution, 'bids_filters', None)
+
+    # Subjects are distributed over the pool, the reports of each one run serially
+    failed_reports = generate_reports(['001', '002'], tmp_path, fake_uuid, n_procs=2)
+
+    assert not failed_reports
+    assert {file.name for file in tmp_path.glob('*.html')} == {
+        f'sub-{subject}_{suffix}.html'
+        for subject in ('001', '002')
+        for suffix in ('anat', 'ses-001_func', 'ses-003_func', 'ses-004_func', 'ses-005_func')
+    }
+
+
+@pytest.mark.skipif(
+    not Path.exists(data_dir / 'work'),
+    reason='Package installed - large test data directory excluded from wheel',
+)
+def test_generate_reports_incremental(tmp_path, monkeypatch):
+    fake_uuid = 'fake_uuid'
+    sub_dir = tmp_path / 'sub-001'
+    shutil.copytree(data_dir / 'work/reportlets/fmriprep/sub-001', sub_dir)
+
+    monkeypatch.setattr(config.execution, 'aggr_ses_reports', 4)
+    config.execution.layout = BIDSLayout(data_dir / 'ds000005')
+
+    assert not generate_reports(['001'], tmp_path, fake_uuid, incremental=True)
+    report = tmp_path / 'sub-001.html'
+    manifest = tmp_path / 'sub-001.fingerprint.json'
+    assert manifest.is_file()
+    mtime = report.stat().st_mtime_ns
+
+    # Nothing changed - the report is not regenerated
+    assert not generate_reports(['001'], tmp_path, 'another_uuid', incremental=True)
+    assert report.stat().st_mtime_ns == mtime
+
+    # A crashfile from the current run must show up in the report
+    run_log_dir = sub_dir / 'log' / 'another_uuid'
+    run_log_dir.mkdir(parents=True)
+    crash_file = next(data_dir.glob('crash_files/crash*.txt'))
+    shutil.copy2(crash_file, run_log_dir / crash_file.name)
+
+    assert not generate_reports(['001'], tmp_path, 'another_uuid', incremental=True)
+    assert report.stat().st_mtime_ns != mtime
+    assert 'One or more execution steps failed' in report.read_text()
+
+
+@pytest.mark.skipif(
+    not Path.exists(data_dir / 'work'),
+    reason='Package installed - large test data directory excluded from wheel',
+)
+def test_generate_reports_incremental_raw_svg(tmp_path, monkeypatch):
+    sub_dir = tmp_path / 'sub-001'
+    shutil.copytree(data_dir / 'work/reportlets/fmriprep/sub-001', sub_dir)
+    # Reportlets as written by the workflow, before the assembler rewrites them
+    (sub_dir / 'figures' / 'sub-001_dseg.svg').write_text(
+        '<?xml version="1.0" encoding="utf-8" standalone="no"?>\n'
+        '<svg xmlns="http://www.w3.org/2000/svg" width="100pt" height="50pt" '
+        'viewBox="0 0 100 50">\n'
+        '</svg>\n'
+    )
+
+    monkeypatch.setattr(config.execution, 'aggr_ses_reports', 4)
+    config.execution.layout = BIDSLayout(data_dir / 'ds000005')
+
+    assert not generate_reports(['001'], tmp_path, 'fake_uuid', incremental=True)
+    report = tmp_path / 'sub-001.html'
+    mtime = report.stat().st_mtime_ns
+
+    # The first rerun already finds the report up to date
+    assert not generate_reports(['001'], tmp_path, 'another_uuid', incremental=True)
+    assert report.stat().st_mtime_ns == mtime
@@ -0,0 +1,87 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+from bids.layout import BIDSLayout
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+
+from fmriprep.engine.plugin import TracedMultiProcPlugin
+from fmriprep.reports.core import generate_reports
+from fmriprep.reports.scheduling import write_scheduling_report
+from fmriprep.utils import tracing
+
+from ... import config, data
+
+data_dir = data.load('tests')
+
+
+def _sleep(value, seconds):
+    import time
+
+    time.sleep(seconds)
+    return value
+
+
+def _node(name, seconds):
+    node = pe.Node(
+        niu.Function(function=_sleep, input_names=['value', 'seconds'], output_names=['out']),
+        name=name,
+    )
+    node.inputs.seconds = seconds
+    return node
+
+
+@pytest.mark.skipif(
+    not Path.exists(data_dir / 'work'),
+    reason='Package installed - large test data directory excluded from wheel',
+)
+def test_scheduling_report(tmp_path, monkeypatch):
+    # A long chain (anat -> bold) alongside a short branch
+    subject_wf = pe.Workflow(name='sub_001_wf')
+    anat_wf = pe.Workflow(name='anat_wf')
+    anat_wf.add_nodes([_node('fit', 1.0)])
+    bold_wf = pe.Workflow(name='bold_wf')
+    bold_wf.add_nodes([_node('resample', 0.5), _node('summary', 0.1)])
+    anat_wf.get_node('fit').inputs.value = 1
+    bold_wf.get_node('summary').inputs.value = 2
+    subject_wf.connect([(anat_wf, bold_wf, [('fit.out', 'resample.value')])])  # fmt:skip
+    wf = pe.Workflow(name='fmriprep_wf', base_dir=str(tmp_path / 'work'))
+    wf.add_nodes([subject_wf])
+
+    trace_dir = tmp_path / 'logs' / 'fake_uuid' / 'trace'
+    tracing.enable(trace_dir)
+    try:
+        tic = time.time()
+        wf.run(plugin=TracedMultiProcPlugin(plugin_args={'n_procs': 2}))
+        elapsed = time.time() - tic
+    finally:
+        tracing.disable()
+
+    out_dir = tmp_path / 'out'
+    summary = write_scheduling_report(trace_dir, out_dir, 'fake_uuid', 2)
+    assert json.loads((trace_dir.parent / 'scheduling.json').read_text()) == summary
+    assert 0 < summary['makespan_s'] < elapsed
+
+    subject = summary['subjects']['001']
+    assert [step['node'] for step in subject['critical_path']] == [
+        'anat_wf.fit',
+        'bold_wf.resample',
+    ]
+    assert 1.5 <= subject['critical_path_s'] <= subject['makespan_s']
+    assert subject['slack']['bold_wf.summary'] > 1.0
+    assert {stage['stage'] for stage in subject['stages']} == {'anat_wf', 'bold_wf'}
+
+    # The analysis is included in the subject's report
+    reportlet = out_dir / 'sub-001' / 'figures' / 'sub-001_desc-scheduling_T1w.html'
+    assert 'bold_wf.resample' in reportlet.read_text()
+
+    shutil.copytree(
+        data_dir / 'work/reportlets/fmriprep/sub-001', out_dir / 'sub-001', dirs_exist_ok=True
+    )
+    monkeypatch.setattr(config.execution, 'aggr_ses_reports', 4)
+    config.execution.layout = BIDSLayout(data_dir / 'ds000005')
+    assert not generate_reports(['001'], out_dir, 'fake_uuid')
+    assert 'bold_wf.resample' in (out_dir / 'sub-001.html').read_text()
@@ -124,6 +124,7 @@ def collect_fieldmaps(
 def write_bidsignore(deriv_dir):
     bids_ignore = (
         '*.html',
+        '*.fingerprint.json',  # Report manifests
         'logs/',
         'figures/',  # Reports
         '*_xfm.*',  # Unspecified transform files
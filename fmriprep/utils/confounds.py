@@ -22,6 +22,8 @@
 #
 """Utilities for confounds manipulation."""
 
+from . import tracing
+
 
 def mask2vf(in_file, zooms=None, out_file=None):
     """
@@ -57,6 +59,7 @@ def mask2vf(in_file, zooms=None, out_file=None):
     return out_file
 
 
+@tracing.traced()
 def acompcor_masks(in_files, is_aseg=False, zooms=None):
     """
     Generate aCompCor masks.
@@ -110,8 +113,8 @@ def acompcor_masks(in_files, is_aseg=False, zooms=None):
 
     import nibabel as nb
     import numpy as np
-    from scipy.ndimage import binary_dilation
-    from skimage.morphology import ball
+
+    from .morphology import binary_dilation
 
     csf_file = in_files[2]  # BIDS labeling (CSF=2; last of list)
     # Load PV maps (fast) or segments (recon-all)
@@ -142,7 +145,7 @@ def acompcor_masks(in_files, is_aseg=False, zooms=None):
         gm_data = np.asanyarray(gm_vf.dataobj, np.uint8) > 0
 
     # Dilate the GM mask
-    gm_data = binary_dilation(gm_data, structure=ball(3))
+    gm_data = binary_dilation(gm_data, 3)
 
     # Output filenames
     wm_file = str(Path('acompcor_wm.nii.gz').absolute())
@@ -0,0 +1,300 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Content-addressed cache of the outputs of the BOLD fit stage.
+
+The outputs of :func:`~fmriprep.workflows.bold.fit.init_bold_fit_wf`
+(HMC reference and transforms, coregistration reference and mask, and
+registration transforms) are stored under a key calculated from the checksums
+of every input file they depend on (BOLD series, single-band references,
+anatomical images, precomputed anatomical derivatives and fieldmap sources),
+the options that affect them (:data:`FIT_OPTIONS`, and :data:`FREESURFER_OPTIONS`
+if surfaces are reconstructed), and the version of *fMRIPrep*.
+A later run with the same key reuses them, regardless of the output spaces or
+other settings of the run.
+
+>>> bold = testdir / 'sub-01_task-rest_bold.nii.gz'
+>>> _ = bold.write_bytes(b'bold')
+>>> signature = fit_signature({'bold': [bold]}, {'workflow.dummy_scans': None}, '25.0.0')
+>>> signature['key'] == fit_signature({'bold': [bold]}, {'workflow.dummy_scans': 0}, '25.0.0')['key']
+False
+>>> outputs = {}
+>>> for name in ('hmc_boldref', 'coreg_boldref', 'bold_mask'):
+...     outputs[name] = testdir / f'{name}.nii.gz'
+...     _ = outputs[name].write_bytes(name.encode())
+>>> for name in ('motion_xfm', 'boldref2anat_xfm'):
+...     outputs[name] = testdir / f'{name}.txt'
+...     _ = outputs[name].write_bytes(name.encode())
+>>> entry = store_fit_cache(testdir / 'cache', signature, outputs)
+>>> cached = load_fit_cache(testdir / 'cache', signature['key'])
+>>> Path(cached['coreg_boldref']).read_text(), sorted(cached['transforms'])
+('coreg_boldref', ['boldref2anat', 'hmc'])
+>>> load_fit_cache(testdir / 'cache', '0' * 64)
+{}
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from .. import config
+
+FIT_OPTIONS = (
+    'execution.echo_idx',
+    'execution.sloppy',
+    'workflow.bold2anat_dof',
+    'workflow.bold2anat_init',
+    'workflow.bold2anat_speculative',
+    'workflow.dummy_scans',
+    'workflow.fallback_total_readout_time',
+    'workflow.fmap_bspline',
+    'workflow.fmap_demean',
+    'workflow.force',
+    'workflow.hires',
+    'workflow.ignore',
+    'workflow.run_reconall',
+    'workflow.skull_strip_fixed_seed',
+    'workflow.skull_strip_t1w',
+    'workflow.skull_strip_template',
+    'workflow.subject_anatomical_reference',
+    'workflow.use_bbr',
+    'workflow.use_syn_sdc',
+)
+"""Settings (``section.name`` of :mod:`fmriprep.config`) that affect the fit stage."""
+
+FREESURFER_OPTIONS = (
+    'execution.fs_subjects_dir',
+    'workflow.fs_no_resume',
+)
+"""Settings that affect the fit stage when surfaces are reconstructed, as the BOLD
+series is registered to the surfaces found in (or reused from) the subjects directory."""
+
+FIT_OUTPUTS = {
+    'hmc_boldref': ('hmc_boldref',),
+    'coreg_boldref': ('coreg_boldref',),
+    'bold_mask': ('bold_mask',),
+    'motion_xfm': ('transforms', 'hmc'),
+    'boldref2anat_xfm': ('transforms', 'boldref2anat'),
+    'boldref2fmap_xfm': ('transforms', 'boldref2fmap'),
+}
+"""Outputs of the fit stage that are cached, and where they go in the precomputed
+derivatives passed to :func:`~fmriprep.workflows.bold.fit.init_bold_fit_wf`."""
+
+DIGESTS_FILE = 'digests.json'
+"""File, within the cache, memoizing the checksums of input files."""
+
+
+def file_digest(path, memo=None):
+    """
+    Calculate the SHA256 checksum of a file.
+
+    If ``memo`` (a dictionary) is given, checksums are looked up and stored in it,
+    keyed by the path, size and modification time of the file.
+    """
+    path = Path(path).absolute()
+    stat = path.stat()
+    memo_key = f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+    if memo is not None and memo_key in memo:
+        return memo[memo_key]
+
+    digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(2**24), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+    if memo is not None:
+        memo[memo_key] = digest
+    return digest
+
+
+def fit_options():
+    """Collect the current values of :data:`FIT_OPTIONS` (and :data:`FREESURFER_OPTIONS`)."""
+    options = {}
+    for option in FIT_OPTIONS + (FREESURFER_OPTIONS if config.workflow.run_reconall else ()):
+        section, name = option.split('.')
+        value = getattr(getattr(config, section), name)
+        options[option] = sorted(value) if isinstance(value, list | set | tuple) else value
+    return options
+
+
+def derivative_files(precomputed, exclude=('transforms',)):
+    """
+    List the files of precomputed derivatives, except those under the keys in ``exclude``.
+
+    Transforms to standard spaces are excluded by default, as they are only
+    collected for the output spaces of the run, and do not affect the fit stage.
+
+    >>> derivative_files({
+    ...     't1w_preproc': '/d/T1w.nii.gz',
+    ...     't1w_tpms': ['/d/GM.nii.gz', '/d/WM.nii.gz'],
+    ...     'transforms': {'MNI152NLin2009cAsym': {'forward': '/d/xfm.h5'}},
+    ... })
+    ['/d/GM.nii.gz', '/d/T1w.nii.gz', '/d/WM.nii.gz']
+
+    """
+    files = []
+    for key, value in precomputed.items():
+        if key in exclude or not value:
+            continue
+        if isinstance(value, dict):
+            files.extend(derivative_files(value, exclude=()))
+        elif isinstance(value, list | tuple):
+            files.extend(str(path) for path in value)
+        else:
+            files.append(str(value))
+    return sorted(files)
+
+
+def fit_signature(inputs, options, version, cache_dir=None):
+    """
+    Calculate the key of the fit stage of a BOLD series.
+
+    Parameters
+    ----------
+    inputs : dict
+        Lists of input files, by role (e.g., ``bold``, ``sbref``, ``t1w``).
+    options : dict
+        Settings affecting the fit stage (see :func:`fit_options`).
+    version : str
+        Version of *fMRIPrep*.
+    cache_dir : path, optional
+        If given, the checksums of input files are memoized within the cache,
+        so large files are not read again until they are modified.
+
+    Returns
+    -------
+    signature : dict
+        The ``key``, together with the checksums, options and version it was
+        calculated from.
+    """
+    memo = _read_digests(cache_dir) if cache_dir is not None else None
+    known = len(memo or {})
+
+    signature = {
+        'inputs': {
+            role: [[str(path), file_digest(path, memo)] for path in files]
+            for role, files in sorted(inputs.items())
+        },
+        'options': options,
+        'version': version,
+    }
+    # The key depends on the contents of the inputs, not on their location
+    keyed = dict(
+        signature,
+        inputs={
+            role: [digest for _, digest in files] for role, files in signature['inputs'].items()
+        },
+    )
+    signature['key'] = hashlib.sha256(
+        json.dumps(keyed, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    if memo is not None and len(memo) > known:
+        _write_json(Path(cache_dir) / DIGESTS_FILE, memo)
+    return signature
+
+
+def entry_dir(cache_dir, key):
+    """Directory of a cache entry."""
+    return Path(cache_dir) / key[:2] / key
+
+
+def load_fit_cache(cache_dir, key):
+    """
+    Look up the outputs of the fit stage stored under ``key``.
+
+    Returns a dictionary of precomputed derivatives, in the format of
+    :func:`~fmriprep.utils.bids.collect_derivatives` (plus the ``bold_mask``),
+    or an empty dictionary if there is no entry or any of its files is altered.
+    """
+    entry = entry_dir(cache_dir, key)
+    try:
+        manifest = json.loads((entry / 'manifest.json').read_text())
+    except (OSError, ValueError):
+        return {}
+
+    precomputed = {}
+    for output, stored in manifest['outputs'].items():
+        path = entry / stored['file']
+        try:
+            if file_digest(path) != stored['sha256']:
+                raise OSError(f'Checksum mismatch: {path}')
+        except OSError as e:
+            config.loggers.workflow.warning(f'Ignoring corrupted fit cache entry {entry}: {e}')
+            return {}
+        *parents, name = FIT_OUTPUTS[output]
+        target = precomputed
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = str(path)
+    precomputed.setdefault('transforms', {})
+    return precomputed
+
+
+def store_fit_cache(cache_dir, signature, outputs):
+    """
+    Store the outputs of the fit stage (see :data:`FIT_OUTPUTS`) under the key of ``signature``.
+
+    Entries are written aside and moved into place, so concurrent readers
+    never find incomplete entries. An existing entry is left untouched.
+    """
+    entry = entry_dir(cache_dir, signature['key'])
+    if entry.exists():
+        return entry
+
+    tmp_entry = entry.parent / f'.{entry.name}.{os.getpid()}'
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    tmp_entry.mkdir(parents=True)
+
+    stored = {}
+    for output, path in sorted(outputs.items()):
+        if output not in FIT_OUTPUTS or not path:
+            continue
+        path = Path(path)
+        name = output + ('.nii.gz' if path.name.endswith('.nii.gz') else path.suffix)
+        shutil.copyfile(path, tmp_entry / name)
+        stored[output] = {'file': name, 'sha256': file_digest(tmp_entry / name)}
+
+    _write_json(tmp_entry / 'manifest.json', dict(signature, outputs=stored))
+    try:
+        tmp_entry.rename(entry)
+    except OSError:  # Another process stored the same entry
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    return entry
+
+
+def _read_digests(cache_dir):
+    try:
+        return json.loads((Path(cache_dir) / DIGESTS_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.parent / f'.{path.name}.{os.getpid()}'
+    tmp_file.write_text(json.dumps(data, indent=2, default=str))
+    os.replace(tmp_file, path)
@@ -0,0 +1,105 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Mathematical morphology with spherical structuring elements.
+
+A voxel belongs to the dilation of a mask by a ball of radius *r*
+(:func:`skimage.morphology.ball`) if and only if its Euclidean distance
+to the mask is at most *r*.
+Rather than visiting every offset of the ball, as
+:func:`scipy.ndimage.binary_dilation` does, :func:`binary_dilation` calculates
+the squared Euclidean distance transform one axis at a time, truncated at
+the radius, which takes ``ndim * (2 * r + 1)`` vectorized passes over the mask.
+The mask is processed in slabs along its first axis, so the intermediate
+distances take little memory and stay in cache.
+
+"""
+
+import numpy as np
+
+#: Number of slices along the first axis dilated at once
+SLAB_SIZE = 16
+
+
+def squared_distance(mask: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Squared Euclidean distance (in voxels) of every voxel to the mask, up to ``radius``.
+
+    Distances are exact up to ``radius``, while voxels further away from the mask
+    are only guaranteed to hold a value larger than ``radius ** 2``.
+    Voxels beyond the edges of the array are considered outside of the mask.
+
+    >>> mask = np.zeros((1, 7), dtype=bool)
+    >>> mask[0, 1] = True
+    >>> squared_distance(mask, 2)
+    array([[1, 0, 1, 4, 5, 5, 5]], dtype=uint8)
+
+    """
+    mask = np.asanyarray(mask, dtype=bool)
+    radius = int(radius)
+    # Each pass adds at most radius ** 2 to the initial value of radius ** 2 + 1
+    dtype = 'u1' if (mask.ndim + 1) * radius**2 + 1 < 256 else 'u4'
+    dist = np.where(mask, 0, radius**2 + 1).astype(dtype)
+    if radius < 1:
+        return dist
+
+    # Separable squared EDT: each pass takes the minimum along one axis
+    for axis in range(mask.ndim):
+        out = dist.copy()
+        for k in range(1, min(radius, mask.shape[axis] - 1) + 1):
+            head = [slice(None)] * mask.ndim
+            tail = [slice(None)] * mask.ndim
+            head[axis] = slice(None, -k)
+            tail[axis] = slice(k, None)
+            head, tail = tuple(head), tuple(tail)
+            np.minimum(out[head], dist[tail] + k * k, out=out[head])
+            np.minimum(out[tail], dist[head] + k * k, out=out[tail])
+        dist = out
+    return dist
+
+
+def binary_dilation(mask: np.ndarray, radius: int, slab_size: int = SLAB_SIZE) -> np.ndarray:
+    """
+    Dilate a binary mask with a ball of the given radius (in voxels).
+
+    Equivalent to ``scipy.ndimage.binary_dilation(mask, skimage.morphology.ball(radius))``
+    (for 3D masks), but faster for all but the smallest radii.
+
+    >>> mask = np.zeros((5, 5, 5), dtype=bool)
+    >>> mask[2, 2, 2] = True
+    >>> int(binary_dilation(mask, 1).sum()), int(binary_dilation(mask, 2).sum())
+    (7, 33)
+
+    """
+    mask = np.asanyarray(mask, dtype=bool)
+    radius = max(int(radius), 0)
+
+    out = np.empty(mask.shape, dtype=bool)
+    nslices = mask.shape[0]
+    for start in range(0, nslices, slab_size):
+        stop = min(start + slab_size, nslices)
+        # Pad the slab with the slices within reach of the ball
+        first, last = max(start - radius, 0), min(stop + radius, nslices)
+        dist = squared_distance(mask[first:last], radius)
+        out[start:stop] = dist[start - first : stop - first] <= radius**2
+    return out
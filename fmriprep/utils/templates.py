@@ -0,0 +1,209 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Build-time resolution of TemplateFlow resources.
+
+Workflow builders reference a handful of template files (e.g., the carpet-plot
+segmentation or the fsLR spheres) once per subject, and sometimes once per run.
+Each :func:`templateflow.api.get` call runs a PyBIDS query over the TemplateFlow
+tree, so :func:`get_template` resolves every query once per process.
+Resolved queries are also recorded in a small index within the working directory,
+so that later processes only need to check that the files are present.
+The index holds one file per query, written atomically, so that concurrent processes
+do not need to lock it, and read-only TemplateFlow homes are supported.
+
+:func:`prefetch_templates` resolves every file required by the current
+configuration before the workflow is built, so that missing templates
+(e.g., when running offline) are reported upfront.
+
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .. import config
+
+#: Directory of the index of resolved queries, within the working directory
+INDEX_DIR = 'templateflow_index'
+
+_resolved = {}
+
+
+def get_template(template, **query):
+    """
+    Resolve a TemplateFlow query, as :func:`templateflow.api.get` would.
+
+    Results are memoized for the lifetime of the process, and recorded in the
+    index of the working directory.
+    Indexed results are reused as long as all their files are present.
+
+    """
+    key = json.dumps({'template': template, **query}, sort_keys=True, default=str)
+    if key not in _resolved:
+        _resolved[key] = _resolve(key, template, query)
+    return _resolved[key]
+
+
+def _resolve(key, template, query):
+    from templateflow import api as tf
+
+    root = Path(config.execution.templateflow_home).expanduser().absolute()
+    index_file = _index_file(root, key)
+
+    paths = [root / path for path in _load_entry(index_file)]
+    if not paths or not all(path.is_file() and path.stat().st_size for path in paths):
+        retval = tf.get(template, **query)
+        paths = retval if isinstance(retval, list) else [retval]
+        if not paths:
+            return retval
+        try:
+            relpaths = [str(Path(path).relative_to(root)) for path in paths]
+        except ValueError:
+            # The client was pointed elsewhere (e.g., TEMPLATEFLOW_HOME changed)
+            return retval
+        _save_entry(index_file, relpaths)
+
+    return paths[0] if len(paths) == 1 else paths
+
+
+def _index_file(root, key):
+    # Queries may resolve differently with other homes or versions of the client
+    digest = hashlib.sha256(
+        '\n'.join((str(root), str(config.environment.templateflow_version), key)).encode()
+    ).hexdigest()
+    return Path(config.execution.work_dir) / INDEX_DIR / f'{digest[:32]}.json'
+
+
+def _load_entry(index_file):
+    try:
+        return json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        return []
+
+
+def _save_entry(index_file, relpaths):
+    tmp_file = index_file.parent / f'{index_file.name}.{os.getpid()}'
+    try:
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file.write_text(json.dumps(relpaths))
+        os.replace(tmp_file, index_file)
+    except OSError:
+        config.loggers.utils.debug('Could not write TemplateFlow index at <%s>.', index_file)
+
+
+def carpet_dseg():
+    """Segmentation drawn in the carpet plots."""
+    return get_template(
+        'MNI152NLin2009cAsym',
+        resolution=1,
+        desc='carpet',
+        suffix='dseg',
+        extension=['.nii', '.nii.gz'],
+    )
+
+
+def template_spheres(template, density, space=None):
+    """Left and right spheres of a surface template, at a given density."""
+    return [
+        str(sphere)
+        for sphere in get_template(
+            template,
+            space=space if space != template else None,
+            density=density,
+            suffix='sphere',
+            extension='.surf.gii',
+        )
+    ]
+
+
+def template_mask(template, resolution):
+    """Brain mask of a volumetric template, at a given resolution."""
+    return get_template(
+        template,
+        resolution=resolution,
+        desc='brain',
+        suffix='mask',
+        atlas=None,
+        cohort=None,
+    )
+
+
+def aseg_dseg_tsv():
+    """Look-up table of the FreeSurfer segmentations."""
+    return get_template(
+        'fsaverage',
+        hemi=None,
+        atlas=None,
+        segmentation='aparc',
+        suffix='dseg',
+        extension=['.tsv'],
+    )
+
+
+def prefetch_templates():
+    """
+    Resolve (and fetch, if necessary) the template files required by the configuration.
+
+    Raises
+    ------
+    :obj:`RuntimeError`
+        Listing the resources that could not be resolved.
+
+    """
+    requests = {}
+    if config.workflow.run_reconall:
+        requests['fsaverage segmentation look-up table'] = aseg_dseg_tsv
+    if not config.workflow.anat_only:
+        requests['carpet plot segmentation'] = carpet_dseg
+
+    cifti_output = config.workflow.cifti_output
+    if cifti_output:
+        fslr_density = '32k' if cifti_output == '91k' else '59k'
+        requests['fsLR spheres'] = lambda: template_spheres('fsLR', fslr_density)
+        res = 2 if cifti_output == '91k' else 1
+        requests['MNI152NLin6Asym brain mask'] = lambda: template_mask('MNI152NLin6Asym', res)
+
+    if config.workflow.spaces is not None and not config.workflow.anat_only:
+        for ref in config.workflow.spaces.get_standard(dim=(2,)):
+            density = ref.spec.get('density') or ref.spec.get('den')
+            if ref.space == 'fsaverage' or density is None:
+                continue
+            # Same query as fmriprep.workflows.bold.resampling.init_wb_surf_surf_wf
+            requests[f'{ref.space} spheres'] = lambda ref=ref, density=density: template_spheres(
+                ref.space, density, 'fsLR'
+            )
+
+    failed = []
+    for name, request in requests.items():
+        try:
+            if not request():
+                failed.append(f'{name} (no matching files)')
+        except Exception as exc:  # noqa: BLE001
+            failed.append(f'{name} ({exc})')
+
+    if failed:
+        raise RuntimeError(
+            'Could not resolve TemplateFlow resources:\n\t* ' + '\n\t* '.join(failed)
+        )
@@ -0,0 +1,108 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from fmriprep.utils import fitcache
+
+
+@pytest.fixture
+def outputs(tmp_path: Path):
+    files = {}
+    for name in ('hmc_boldref', 'coreg_boldref', 'bold_mask'):
+        files[name] = tmp_path / f'{name}.nii.gz'
+        files[name].write_bytes(name.encode())
+    for name in ('motion_xfm', 'boldref2anat_xfm'):
+        files[name] = tmp_path / f'{name}.txt'
+        files[name].write_bytes(name.encode())
+    return files
+
+
+def test_signature_depends_on_contents(tmp_path: Path):
+    bold = tmp_path / 'a' / 'sub-01_task-rest_bold.nii.gz'
+    moved = tmp_path / 'b' / 'sub-01_task-rest_bold.nii.gz'
+    for path in (bold, moved):
+        path.parent.mkdir()
+        path.write_bytes(b'bold')
+
+    cache_dir = tmp_path / 'cache'
+    signature = fitcache.fit_signature({'bold': [bold]}, {}, '25.0.0', cache_dir=cache_dir)
+    # Moving the inputs keeps the key, modifying them changes it
+    assert fitcache.fit_signature({'bold': [moved]}, {}, '25.0.0')['key'] == signature['key']
+    assert fitcache.fit_signature({'bold': [bold]}, {}, '25.1.0')['key'] != signature['key']
+    moved.write_bytes(b'other bold')
+    assert fitcache.fit_signature({'bold': [moved]}, {}, '25.0.0')['key'] != signature['key']
+
+    # Checksums are memoized within the cache
+    assert len(json.loads((cache_dir / fitcache.DIGESTS_FILE).read_text())) == 1
+
+
+def test_store_and_load(tmp_path: Path, outputs: dict):
+    cache_dir = tmp_path / 'cache'
+    signature = {'key': 'ab' * 32, 'inputs': {}, 'options': {}, 'version': '25.0.0'}
+    assert fitcache.load_fit_cache(cache_dir, signature['key']) == {}
+
+    entry = fitcache.store_fit_cache(cache_dir, signature, outputs)
+    assert entry == fitcache.entry_dir(cache_dir, signature['key'])
+    precomputed = fitcache.load_fit_cache(cache_dir, signature['key'])
+    assert sorted(precomputed) == ['bold_mask', 'coreg_boldref', 'hmc_boldref', 'transforms']
+    assert sorted(precomputed['transforms']) == ['boldref2anat', 'hmc']
+    assert Path(precomputed['transforms']['hmc']).read_text() == 'motion_xfm'
+
+    # Existing entries are not overwritten
+    outputs['hmc_boldref'].write_bytes(b'changed')
+    assert fitcache.store_fit_cache(cache_dir, signature, outputs) == entry
+    assert Path(precomputed['hmc_boldref']).read_text() == 'hmc_boldref'
+    assert not [path for path in entry.parent.iterdir() if path.name.startswith('.')]
+
+
+def test_corrupted_entry(tmp_path: Path, outputs: dict):
+    cache_dir = tmp_path / 'cache'
+    signature = {'key': 'cd' * 32}
+    entry = fitcache.store_fit_cache(cache_dir, signature, outputs)
+
+    (entry / 'bold_mask.nii.gz').write_bytes(b'truncated')
+    assert fitcache.load_fit_cache(cache_dir, signature['key']) == {}
+
+    (entry / 'bold_mask.nii.gz').unlink()
+    assert fitcache.load_fit_cache(cache_dir, signature['key']) == {}
+
+
+def test_fit_options(monkeypatch, tmp_path: Path):
+    from fmriprep import config
+
+    monkeypatch.setattr(config.workflow, 'run_reconall', False)
+    options = fitcache.fit_options()
+    assert 'workflow.subject_anatomical_reference' in options
+    assert 'execution.fs_subjects_dir' not in options
+
+    # The FreeSurfer subjects directory determines the surfaces registered to
+    monkeypatch.setattr(config.workflow, 'run_reconall', True)
+    monkeypatch.setattr(config.execution, 'fs_subjects_dir', tmp_path / 'freesurfer')
+    options = fitcache.fit_options()
+    assert options['execution.fs_subjects_dir'] == tmp_path / 'freesurfer'
+    assert 'workflow.fs_no_resume' in options
+
+
+def test_signature_depends_on_anat_derivatives(tmp_path: Path):
+    bold = tmp_path / 'sub-01_task-rest_bold.nii.gz'
+    bold.write_bytes(b'bold')
+    t1w_preproc = tmp_path / 'sub-01_desc-preproc_T1w.nii.gz'
+    t1w_preproc.write_bytes(b'T1w')
+    precomputed = {
+        't1w_preproc': str(t1w_preproc),
+        'transforms': {'MNI152NLin2009cAsym': {'forward': str(tmp_path / 'missing.h5')}},
+    }
+
+    def _key():
+        inputs = {
+            'bold': [bold],
+            't1w': [],
+            'anat_derivatives': fitcache.derivative_files(precomputed),
+        }
+        return fitcache.fit_signature(inputs, {}, '25.0.0')['key']
+
+    key = _key()
+    # Registered to a different anatomical reference
+    t1w_preproc.write_bytes(b'another T1w')
+    assert _key() != key
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from scipy import ndimage as ndi
+
+from fmriprep.utils.morphology import binary_dilation
+
+
+def _ball(radius):
+    grid = np.mgrid[(slice(-radius, radius + 1),) * 3]
+    return (grid**2).sum(0) <= radius**2
+
+
+@pytest.mark.parametrize('radius', [0, 1, 2, 3, 5])
+@pytest.mark.parametrize('density', [0.0, 0.001, 0.1, 0.5])
+def test_binary_dilation(radius, density):
+    """Dilation matches ndimage with a spherical footprint, including at the edges."""
+    rng = np.random.default_rng(radius)
+    mask = rng.random((23, 17, 4)) < density
+    mask[0, 0, 0] = density > 0
+
+    expected = ndi.binary_dilation(mask, _ball(radius)) if radius else mask
+    assert np.array_equal(binary_dilation(mask, radius), expected)
+    # Dilating in slabs thinner than the ball
+    assert np.array_equal(binary_dilation(mask, radius, slab_size=2), expected)
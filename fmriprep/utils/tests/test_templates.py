@@ -0,0 +1,83 @@
+import pytest
+from templateflow import api as tf
+
+from fmriprep import config
+from fmriprep.utils import templates
+
+
+@pytest.fixture
+def tf_home(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.execution, 'templateflow_home', tmp_path)
+    monkeypatch.setattr(config.execution, 'work_dir', tmp_path / 'work')
+    monkeypatch.setattr(templates, '_resolved', {})
+
+    calls = []
+
+    def _get(template, **query):
+        calls.append(template)
+        if template == 'missing':
+            raise RuntimeError('Could not fetch template files')
+        tpl_dir = tmp_path / f'tpl-{template}'
+        tpl_dir.mkdir(exist_ok=True)
+        paths = [tpl_dir / f'tpl-{template}_hemi-{hemi}_sphere.surf.gii' for hemi in 'LR']
+        for path in paths:
+            path.write_text('surface')
+        return paths
+
+    monkeypatch.setattr(tf, 'get', _get)
+    return tmp_path, calls
+
+
+def test_get_template(tf_home):
+    root, calls = tf_home
+
+    spheres = templates.template_spheres('fsLR', '32k')
+    assert [sphere.split('/')[-1] for sphere in spheres] == [
+        'tpl-fsLR_hemi-L_sphere.surf.gii',
+        'tpl-fsLR_hemi-R_sphere.surf.gii',
+    ]
+    assert templates.template_spheres('fsLR', '32k') == spheres
+    assert calls == ['fsLR']
+    # The index is kept in the working directory, not in the TemplateFlow home
+    assert len(list((root / 'work' / templates.INDEX_DIR).glob('*.json'))) == 1
+    assert not [path for path in root.iterdir() if path.name.startswith('.')]
+
+    # A new process reuses the index, without querying TemplateFlow
+    templates._resolved.clear()
+    assert templates.template_spheres('fsLR', '32k') == spheres
+    assert calls == ['fsLR']
+
+    # Other queries and missing files are resolved again
+    templates.template_spheres('fsLR', '59k')
+    assert calls == ['fsLR', 'fsLR']
+    templates._resolved.clear()
+    (root / 'tpl-fsLR' / 'tpl-fsLR_hemi-L_sphere.surf.gii').unlink()
+    assert templates.template_spheres('fsLR', '32k') == spheres
+    assert calls == ['fsLR', 'fsLR', 'fsLR']
+
+
+def test_prefetch_templates(tf_home, monkeypatch):
+    _, calls = tf_home
+    monkeypatch.setattr(config.workflow, 'run_reconall', False)
+    monkeypatch.setattr(config.workflow, 'anat_only', True)
+    monkeypatch.setattr(config.workflow, 'cifti_output', '91k')
+
+    templates.prefetch_templates()
+    assert calls == ['fsLR', 'MNI152NLin6Asym']
+
+    monkeypatch.setattr(templates, 'carpet_dseg', lambda: tf.get('missing'))
+    monkeypatch.setattr(config.workflow, 'anat_only', False)
+    monkeypatch.setattr(config.workflow, 'spaces', None)
+    with pytest.raises(RuntimeError, match='carpet plot segmentation'):
+        templates.prefetch_templates()
+
+
+def test_get_template_elsewhere(tf_home, monkeypatch):
+    root, calls = tf_home
+    # TemplateFlow fetches outside of the configured home are not indexed
+    monkeypatch.setattr(config.execution, 'templateflow_home', root / 'other')
+
+    spheres = templates.template_spheres('fsLR', '32k')
+    assert len(spheres) == 2
+    assert calls == ['fsLR']
+    assert not (root / 'work' / templates.INDEX_DIR).exists()
@@ -0,0 +1,117 @@
+import nibabel as nb
+import numpy as np
+import pytest
+from niworkflows.utils.timeseries import _cifti_timeseries, _nifti_timeseries
+
+from fmriprep.utils import timeseries as ts
+
+
+def _decimated_reference(data, segments):
+    """Rows and segments as :func:`nireports...plot_carpet` would decimate them."""
+    n_dec = ts.decimation_factor(data.shape[0])
+    if n_dec > 1:
+        segments = {lab: np.asanyarray(idx)[::n_dec] for lab, idx in segments.items()}
+    return {lab: data[np.asanyarray(idx, dtype=int)] for lab, idx in segments.items()}
+
+
+def _reference_vminmax(data, drop_trs=0):
+    """Color limits as :func:`nireports...plot_carpet` calculates them, before decimating."""
+    from nilearn.signal import clean
+
+    data = clean(data.T, filter=False, standardize='zscore_sample').T
+    return np.percentile(data[:, drop_trs:], [2, 98])
+
+
+def _cifti(tmp_path, nvols):
+    mask = np.zeros((4, 4, 4), dtype=bool)
+    mask[1:3, 1:3, 1:3] = True
+    brain_models = (
+        nb.cifti2.BrainModelAxis.from_mask(np.ones(400, dtype=bool), 'CortexLeft')
+        + nb.cifti2.BrainModelAxis.from_mask(np.ones(300, dtype=bool), 'CortexRight')
+        + nb.cifti2.BrainModelAxis.from_mask(mask, 'thalamus_left', affine=np.eye(4))
+    )
+    series = nb.cifti2.SeriesAxis(0, 2.0, nvols)
+    data = np.random.default_rng(1).standard_normal((nvols, len(brain_models)))
+    img = nb.Cifti2Image(data.astype('f4'), header=(series, brain_models))
+    img.nifti_header.set_intent('ConnDenseSeries')
+    img.to_filename(tmp_path / 'bold.dtseries.nii')
+    return tmp_path / 'bold.dtseries.nii'
+
+
+@pytest.mark.parametrize('shape', [(10, 10, 10), (30, 30, 30)])
+def test_carpet_timeseries_nifti(tmp_path, shape):
+    rng = np.random.default_rng(0)
+    bold = nb.Nifti1Image(rng.standard_normal((*shape, 20)).astype('f4'), np.eye(4))
+    bold.to_filename(tmp_path / 'bold.nii.gz')
+    segm = nb.Nifti1Image(rng.integers(0, 7, shape).astype('u1'), np.eye(4))
+    segm.to_filename(tmp_path / 'segm.nii.gz')
+    labels = ('Ctx GM', 'dGM', 'sWM+sCSF', 'dWM+dCSF', 'Cb', 'Edge')
+
+    data, segments = _nifti_timeseries(
+        str(tmp_path / 'bold.nii.gz'), str(tmp_path / 'segm.nii.gz'), labels=labels
+    )
+    expected = _decimated_reference(data, segments)
+
+    # Force several chunks
+    dataset, segments, vminmax = ts.carpet_timeseries(
+        str(tmp_path / 'bold.nii.gz'),
+        in_segm=str(tmp_path / 'segm.nii.gz'),
+        labels=labels,
+        chunk_bytes=np.prod(shape) * 4 * 3,
+        drop_trs=2,
+    )
+    assert list(segments) == list(expected)
+    for label, rows in expected.items():
+        assert np.array_equal(dataset[segments[label]], rows)
+    # No further decimation takes place in the plot
+    assert ts.decimation_factor(dataset.shape[0]) <= 1
+    # Color limits are those of all the rows
+    assert np.allclose(vminmax, _reference_vminmax(data, drop_trs=2))
+
+
+def test_carpet_timeseries_whole_volume(tmp_path):
+    data = np.random.default_rng(0).standard_normal((30, 30, 30, 20)).astype('f4')
+    data += np.linspace(0, 5, 20, dtype='f4')  # A linear trend
+    nb.Nifti1Image(data, np.eye(4)).to_filename(tmp_path / 'bold.nii.gz')
+
+    dataset, segments, vminmax = ts.carpet_timeseries(
+        str(tmp_path / 'bold.nii.gz'), chunk_bytes=30**3 * 4 * 6
+    )
+    data = data.reshape((-1, 20))
+    assert segments is None
+    assert np.array_equal(dataset, data[:: ts.decimation_factor(len(data))])
+    assert np.allclose(vminmax, _reference_vminmax(data))
+
+
+def test_carpet_timeseries_cifti(tmp_path):
+    nvols = 15
+    cifti = _cifti(tmp_path, nvols)
+    shape = (20, 20, 20)
+    rng = np.random.default_rng(0)
+    nb.Nifti1Image(rng.standard_normal((*shape, nvols)).astype('f4'), np.eye(4)).to_filename(
+        tmp_path / 'bold.nii.gz'
+    )
+    nb.Nifti1Image(rng.integers(0, 3, shape).astype('u1'), np.eye(4)).to_filename(
+        tmp_path / 'segm.nii.gz'
+    )
+
+    vol_data, vol_segments = _nifti_timeseries(
+        str(tmp_path / 'bold.nii.gz'), str(tmp_path / 'segm.nii.gz'), labels=('WM+CSF', 'Edge')
+    )
+    cifti_data, segments = _cifti_timeseries(str(cifti))
+    segments.update({k: np.array(v) + cifti_data.shape[0] for k, v in vol_segments.items()})
+    expected = _decimated_reference(np.vstack((cifti_data, vol_data)), segments)
+
+    dataset, segments, vminmax = ts.carpet_timeseries(
+        str(tmp_path / 'bold.nii.gz'),
+        in_segm=str(tmp_path / 'segm.nii.gz'),
+        in_cifti=str(cifti),
+        labels=('WM+CSF', 'Edge'),
+        chunk_bytes=nvols * 4 * 50,
+    )
+    # Empty segments (the cerebellum) are kept, so colors match their labels
+    assert list(segments) == list(expected)
+    assert not len(segments['CbL'])
+    for label, rows in expected.items():
+        assert np.array_equal(dataset[segments[label]], rows)
+    assert np.allclose(vminmax, _reference_vminmax(np.vstack((cifti_data, vol_data))))
@@ -0,0 +1,175 @@
+import os
+
+import h5py
+import nibabel as nb
+import nitransforms as nt
+import numpy as np
+
+from fmriprep.interfaces.resampling import ResampleSeries
+from fmriprep.utils import transforms as xfms
+
+
+def _write_composite(path, shape=(8, 9, 7), seed=0):
+    """Write an ITK composite (affine + displacement field) transform file."""
+    rng = np.random.default_rng(seed)
+    matrix = nb.affines.from_matvec(np.eye(3), rng.normal(0, 1, 3))
+    field = rng.normal(0, 1.5, (3, *shape))
+    origin, spacing = np.array([-10.0, -12.0, -8.0]), np.array([3.0, 3.0, 3.0])
+
+    with h5py.File(path, 'w') as h5:
+        group = h5.create_group('TransformGroup')
+        group.create_group('0')['TransformType'] = [b'CompositeTransform_double_3_3']
+        affine = group.create_group('1')
+        affine['TransformType'] = [b'AffineTransform_double_3_3']
+        affine['TransformParameters'] = np.hstack((matrix[:3, :3].ravel(), matrix[:3, 3]))
+        affine['TransformFixedParameters'] = np.zeros(3)
+        warp = group.create_group('2')
+        warp['TransformType'] = [b'DisplacementFieldTransform_float_3_3']
+        warp['TransformParameters'] = field.ravel(order='F')
+        warp['TransformFixedParameters'] = np.hstack((shape, origin, spacing, np.eye(3).ravel()))
+    return str(path)
+
+
+def _write_affine(path, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = nb.affines.from_matvec(np.eye(3), rng.normal(0, 1, 3))
+    nt.linear.Affine(matrix).to_filename(path, fmt='itk')
+    return str(path)
+
+
+def test_load_h5(tmp_path):
+    h5_file = _write_composite(tmp_path / 'anat2std.h5')
+    points = np.random.default_rng(4).uniform(-5, 15, (50, 3))
+    expected = nt.manip.load(h5_file, fmt='h5').map(points)
+
+    xfms._load_h5.cache_clear()
+    chain = xfms.load_h5(h5_file)
+    assert np.allclose(chain.map(points), expected, atol=1e-4)
+    # Loaded once per process, but chains are not shared
+    second = xfms.load_h5(h5_file)
+    assert second is not chain
+    assert all(a is b for a, b in zip(second.transforms, chain.transforms, strict=True))
+    assert xfms._load_h5.cache_info().hits == 1
+
+    # Converted once into the cache directory, then memory-mapped
+    cache_dir = tmp_path / 'cache'
+    chain = xfms.load_h5(h5_file, cache_dir=cache_dir)
+    assert np.allclose(chain.map(points), expected, atol=1e-4)
+    assert len(list(cache_dir.glob('*.json'))) == 1
+    fields = list(cache_dir.glob('*.npy'))
+    assert len(fields) == 1
+
+    xfms._load_h5.cache_clear()
+    chain = xfms.load_h5(h5_file, cache_dir=cache_dir)
+    assert isinstance(chain.transforms[0].deformation, np.memmap)
+    assert np.allclose(chain.map(points), expected, atol=1e-4)
+    assert list(cache_dir.glob('*.npy')) == fields
+
+    # Changes to the file invalidate the cache
+    _write_composite(h5_file, seed=5)
+    os.utime(h5_file, ns=(0, 0))
+    assert np.allclose(
+        xfms.load_h5(h5_file, cache_dir=cache_dir).map(points),
+        nt.manip.load(h5_file, fmt='h5').map(points),
+        atol=1e-4,
+    )
+    assert len(list(cache_dir.glob('*.json'))) == 2
+
+
+def test_deformation_field():
+    rng = np.random.default_rng(2)
+    affine = nb.affines.from_matvec(np.diag([2.0, 3.0, 2.5]), [-8.0, -10.0, -6.0])
+    reference = nb.Nifti1Image(np.zeros((7, 6, 8), dtype='u1'), affine)
+    grid = nt.base.ImageGrid(reference)
+    deformation = grid.ndcoords.reshape((7, 6, 8, 3)) + rng.normal(0, 1, (7, 6, 8, 3))
+
+    expected = nt.nonlinear.DenseFieldTransform(deformation, is_deltas=False, reference=reference)
+    xfm = xfms.DeformationField(deformation.astype('f4'), affine)
+    # On the grid of the field, off the grid, and outside the field
+    for points in (
+        grid.ras(rng.integers(0, 6, (20, 3))),
+        rng.uniform(-5, 5, (20, 3)),
+        np.array([[100.0, 100.0, 100.0]]),
+    ):
+        assert np.allclose(xfm.map(points), expected.map(points), atol=1e-4)
+
+
+def test_cached_coordinates(tmp_path):
+    reference = nb.Nifti1Image(np.zeros((6, 7, 5), dtype='u1'), np.diag([3.0, 3.0, 3.0, 1.0]))
+    h5_file = _write_composite(tmp_path / 'anat2std.h5')
+
+    expected = xfms.load_transforms([h5_file], [False]).map(
+        nt.base.SpatialReference.factory(reference).ndcoords
+    )
+    cached = xfms.cached_coordinates(reference, [h5_file], [False], tmp_path / 'cache')
+    assert isinstance(cached, np.memmap)
+    assert cached.dtype == np.float32
+    assert np.allclose(cached, expected, atol=1e-4)
+
+    # Reused as long as the grid and transforms are unchanged
+    cache_files = sorted((tmp_path / 'cache').glob('*.npy'))
+    assert len(cache_files) == 1
+    xfms.cached_coordinates(reference, [h5_file], [False], tmp_path / 'cache')
+    assert sorted((tmp_path / 'cache').glob('*.npy')) == cache_files
+
+    other = nb.Nifti1Image(np.zeros((6, 7, 4), dtype='u1'), reference.affine)
+    xfms.cached_coordinates(other, [h5_file], [False], tmp_path / 'cache')
+    assert len(list((tmp_path / 'cache').glob('*.npy'))) == 2
+
+
+def test_ResampleSeries_coordinates_cache(tmp_path):
+    rng = np.random.default_rng(1)
+    in_file = str(tmp_path / 'bold.nii.gz')
+    affine = np.diag([2.0, 2.0, 2.5, 1.0])
+    affine[:3, 3] = -10
+    nb.Nifti1Image(rng.uniform(100, 200, (10, 12, 8, 3)).astype('f4'), affine).to_filename(in_file)
+    transforms = [
+        _write_affine(tmp_path / 'boldref2anat.txt', seed=2),
+        _write_composite(tmp_path / 'anat2std.h5', seed=3),
+    ]
+    kwargs = {
+        'in_file': in_file,
+        'ref_file': in_file,
+        'transforms': transforms,
+        'jacobian': False,
+        'order': 1,
+    }
+
+    expected = nb.load(ResampleSeries(**kwargs).run(cwd=tmp_path).outputs.out_file).get_fdata()
+    for _ in range(2):
+        result = ResampleSeries(
+            coordinates_cache=str(tmp_path / 'cache'),
+            transforms_cache=str(tmp_path / 'cache'),
+            **kwargs,
+        ).run(cwd=tmp_path)
+        assert np.allclose(nb.load(result.outputs.out_file).get_fdata(), expected, atol=1e-3)
+    assert len(list((tmp_path / 'cache').glob('coordinates-*.npy'))) == 1
+
+
+def test_map_grid_coordinates(tmp_path):
+    reference = nb.Nifti1Image(np.zeros((6, 7, 5), dtype='u1'), np.diag([3.0, 3.0, 3.0, 1.0]))
+    xfm = xfms.load_transforms([_write_composite(tmp_path / 'anat2std.h5')], [False])
+    coordinates = nt.base.SpatialReference.factory(reference).ndcoords.astype('f4')
+    expected = xfm.map(coordinates).T
+    mask = np.random.default_rng(2).uniform(size=reference.shape) > 0.5
+
+    # Chunks do not need to align with slices, or to hold any masked point
+    for chunk_size in (1, 17, 1000):
+        mapped = xfms.map_grid_coordinates(reference, xfm, chunk_size=chunk_size)
+        assert mapped.shape == (3, 210)
+        assert mapped.dtype == np.float32
+        assert np.allclose(mapped, expected, atol=1e-4)
+
+        masked = xfms.map_grid_coordinates(reference, xfm, mask=mask, chunk_size=chunk_size)
+        assert np.allclose(masked, expected[:, mask.reshape(-1)], atol=1e-4)
+
+        # Coordinates calculated beforehand are mapped in place of the grid
+        out = np.zeros((210, 3), dtype='f4')
+        xfms.map_grid_coordinates(
+            reference,
+            nt.Affine(),
+            coordinates=expected.T,
+            out=out.T,
+            chunk_size=chunk_size,
+        )
+        assert np.allclose(out, expected.T, atol=1e-4)
@@ -0,0 +1,361 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Streaming extraction of carpet-plot timeseries.
+
+:func:`nireports.reportlets.nuisance.plot_carpet` keeps one out of every
+``int(1.8 * nrows // 900)`` rows of each segment before plotting.
+The functions in this module apply the same decimation *before* handing
+the data to the plot, so only the rows that end up in the figure are held in
+memory. The series are read in bounded-size chunks, from which the color
+limits of the carpet are calculated over all the rows, as the plot does
+before decimating.
+
+"""
+
+import nibabel as nb
+import numpy as np
+
+from . import tracing
+
+#: Number of rows :func:`~nireports.reportlets.nuisance.plot_carpet` targets
+CARPET_ROWS = 900
+#: Default upper bound (in bytes) of each chunk read from disk
+CHUNK_BYTES = 128 * 1024**2
+
+NIFTI_LABELS = ('Ctx GM', 'dGM', 'WM+CSF', 'Cb', 'Crown')
+CIFTI_LABELS = {
+    'CIFTI_STRUCTURE_CORTEX_LEFT': 'CtxL',
+    'CIFTI_STRUCTURE_CORTEX_RIGHT': 'CtxR',
+    'CIFTI_STRUCTURE_CEREBELLUM_LEFT': 'CbL',
+    'CIFTI_STRUCTURE_CEREBELLUM_RIGHT': 'CbR',
+}
+
+
+def decimation_factor(nrows: int, max_rows: int = CARPET_ROWS) -> int:
+    """
+    Calculate the row decimation factor applied by the carpet plot.
+
+    >>> decimation_factor(100)
+    0
+    >>> decimation_factor(100000)
+    200
+
+    """
+    return int((1.8 * nrows) // max_rows)
+
+
+def nifti_segments(segmentation, labels=NIFTI_LABELS, remap_rois=False, lut=None):
+    """
+    Calculate the foreground voxels and carpet segments of a NIfTI segmentation.
+
+    Mirrors :func:`niworkflows.utils.timeseries._nifti_timeseries`, without
+    touching the BOLD data.
+
+    Returns
+    -------
+    fg_index : :obj:`numpy.ndarray`
+        Flat (C-ordered) indices of the foreground voxels.
+    segments : :obj:`dict`
+        Mapping of labels to row indices into the foreground voxels.
+
+    """
+    segmentation = nb.load(segmentation) if isinstance(segmentation, str) else segmentation
+    segmentation = np.asanyarray(segmentation.dataobj, dtype=int).reshape(-1)
+
+    remap_rois = remap_rois or (len(np.unique(segmentation[segmentation > 0])) > len(labels))
+
+    if remap_rois or lut is not None:
+        if lut is None:
+            lut = np.zeros((256,), dtype='uint8')
+            lut[100:201] = 1  # Ctx GM
+            lut[30:99] = 2  # dGM
+            lut[1:11] = 3  # WM+CSF
+            lut[255] = 4  # Cerebellum
+        segmentation = lut[segmentation]
+
+    fg_index = np.flatnonzero(segmentation > 0)
+    segmentation = segmentation[fg_index]
+    segments = {labels[i - 1]: np.flatnonzero(segmentation == i) for i in np.unique(segmentation)}
+    return fg_index, segments
+
+
+def cifti_segments(dataset):
+    """Calculate carpet segments of a CIFTI2 dense timeseries from its header."""
+    dataset = nb.load(dataset) if isinstance(dataset, str) else dataset
+
+    if dataset.nifti_header.get_intent()[0] != 'ConnDenseSeries':
+        raise ValueError('Not a dense timeseries')
+
+    segments = {label: [] for label in list(CIFTI_LABELS.values()) + ['Other']}
+    for bm in dataset.header.matrix.get_index_map(1).brain_models:
+        label = CIFTI_LABELS.get(bm.brain_structure, 'Other')
+        segments[label] += list(range(bm.index_offset, bm.index_offset + bm.index_count))
+
+    return {label: np.array(idx, dtype=int) for label, idx in segments.items()}
+
+
+def decimate_segments(segments, nrows, max_rows=CARPET_ROWS):
+    """
+    Keep the rows of each segment that the carpet plot would keep.
+
+    Empty segments are kept, so segments are drawn with the same colors
+    and labels as if the plot decimated them.
+
+    >>> segs = {'a': np.arange(2000), 'b': np.arange(2000, 3000), 'c': np.array([], dtype=int)}
+    >>> dec = decimate_segments(segs, 3000)
+    >>> sorted(dec), len(dec['a']), dec['b'][:3].tolist(), len(dec['c'])
+    (['a', 'b', 'c'], 334, [2000, 2006, 2012], 0)
+    >>> decimate_segments(segs, 400) is segs
+    True
+
+    """
+    n_dec = decimation_factor(nrows, max_rows=max_rows)
+    if n_dec <= 1:
+        return segments
+    return {label: np.asanyarray(idx)[::n_dec] for label, idx in segments.items()}
+
+
+def streamed_percentiles(blocks, size, q=(2, 98)):
+    """
+    Calculate a low and a high percentile of values streamed in blocks.
+
+    The result is that of :func:`numpy.percentile` (with linear interpolation)
+    over all the values, but only the values in the tails of their distribution
+    are held in memory.
+
+    >>> values = np.random.default_rng(0).normal(size=10001)
+    >>> np.allclose(
+    ...     streamed_percentiles(np.array_split(values, 7), values.size),
+    ...     np.percentile(values, (2, 98)),
+    ... )
+    True
+
+    """
+    pos_lo, pos_hi = np.asanyarray(q, dtype=float) / 100 * (size - 1)
+    # Number of the smallest and largest values the percentiles are interpolated from
+    n_lo = min(int(pos_lo) + 2, size)
+    n_hi = size - int(pos_hi)
+
+    low = high = np.empty(0)
+    for block in blocks:
+        low = np.concatenate((low, np.ravel(block)))
+        if low.size > n_lo:
+            low = np.partition(low, n_lo - 1)[:n_lo]
+        high = np.concatenate((high, np.ravel(block)))
+        if high.size > n_hi:
+            high = np.partition(high, high.size - n_hi)[-n_hi:]
+    low.sort()
+    high.sort()
+
+    def _interpolate(values, pos):
+        index = int(pos)
+        if index + 1 >= values.size:
+            return values[index]
+        return values[index] + (pos - index) * (values[index + 1] - values[index])
+
+    return _interpolate(low, pos_lo), _interpolate(high, pos_hi - (size - n_hi))
+
+
+def _time_blocks(dataset, rows, chunk_bytes=CHUNK_BYTES):
+    """
+    Read blocks of consecutive timepoints of some voxels (NIfTI) or grayordinates (CIFTI2).
+
+    Yields the first timepoint of each block, and the block (``len(rows)`` x timepoints).
+    """
+    if isinstance(dataset, nb.Cifti2Image):
+        ntrs, nrows = dataset.shape
+    else:
+        ntrs, nrows = dataset.shape[-1], int(np.prod(dataset.shape[:3]))
+    step = max(chunk_bytes // (nrows * 4), 1)
+
+    for start in range(0, ntrs, step):
+        stop = min(start + step, ntrs)
+        if isinstance(dataset, nb.Cifti2Image):
+            block = np.asanyarray(dataset.dataobj[start:stop], dtype='float32').T
+        else:
+            block = np.asanyarray(dataset.dataobj[..., start:stop], dtype='float32')
+            block = block.reshape((nrows, stop - start))
+        yield start, block[rows]
+
+
+def _detrending(dataset, rows, chunk_bytes=CHUNK_BYTES):
+    """
+    Calculate the linear trends and standard deviations of some rows of a series.
+
+    These are what :func:`nilearn.signal.clean` removes when the carpet plot
+    detrends and standardizes its data: row ``i`` becomes
+    ``(data[i] - offset[i] - slope[i] * t) / std[i]``, with ``t`` the timepoints
+    centered on the middle of the series.
+    """
+    ntrs = dataset.shape[0] if isinstance(dataset, nb.Cifti2Image) else dataset.shape[-1]
+    t = np.arange(ntrs) - (ntrs - 1) / 2
+    tt = t @ t or 1.0
+
+    shift = None
+    sum_x = sum_tx = sum_xx = 0.0
+    for start, block in _time_blocks(dataset, rows, chunk_bytes=chunk_bytes):
+        block = block.astype('float64')
+        if shift is None:
+            # Sums of squares of values off by a row constant lose less precision
+            shift = block[:, :1].copy()
+        block -= shift
+        sum_x = sum_x + block.sum(axis=1)
+        sum_tx = sum_tx + block @ t[start : start + block.shape[1]]
+        sum_xx = sum_xx + np.einsum('ij,ij->i', block, block)
+
+    residuals = np.clip(sum_xx - sum_x**2 / ntrs - sum_tx**2 / tt, 0, None)
+    std = np.sqrt(residuals / max(ntrs - 1, 1))
+    std[std < np.finfo(np.float64).eps] = 1.0
+    return shift[:, 0] + sum_x / ntrs, sum_tx / tt, std
+
+
+def _read_carpet(sources, nrows, ntrs, drop_trs=0, chunk_bytes=CHUNK_BYTES):
+    """
+    Read the plotted rows of some series, and the color limits of their carpet plot.
+
+    Parameters
+    ----------
+    sources : :obj:`list` of :obj:`tuple`
+        For each series, the image, the rows (voxels or grayordinates) shown
+        in the plot before decimation, the positions of the retained rows among
+        them, and the positions where these go in the output.
+
+    """
+    dataset = np.zeros((nrows, ntrs), dtype='float32')
+    t = np.arange(ntrs) - (ntrs - 1) / 2
+
+    def _standardized():
+        for img, rows, keep, out in sources:
+            offset, slope, std = _detrending(img, rows, chunk_bytes=chunk_bytes)
+            for start, block in _time_blocks(img, rows, chunk_bytes=chunk_bytes):
+                stop = start + block.shape[1]
+                dataset[out, start:stop] = block[keep]
+                if stop > drop_trs:
+                    block = block[:, max(drop_trs - start, 0) :]
+                    yield (
+                        block - offset[:, None] - slope[:, None] * t[max(drop_trs, start) : stop]
+                    ) / std[:, None]
+
+    size = sum(len(rows) for _, rows, _, _ in sources) * max(ntrs - drop_trs, 0)
+    vminmax = streamed_percentiles(_standardized(), size) if size else None
+    return dataset, vminmax
+
+
+def _compact(segments, offset=0):
+    """Concatenate segment indices and renumber them as consecutive rows."""
+    new_segments = {}
+    for label, idx in segments.items():
+        new_segments[label] = np.arange(offset, offset + len(idx))
+        offset += len(idx)
+    rows = np.concatenate([np.asanyarray(idx, dtype=int) for idx in segments.values()] or [[]])
+    return rows.astype(int), new_segments
+
+
+@tracing.traced()
+def carpet_timeseries(
+    in_nifti,
+    in_segm=None,
+    in_cifti=None,
+    labels=NIFTI_LABELS,
+    remap_rois=False,
+    max_rows=CARPET_ROWS,
+    chunk_bytes=CHUNK_BYTES,
+    drop_trs=0,
+):
+    """
+    Extract the (decimated) data, segments and color limits to draw a carpet plot.
+
+    When ``in_cifti`` is given, grayordinates are placed first and the NIfTI
+    segments (if a segmentation is provided) are appended after them, as done
+    by :class:`~fmriprep.interfaces.confounds.FMRISummary`.
+    Only the rows retained by the carpet plot's decimation are kept in memory.
+
+    Returns
+    -------
+    dataset : :obj:`numpy.ndarray`
+        The retained rows (N x T).
+    segments : :obj:`dict` or ``None``
+        Mapping of segment labels to row indices into ``dataset``.
+    vminmax : :obj:`tuple`
+        The color limits the carpet plot calculates over all the rows, once
+        detrended and standardized (the 2nd and 98th percentiles, after
+        ``drop_trs`` timepoints), before decimating them.
+
+    """
+    nifti = nb.load(in_nifti, keep_file_open=True) if isinstance(in_nifti, str) else in_nifti
+    cifti = None
+    if in_cifti is not None:
+        cifti = nb.load(in_cifti, keep_file_open=True) if isinstance(in_cifti, str) else in_cifti
+
+    vol_segments = None
+    if in_segm is not None:
+        fg_index, vol_segments = nifti_segments(in_segm, labels=labels, remap_rois=remap_rois)
+        nvol = len(fg_index)
+    else:
+        fg_index = None
+        nvol = int(np.prod(nifti.shape[:3]))
+
+    if fg_index is None:
+        fg_index = np.arange(nvol)
+
+    if cifti is not None:
+        segments = cifti_segments(cifti)
+        ngrays = cifti.shape[-1]
+        if vol_segments is None:
+            # Volumetric data is not plotted at all
+            segments = decimate_segments(segments, ngrays, max_rows=max_rows)
+            rows, segments = _compact(segments)
+            sources = [(cifti, np.arange(ngrays), rows, slice(None))]
+            dataset, vminmax = _read_carpet(
+                sources, len(rows), cifti.shape[0], drop_trs=drop_trs, chunk_bytes=chunk_bytes
+            )
+            return dataset, segments, vminmax
+
+        segments.update({label: idx + ngrays for label, idx in vol_segments.items()})
+        segments = decimate_segments(segments, ngrays + nvol, max_rows=max_rows)
+        rows, segments = _compact(segments)
+        is_cifti = rows < ngrays
+        sources = [
+            (cifti, np.arange(ngrays), rows[is_cifti], is_cifti),
+            (nifti, fg_index, rows[~is_cifti] - ngrays, ~is_cifti),
+        ]
+        dataset, vminmax = _read_carpet(
+            sources, len(rows), cifti.shape[0], drop_trs=drop_trs, chunk_bytes=chunk_bytes
+        )
+        return dataset, segments, vminmax
+
+    if vol_segments is None:
+        n_dec = max(decimation_factor(nvol, max_rows=max_rows), 1)
+        rows, segments = np.arange(0, nvol, n_dec), None
+    else:
+        segments = decimate_segments(vol_segments, nvol, max_rows=max_rows)
+        rows, segments = _compact(segments)
+    dataset, vminmax = _read_carpet(
+        [(nifti, fg_index, rows, slice(None))],
+        len(rows),
+        nifti.shape[-1],
+        drop_trs=drop_trs,
+        chunk_bytes=chunk_bytes,
+    )
+    return dataset, segments, vminmax
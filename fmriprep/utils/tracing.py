@@ -0,0 +1,225 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""
+Tracing of the execution as spans, exported in the Chrome trace event format.
+
+Spans are recorded with :func:`span` (or the :func:`traced` decorator), and
+are a no-op unless tracing has been enabled with :func:`enable`.
+Enabling tracing sets the :data:`TRACE_ENV` environment variable, so the
+processes started afterwards (e.g., the workers of the execution plugin)
+record their spans in the same directory.
+Each process appends its events, one JSON object per line, to its own file,
+and :func:`export_chrome_trace` merges them into a single JSON file that can be
+opened with `Perfetto <https://ui.perfetto.dev>`__ or ``chrome://tracing``.
+
+>>> import json
+>>> from pathlib import Path
+>>> enable(testdir)
+>>> with span('outer', cat='test', size=3) as args:
+...     with span('inner', cat='test'):
+...         pass
+...     args['done'] = True
+>>> disable()
+>>> with span('ignored'):
+...     pass
+>>> trace = json.loads(Path(export_chrome_trace(testdir, testdir / "trace.json")).read_text())
+>>> [(ev['name'], ev.get('args')) for ev in trace['traceEvents'] if ev['ph'] == 'X']
+[('outer', {'size': 3, 'done': True}), ('inner', {})]
+
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+TRACE_ENV = 'FMRIPREP_TRACE_DIR'
+"""Environment variable holding the directory where spans are recorded."""
+
+_lock = threading.Lock()
+_files = {}  # Event files, by process ID (a forked process opens its own)
+
+
+def enable(trace_dir):
+    """Record spans of this process, and of the processes it starts, in ``trace_dir``."""
+    trace_dir = Path(trace_dir).absolute()
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    os.environ[TRACE_ENV] = str(trace_dir)
+
+
+def disable():
+    """Stop recording spans."""
+    os.environ.pop(TRACE_ENV, None)
+    with _lock:
+        events_file = _files.pop(os.getpid(), None)
+        if events_file is not None:
+            events_file.close()
+
+
+def enabled():
+    """Whether spans are being recorded."""
+    return bool(os.getenv(TRACE_ENV))
+
+
+def trace_dir():
+    """Directory where spans are being recorded, if tracing is enabled."""
+    return os.getenv(TRACE_ENV) or None
+
+
+def now():
+    """Current time, in microseconds since the epoch (the time base of the trace)."""
+    return time.time_ns() // 1000
+
+
+def _file():
+    """File of the current process, opened on its first event."""
+    pid = os.getpid()
+    if pid not in _files:
+        import multiprocessing as mp
+
+        trace_dir = Path(os.environ[TRACE_ENV])
+        trace_dir.mkdir(parents=True, exist_ok=True)
+        events_file = open(trace_dir / f'events-{socket.gethostname()}-{pid}.jsonl', 'a')  # noqa: SIM115
+        _files[pid] = events_file
+        name = mp.current_process().name
+        _write(
+            events_file, {'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}}
+        )
+    return _files[pid]
+
+
+def _write(f, event):
+    f.write(json.dumps(event, default=str) + '\n')
+    f.flush()
+
+
+def record(name, start, end, cat='fmriprep', args=None):
+    """
+    Record a span that started and ended at the given times (see :func:`now`).
+
+    Use this function for spans measured across processes (e.g., the time a node
+    waits in the queue), and :func:`span` otherwise.
+    """
+    if not enabled():
+        return
+    event = {
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': int(start),
+        'dur': max(int(end) - int(start), 0),
+        'pid': os.getpid(),
+        'tid': threading.get_native_id(),
+        'args': args or {},
+    }
+    with _lock:
+        _write(_file(), event)
+
+
+@contextmanager
+def span(name, cat='fmriprep', **args):
+    """
+    Record the execution of a block of code as a span.
+
+    Yields a dictionary of arguments of the span, which can be updated within
+    the block (e.g., with the size of the data processed).
+    """
+    if not enabled():
+        yield args
+        return
+    start = now()
+    try:
+        yield args
+    finally:
+        record(name, start, now(), cat=cat, args=args)
+
+
+def traced(name=None, cat='fmriprep'):
+    """Decorate a function to record each of its calls as a span."""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with span(span_name, cat=cat):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def read_events(trace_dir):
+    """
+    Read the events recorded in ``trace_dir``, sorted by time.
+
+    Lines that cannot be parsed (e.g., written by a process that was killed)
+    are skipped.
+    """
+    events = []
+    for events_file in sorted(Path(trace_dir).glob('events-*.jsonl')):
+        for line in events_file.read_text().splitlines():
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    events.sort(key=lambda ev: (ev['ph'] != 'M', ev.get('ts', 0)))
+    return events
+
+
+def export_chrome_trace(trace_dir, out_file, metadata=None):
+    """Merge the events recorded in ``trace_dir`` into a Chrome trace (JSON) file."""
+    events = read_events(trace_dir)
+    out_file = Path(out_file)
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    out_file.write_text(
+        json.dumps(
+            {
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': metadata or {},
+            }
+        )
+    )
+    return str(out_file)
+
+
+def load_spans(trace, cat=None):
+    """
+    Read the complete (``'X'``) events, optionally of one category, of a trace.
+
+    ``trace`` is either a Chrome trace file or a directory where events are recorded.
+    """
+    trace = Path(trace)
+    if trace.is_dir():
+        events = read_events(trace)
+    else:
+        events = json.loads(trace.read_text())['traceEvents']
+    return [ev for ev in events if ev['ph'] == 'X' and (cat is None or ev.get('cat') == cat)]
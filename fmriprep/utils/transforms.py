@@ -1,14 +1,30 @@
 """Utilities for loading transforms for resampling"""
 
+import hashlib
+import json
+import os
+from functools import lru_cache
 from pathlib import Path
 
+import nibabel as nb
 import nitransforms as nt
+import numpy as np
+from scipy import ndimage as ndi
 
+from . import tracing
 
-def load_transforms(xfm_paths: list[Path], inverse: list[bool]) -> nt.base.TransformBase:
+#: Number of grid points whose coordinates are generated and mapped at once
+COORDINATES_CHUNK = 2**18
+
+
+def load_transforms(
+    xfm_paths: list[Path], inverse: list[bool], cache_dir: Path | None = None
+) -> nt.base.TransformBase:
     """Load a series of transforms as a nitransforms TransformChain
 
-    An empty list will return an identity transform
+    An empty list will return an identity transform.
+    ITK composite (``.h5``) transforms are loaded with :func:`load_h5`,
+    converted once into ``cache_dir``, if given.
     """
     if len(inverse) == 1:
         inverse *= len(xfm_paths)
@@ -20,7 +36,7 @@ def load_transforms(xfm_paths: list[Path], inverse: list[bool]) -> nt.base.Trans
         path = Path(path)
         if path.suffix == '.h5':
             # Load as a TransformChain
-            xfm = nt.manip.load(path, fmt='h5')
+            xfm = load_h5(path, cache_dir=cache_dir)
         else:
             xfm = nt.linear.load(path)
         if inv:
@@ -32,3 +48,269 @@ def load_transforms(xfm_paths: list[Path], inverse: list[bool]) -> nt.base.Trans
     if chain is None:
         chain = nt.Affine()  # Identity
     return chain
+
+
+def split_dense_transforms(
+    xfm_paths: list[Path], inverse: list[bool]
+) -> tuple[tuple[list, list], tuple[list, list]]:
+    """Split a list of transforms at the first dense (``.h5``) transform
+
+    Transforms are applied from last to first, so the returned tail holds
+    the transforms closest to the target space, including every dense field
+    (e.g., ``[boldref2anat, anat2std]`` -> ``[boldref2anat]``, ``[anat2std]``).
+
+    >>> split_dense_transforms(['hmc.txt', 'coreg.txt', 'anat2std.h5'], [False])
+    ((['hmc.txt', 'coreg.txt'], [False, False]), (['anat2std.h5'], [False]))
+    >>> split_dense_transforms(['hmc.txt', 'coreg.txt'], [False, True])
+    ((['hmc.txt', 'coreg.txt'], [False, True]), ([], []))
+
+    """
+    xfm_paths = list(xfm_paths)
+    inverse = list(inverse) * (len(xfm_paths) if len(inverse) == 1 else 1)
+    dense = [i for i, path in enumerate(xfm_paths) if Path(path).suffix == '.h5']
+    split = dense[0] if dense else len(xfm_paths)
+    return (xfm_paths[:split], inverse[:split]), (xfm_paths[split:], inverse[split:])
+
+
+@tracing.traced()
+def map_grid_coordinates(
+    reference: nb.Nifti1Image,
+    xfm: nt.base.TransformBase,
+    coordinates: np.ndarray | None = None,
+    mask: np.ndarray | None = None,
+    out: np.ndarray | None = None,
+    chunk_size: int = COORDINATES_CHUNK,
+) -> np.ndarray:
+    """Map the physical coordinates of a grid through a transform, in chunks
+
+    The coordinates of ``chunk_size`` consecutive (C-ordered) grid points are
+    generated, mapped and written into ``out`` at a time, so the memory used
+    by the mapping (including the intermediate arrays of dense transforms)
+    does not grow with the size of the grid.
+
+    Parameters
+    ----------
+    reference
+        An image defining the grid.
+    xfm
+        The transform to map the coordinates through.
+    coordinates
+        Physical coordinates of the grid (``(N, 3)``, C-ordered), if they
+        have been calculated already (e.g., by :func:`cached_coordinates`).
+    mask
+        Boolean array with the shape of ``reference``. If given, only the
+        coordinates of the grid points within the mask are mapped.
+    out
+        Array of shape ``(3, M)`` where the mapped coordinates are written,
+        with ``M`` the number of (masked) grid points.
+        A new float32 array is allocated if not given.
+
+    Returns
+    -------
+    out
+        The mapped coordinates, with shape ``(3, M)``.
+    """
+    shape = reference.shape[:3]
+    npoints = int(np.prod(shape))
+    flat_mask = None if mask is None else mask.reshape(-1)
+    if out is None:
+        size = npoints if mask is None else int(np.count_nonzero(mask))
+        out = np.empty((3, size), dtype='f4')
+
+    grid = nt.base.ImageGrid(reference)
+    offset = 0
+    for start in range(0, npoints, chunk_size):
+        stop = min(start + chunk_size, npoints)
+        if coordinates is None:
+            ijk = np.stack(np.unravel_index(np.arange(start, stop), shape), axis=-1)
+            chunk = grid.ras(ijk).astype('f4')
+        else:
+            chunk = np.asarray(coordinates[start:stop])
+        if flat_mask is not None:
+            chunk = chunk[flat_mask[start:stop]]
+        if not len(chunk):
+            continue
+        out[:, offset : offset + len(chunk)] = np.asarray(xfm.map(chunk)).T
+        offset += len(chunk)
+    return out
+
+
+@tracing.traced()
+def cached_coordinates(
+    reference: nb.Nifti1Image,
+    xfm_paths: list[Path],
+    inverse: list[bool],
+    cache_dir: Path,
+    transforms_cache: Path | None = None,
+) -> np.ndarray:
+    """Map the physical coordinates of a grid through transforms, caching the result
+
+    Mapping a full template grid through a dense displacement field is
+    expensive, and is the same for every run of a subject that is resampled
+    into that template.
+    The mapped coordinates are stored as a float32 ``.npy`` file in ``cache_dir``,
+    keyed by the grid and the identity (path, size, modification time) of the
+    transforms, and are returned memory-mapped.
+    ``transforms_cache`` is passed on to :func:`load_transforms`.
+
+    Returns
+    -------
+    coordinates
+        An ``(N, 3)`` array of physical coordinates, in the C-order of the grid.
+    """
+    key = hashlib.sha256()
+    key.update(np.asarray(reference.shape[:3], dtype='i8').tobytes())
+    key.update(np.asarray(reference.affine, dtype='f8').tobytes())
+    for path, inv in zip(xfm_paths, inverse, strict=True):
+        path = Path(path).absolute()
+        stat = path.stat()
+        key.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}:{inv:d}'.encode())
+
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f'coordinates-{key.hexdigest()[:32]}.npy'
+    if not cache_file.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        xfm = load_transforms(xfm_paths, inverse, cache_dir=transforms_cache)
+        # Write aside and rename, so concurrent readers never see partial files
+        tmp_file = cache_dir / f'{cache_file.stem}.{os.getpid()}.npy'
+        mapped = np.lib.format.open_memmap(
+            tmp_file, mode='w+', dtype='f4', shape=(int(np.prod(reference.shape[:3])), 3)
+        )
+        map_grid_coordinates(reference, xfm, out=mapped.T)
+        mapped.flush()
+        del mapped
+        os.replace(tmp_file, cache_file)
+
+    return np.load(cache_file, mmap_mode='r')
+
+
+@tracing.traced()
+def load_h5(path: Path, cache_dir: Path | None = None) -> nt.manip.TransformChain:
+    """Load an ITK composite (``.h5``) transform as a nitransforms TransformChain
+
+    Equivalent to ``nt.manip.load(path, fmt='h5')``, but avoids decoding the
+    HDF5 file (and building the deformation field) more than once:
+
+    * Loaded transforms are kept in a process-level LRU cache, keyed by the path,
+      size and modification time of the file, so repeated loads are free.
+    * If ``cache_dir`` is given, the file is converted once into an uncompressed
+      float32 deformation field (``.npy``) plus affines (``.json``), which
+      other processes memory-map instead of decoding the HDF5 file.
+
+    The transforms within the returned chain are shared between callers.
+    """
+    path = Path(path).absolute()
+    stat = path.stat()
+    transforms = _load_h5(
+        str(path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        None if cache_dir is None else str(Path(cache_dir).absolute()),
+    )
+    # Chains are extended in place when composed, so only the transforms are shared
+    return nt.manip.TransformChain(list(transforms))
+
+
+@lru_cache(maxsize=4)
+def _load_h5(path: str, size: int, mtime_ns: int, cache_dir: str | None):
+    if cache_dir is None:
+        components = _read_h5(path)
+    else:
+        key = hashlib.sha256(f'{path}:{size}:{mtime_ns}'.encode()).hexdigest()[:32]
+        components = _read_converted(Path(cache_dir), f'transform-{key}', path)
+
+    # Same ordering as nitransforms.manip.load
+    return tuple(
+        nt.Affine(component) if affine is None else DeformationField(component, affine)
+        for component, affine in reversed(components)
+    )
+
+
+def _read_h5(path: str) -> list[tuple[np.ndarray, np.ndarray | None]]:
+    """Decode an ITK composite transform into ``(RAS affine, None)`` and
+    ``(deformation field, field affine)`` components, in file order."""
+    components = []
+    for xfm in nt.io.itk.ITKCompositeH5.from_filename(path):
+        if isinstance(xfm, nt.io.itk.ITKLinearTransform):
+            components.append((xfm.to_ras(), None))
+            continue
+        # Store positions rather than displacements, as DeformationField maps them
+        grid = nt.base.ImageGrid(xfm)
+        deformation = grid.ndcoords.reshape(xfm.shape) + np.asanyarray(xfm.dataobj)
+        components.append((deformation.astype('f4'), xfm.affine))
+    return components
+
+
+def _read_converted(cache_dir: Path, stem: str, path: str):
+    """Read a converted transform from ``cache_dir``, converting it first if necessary."""
+    index_file = cache_dir / f'{stem}.json'
+    if not index_file.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        index = []
+        for i, (component, affine) in enumerate(_read_h5(path)):
+            if affine is None:
+                index.append({'affine': component.tolist()})
+                continue
+            field_file = cache_dir / f'{stem}-{i}.npy'
+            # Write aside and rename, so concurrent readers never see partial files
+            tmp_file = cache_dir / f'{stem}-{i}.{os.getpid()}.npy'
+            np.save(tmp_file, component)
+            os.replace(tmp_file, field_file)
+            index.append({'field': field_file.name, 'affine': affine.tolist()})
+        # The index is written last, signaling the conversion is complete
+        tmp_file = cache_dir / f'{stem}.{os.getpid()}.json'
+        tmp_file.write_text(json.dumps({'source': path, 'transforms': index}))
+        os.replace(tmp_file, index_file)
+
+    components = []
+    for entry in json.loads(index_file.read_text())['transforms']:
+        affine = np.array(entry['affine'])
+        if 'field' in entry:
+            components.append((np.load(cache_dir / entry['field'], mmap_mode='r'), affine))
+        else:
+            components.append((affine, None))
+    return components
+
+
+class DeformationField(nt.base.TransformBase):
+    """A dense field of deformations (mapped positions) on the grid of ``affine``
+
+    Maps coordinates like ``nt.nonlinear.DenseFieldTransform(field, is_deltas=False)``,
+    but uses ``deformation`` as given: the nitransforms constructor copies its input
+    and recalculates the coordinates of the grid, which would defeat memory mapping.
+    """
+
+    __slots__ = ('deformation',)
+
+    def __init__(self, deformation: np.ndarray, affine: np.ndarray):
+        super().__init__(
+            reference=nb.Nifti1Image(np.zeros(deformation.shape[:3], dtype='u1'), affine)
+        )
+        self.deformation = deformation
+
+    @property
+    def ndim(self) -> int:
+        return self.deformation.shape[-1]
+
+    def map(self, x, inverse: bool = False) -> np.ndarray:
+        if inverse:
+            raise NotImplementedError
+        x = np.asanyarray(x)
+        ijk = self.reference.index(x.astype('f4'))
+        indexes = np.round(ijk).astype(int)
+        if np.all(np.linalg.norm(ijk - indexes, axis=1) < 1e-3):
+            return np.asarray(self.deformation[tuple(indexes.T)])
+
+        mapped = np.stack(
+            [
+                ndi.map_coordinates(
+                    self.deformation[..., i], ijk.T, order=3, mode='constant', cval=np.nan
+                )
+                for i in range(self.ndim)
+            ],
+            axis=-1,
+        )
+        # Coordinates outside the field are not displaced
+        outside = np.isnan(mapped)
+        mapped[outside] = x[outside]
+        return mapped
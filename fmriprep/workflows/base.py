@@ -37,7 +37,9 @@ from copy import deepcopy
 
 import bids
 from nipype.interfaces import utility as niu
+from nipype.interfaces.base import isdefined
 from nipype.pipeline import engine as pe
+from nipype.utils.functions import getsource
 from niworkflows.utils.connections import listify
 from packaging.version import Version
 
@@ -46,6 +48,9 @@ from ..interfaces import DerivativesDataSink
 from ..interfaces.reports import AboutSummary, SubjectSummary
 from ..utils.bids import dismiss_echo
 
+#: Fieldmap inputs of BOLD workflows, selected once per fieldmap for all runs of a subject
+FMAP_FIELDS = ['fmap', 'fmap_ref', 'fmap_coeff', 'fmap_mask', 'sdc_method']
+
 
 def init_fmriprep_wf():
     """
@@ -186,6 +191,8 @@ def init_single_subject_wf(
 
     from fmriprep.interfaces.bids import BIDSSourceFile, CreateFreeSurferID
     from fmriprep.workflows.bold.base import init_bold_wf
+    from fmriprep.workflows.bold.confounds import init_anat_confounds_wf
+    from fmriprep.workflows.bold.fit import collect_sbrefs
 
     if name is None:
         name = f'sub_{subject_id}_wf'
@@ -505,7 +512,7 @@ It is released under the [CC0]\
         # This can lead to duplication in the working directory if people actually
         # want MNI152NLin6Asym outputs, but we'll live with it.
         if config.workflow.cifti_output:
-            from smriprep.interfaces.templateflow import TemplateFlowSelect
+            from ..utils.templates import template_mask
 
             ref = Reference(
                 'MNI152NLin6Asym',
@@ -517,10 +524,12 @@ It is released under the [CC0]\
                 name='select_MNI6',
                 run_without_submitting=True,
             )
+            # Resolved at build time, once per process
             select_MNI6_tpl = pe.Node(
-                TemplateFlowSelect(template=ref.fullname, resolution=ref.spec['res']),
+                niu.IdentityInterface(fields=['brain_mask']),
                 name='select_MNI6_tpl',
             )
+            select_MNI6_tpl.inputs.brain_mask = str(template_mask(ref.space, ref.spec['res']))
             workflow.connect([
                 (anat_fit_wf, select_MNI6_xfm, [
                     ('outputnode.anat2std_xfm', 'anat2std_xfm'),
@@ -617,7 +626,7 @@ It is released under the [CC0]\
             ])  # fmt:skip
 
     if config.workflow.anat_only:
-        return clean_datasinks(workflow)
+        return _optimize(clean_datasinks(workflow))
 
     fmap_cache = {}
     if config.execution.derivatives:
@@ -641,7 +650,7 @@ It is released under the [CC0]\
         ignore_fieldmaps='fieldmaps' in config.workflow.ignore,
         use_syn=config.workflow.use_syn_sdc,
         force_syn='syn-sdc' in config.workflow.force,
-        filters=config.execution.get().get('bids_filters', {}).get('fmap'),
+        filters=(config.execution.bids_filters or {}).get('fmap'),
     )
 
     fmap_buffers = {
@@ -650,6 +659,9 @@ It is released under the [CC0]\
     }
 
     estimator_types = {est.bids_id: est.method for est in all_estimators}
+    fmap_sources = {
+        est.bids_id: sorted(str(source.path) for source in est.sources) for est in all_estimators
+    }
     fmap_estimators = []
     if all_estimators:
         # Find precomputed fieldmaps that apply to this workflow
@@ -833,6 +845,26 @@ tasks and sessions), the following preprocessing was performed.
             )
         config.workflow.bold2anat_init = 't2w' if has_t2w else 't1w'
 
+    # Run-invariant lookups and nodes are shared by all BOLD runs of the subject
+    sbref_files = collect_sbrefs(
+        bold_runs,
+        entity_overrides=(config.execution.bids_filters or {}).get('sbref', {}),
+        layout=config.execution.layout,
+    )
+    fmap_selects = {}
+    anat_confounds_wf = None
+    if config.workflow.level == 'full' and select_MNI2009c_xfm is not None:
+        anat_confounds_wf = init_anat_confounds_wf()
+        workflow.connect([
+            (anat_fit_wf, anat_confounds_wf, [
+                ('outputnode.t1w_preproc', 'inputnode.t1w_preproc'),
+                ('outputnode.t1w_tpms', 'inputnode.t1w_tpms'),
+            ]),
+            (select_MNI2009c_xfm, anat_confounds_wf, [
+                ('std2anat_xfm', 'inputnode.std2anat_xfm'),
+            ]),
+        ])  # fmt:skip
+
     for bold_series in bold_runs:
         bold_file = bold_series[0]
         fieldmap_id = estimator_map.get(bold_file)
@@ -873,11 +905,47 @@ tasks and sessions), the following preprocessing was performed.
                     )
                 )
 
+        fit_cache = None
+        # Derivatives provided by the user take precedence over the fit cache
+        if config.execution.fit_cache_dir and not any(functional_cache.values()):
+            from fmriprep.utils.fitcache import (
+                derivative_files,
+                fit_options,
+                fit_signature,
+                load_fit_cache,
+            )
+
+            fit_cache = fit_signature(
+                {
+                    'bold': bold_series,
+                    'sbref': sbref_files[bold_file],
+                    't1w': subject_data['t1w'],
+                    't2w': subject_data['t2w'],
+                    'flair': subject_data['flair'],
+                    # The anatomical reference may be (partly) precomputed
+                    'anat_derivatives': derivative_files(anatomical_cache),
+                    'fmap': fmap_sources.get(fieldmap_id, []),
+                },
+                dict(fit_options(), fieldmap_id=fieldmap_id, jacobian=jacobian),
+                config.environment.version,
+                cache_dir=config.execution.fit_cache_dir,
+            )
+            functional_cache = load_fit_cache(config.execution.fit_cache_dir, fit_cache['key'])
+            if functional_cache:
+                config.loggers.workflow.info(
+                    f'Reusing fit-stage outputs of <{bold_file}> from the fit cache '
+                    f'(entry {fit_cache["key"][:12]}).'
+                )
+
         bold_wf = init_bold_wf(
             bold_series=bold_series,
             precomputed=functional_cache,
             fieldmap_id=fieldmap_id,
+            fmap_selected=bool(fieldmap_id),
+            sbref_files=sbref_files[bold_file],
             jacobian=jacobian,
+            anat_masks=anat_confounds_wf is not None,
+            fit_cache=fit_cache,
         )
         if bold_wf is None:
             continue
@@ -904,10 +972,30 @@ tasks and sessions), the following preprocessing was performed.
             ]),
         ])  # fmt:skip
 
+        if fieldmap_id and fieldmap_id not in fmap_selects:
+            fmap_selects[fieldmap_id] = pe.Node(
+                KeySelect(fields=FMAP_FIELDS, key=fieldmap_id),
+                name=f'fmap_select_{re.sub(r"[^a-zA-Z0-9]", "", fieldmap_id)}',
+                run_without_submitting=True,
+            )
+            workflow.connect([
+                (fmap_buffers['fmap_id'], fmap_selects[fieldmap_id], [('out', 'keys')]),
+            ] + [
+                (fmap_buffers[field], fmap_selects[fieldmap_id], [('out', field)])
+                for field in FMAP_FIELDS
+            ])  # fmt:skip
+
         workflow.connect([
             (buffer, bold_wf, [('out', f'inputnode.{field}')])
             for field, buffer in fmap_buffers.items()
+            if not fieldmap_id or field not in FMAP_FIELDS
         ])  # fmt:skip
+        if fieldmap_id:
+            workflow.connect([
+                (fmap_selects[fieldmap_id], bold_wf, [
+                    (field, f'inputnode.{field}') for field in FMAP_FIELDS
+                ]),
+            ])  # fmt:skip
 
         if config.workflow.level == 'full':
             if template_iterator_wf is not None:
@@ -928,6 +1016,14 @@ tasks and sessions), the following preprocessing was performed.
                     ]),
                 ])  # fmt:skip
 
+            if anat_confounds_wf is not None:
+                workflow.connect([
+                    (anat_confounds_wf, bold_wf, [
+                        ('outputnode.acompcor_masks', 'inputnode.acompcor_masks'),
+                        ('outputnode.carpet_dseg', 'inputnode.carpet_dseg'),
+                    ]),
+                ])  # fmt:skip
+
             # Thread MNI152NLin6Asym standard outputs to CIFTI subworkflow, skipping
             # the iterator, which targets only output spaces.
             # This can lead to duplication in the working directory if people actually
@@ -942,7 +1038,7 @@ tasks and sessions), the following preprocessing was performed.
                     ]),
                 ])  # fmt:skip
 
-    return clean_datasinks(workflow)
+    return _optimize(clean_datasinks(workflow))
 
 
 def map_fieldmap_estimation(
@@ -1023,6 +1119,12 @@ def map_fieldmap_estimation(
     return fmap_estimators, estimator_map
 
 
+def _optimize(workflow: pe.Workflow) -> pe.Workflow:
+    if config.workflow.fuse_nodes:
+        workflow = fuse_trivial_nodes(workflow)
+    return workflow
+
+
 def clean_datasinks(workflow: pe.Workflow) -> pe.Workflow:
     # Overwrite ``out_path_base`` of smriprep's DataSinks
     for node in workflow.list_node_names():
@@ -1031,6 +1133,180 @@ def clean_datasinks(workflow: pe.Workflow) -> pe.Workflow:
     return workflow
 
 
+#: Interfaces that only shuffle their inputs around, and are always cheap to run
+BOOKKEEPING_INTERFACES = ('Select', 'Merge', 'KeySelect', 'DictMerge')
+
+
+def fuse_trivial_nodes(workflow: pe.Workflow) -> pe.Workflow:
+    """
+    Fold cheap bookkeeping nodes into the connections of their consumers.
+
+    Every node creates a working directory, a results file and a hash check
+    when it runs, which is significant overhead for nodes that merely select
+    an item from a list or apply a tiny function.
+    A node is folded when it is a plain :class:`~nipype.pipeline.engine.Node`
+    (no iterables, not a join source) with exactly one connected input, and it
+    is either a :class:`~nipype.interfaces.utility.Select` or a
+    :class:`~nipype.interfaces.utility.Function` flagged as
+    ``run_without_submitting``.
+    The node is removed and its operation is applied as a connection function
+    on each of its outgoing connections, composing with any existing connection
+    functions, so chains of such nodes collapse.
+    Remaining bookkeeping nodes (see :data:`BOOKKEEPING_INTERFACES`) are run
+    in the main process, without being dispatched to a worker.
+
+    """
+    joinsources = set()
+    protected = set()
+    for wf in _iter_workflows(workflow):
+        for node in wf._graph.nodes():
+            if isinstance(node, pe.JoinNode):
+                joinsources.update(listify(node.joinsource))
+        # Nodes connected from outside their own workflow are left alone
+        for src, dst, data in wf._graph.edges(data=True):
+            for src_spec, dest in data['connect']:
+                src_name = src_spec[0] if isinstance(src_spec, tuple) else src_spec
+                if isinstance(src, pe.Workflow):
+                    protected.add(id(src.get_node(src_name.rsplit('.', 1)[0])))
+                if isinstance(dst, pe.Workflow):
+                    protected.add(id(dst.get_node(dest.rsplit('.', 1)[0])))
+
+    for wf in _iter_workflows(workflow):
+        folded = True
+        while folded:
+            folded = False
+            for node in list(wf._graph.nodes()):
+                if id(node) in protected or node.name in joinsources:
+                    continue
+                if _fold_node(wf, node):
+                    folded = True
+
+        for node in wf._graph.nodes():
+            if (
+                isinstance(node, pe.Node)
+                and not isinstance(node, pe.Workflow)
+                and type(node.interface).__name__ in BOOKKEEPING_INTERFACES
+            ):
+                node.run_without_submitting = True
+
+    return workflow
+
+
+def _iter_workflows(workflow):
+    yield workflow
+    for node in workflow._graph.nodes():
+        if isinstance(node, pe.Workflow):
+            yield from _iter_workflows(node)
+
+
+def _connection_steps(src_spec):
+    """Split a connection source into its output name and function steps."""
+    if isinstance(src_spec, tuple):
+        name, function_source, args = src_spec
+        if function_source == getsource(_fused):
+            return name, list(args[0])
+        return name, [(function_source, tuple(args))]
+    return src_spec, []
+
+
+def _fold_step(node, in_name):
+    """Calculate the connection step and output names of a foldable node."""
+    if type(node) is not pe.Node or node.iterables:
+        return None
+
+    interface = node.interface
+    if isinstance(interface, niu.Select) and in_name == 'inlist':
+        if not isdefined(interface.inputs.index):
+            return None
+        return (getsource(_select_item), (interface.inputs.index,)), ['out']
+
+    if isinstance(interface, niu.Function) and node.run_without_submitting:
+        kwargs = {
+            key: value
+            for key, value in interface.inputs.get().items()
+            if key not in ('function_str', in_name) and isdefined(value)
+        }
+        step = (getsource(_call_function), (interface.inputs.function_str, in_name, kwargs))
+        return step, interface._output_names
+
+    return None
+
+
+def _fold_node(wf, node):
+    """Replace ``node`` with connection functions on its outgoing connections."""
+    if not isinstance(node, pe.Node) or isinstance(node, pe.Workflow):
+        return False
+
+    in_edges = list(wf._graph.in_edges(node, data=True))
+    out_edges = list(wf._graph.out_edges(node, data=True))
+    if len(in_edges) != 1 or not out_edges:
+        return False
+
+    if len(in_edges[0][2]['connect']) != 1:
+        return False
+    in_name = in_edges[0][2]['connect'][0][1]
+
+    fold = _fold_step(node, in_name)
+    if fold is None:
+        return False
+    step, outputs = fold
+
+    src, _, data = in_edges[0]
+    src_name, upstream_steps = _connection_steps(data['connect'][0][0])
+
+    new_edges = []
+    for _, dst, out_data in out_edges:
+        connects = []
+        for out_spec, dest in out_data['connect']:
+            out_name, downstream_steps = _connection_steps(out_spec)
+            output_step = []
+            if len(outputs) > 1:
+                output_step = [(getsource(_get_item), (outputs.index(out_name),))]
+            steps = tuple(upstream_steps + [step] + output_step + downstream_steps)
+            connects.append(((src_name, getsource(_fused), (steps,)), dest))
+        new_edges.append((dst, connects))
+
+    wf._graph.remove_node(node)
+    for dst, connects in new_edges:
+        edge_data = wf._graph.get_edge_data(src, dst)
+        if edge_data:
+            edge_data['connect'].extend(connects)
+        else:
+            wf._graph.add_edge(src, dst, connect=connects)
+    return True
+
+
+def _fused(value, steps):
+    """Apply a sequence of connection functions (``(source, args)`` pairs) to ``value``."""
+    from nipype.utils.functions import create_function_from_source
+
+    for function_source, args in steps:
+        value = create_function_from_source(function_source)(value, *args)
+    return value
+
+
+def _select_item(inlist, index):
+    """Connection-function equivalent of :class:`~nipype.interfaces.utility.Select`."""
+    import numpy as np
+
+    if not isinstance(inlist, list | tuple):
+        inlist = [inlist]
+    out = np.array(inlist, dtype=object)[np.array(index)].tolist()
+    return out[0] if len(out) == 1 else out
+
+
+def _get_item(value, index):
+    """Pick one output of a multiple-output function."""
+    return value[index]
+
+
+def _call_function(value, function_str, in_name, kwargs):
+    """Connection-function equivalent of a :class:`~nipype.interfaces.utility.Function` node."""
+    from nipype.utils.functions import create_function_from_source
+
+    return create_function_from_source(function_str)(**{in_name: value}, **kwargs)
+
+
 def get_estimator(layout, fname):
     field_source = layout.get_metadata(fname).get('B0FieldSource')
     if isinstance(field_source, str):
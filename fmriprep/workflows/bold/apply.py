@@ -19,7 +19,12 @@ def init_bold_volumetric_resample_wf(
     jacobian: bool,
     fallback_total_readout_time: str | float | None = None,
     fieldmap_id: str | None = None,
+    fmap_selected: bool = False,
     omp_nthreads: int = 1,
+    mask_dilation: int | None = None,
+    resampling_cache: str | None = None,
+    quantize: str | None = None,
+    quantize_tolerance: float = 0.01,
     name: str = 'bold_volumetric_resample_wf',
 ) -> pe.Workflow:
     """Resample a BOLD series to a volumetric target space.
@@ -48,8 +53,29 @@ def init_bold_volumetric_resample_wf(
         BIDS metadata for BOLD file.
     fieldmap_id
         Fieldmap identifier, if fieldmap correction is to be applied.
+    fmap_selected
+        Whether ``fmap_ref`` and ``fmap_coeff`` hold the files of ``fieldmap_id``
+        (e.g., selected once for all the runs of a subject), rather than lists
+        collated with ``fmap_id``.
     omp_nthreads
         Maximum number of threads an individual process may use.
+    mask_dilation
+        If set, only voxels within ``target_mask`` dilated by this number of
+        voxels are resampled, and the rest of the target grid is filled with zeros.
+        The target grid itself (shape and affine) is not cropped.
+        Useful when the resampled series is only consumed within a region,
+        e.g., sampled onto surfaces from within the cortical ribbon.
+    resampling_cache
+        Directory where ``anat2std_xfm``, converted for fast loading, and the target grid
+        mapped through it are cached, so they are only calculated once for all runs
+        of a subject.
+    quantize
+        If set (``'int16'`` or ``'uint16'``), store the resampled series as scaled
+        integers of this type whenever the quantization error is within
+        ``quantize_tolerance`` times its median temporal standard deviation
+        (see :func:`~fmriprep.interfaces.resampling.quantize_series`).
+    quantize_tolerance
+        Maximum quantization error, relative to the median temporal standard deviation.
     name
         Name of workflow (default: ``bold_volumetric_resample_wf``)
 
@@ -85,6 +111,8 @@ def init_bold_volumetric_resample_wf(
     -------
     bold_file
         The ``bold_file`` input, resampled to ``target_ref_file`` space.
+    bold_meta
+        Sidecar metadata of ``bold_file`` (e.g., its quantization).
     resampling_reference
         An empty reference image with the correct affine and header for resampling
         further images into the BOLD series' space.
@@ -118,7 +146,7 @@ def init_bold_volumetric_resample_wf(
     )
 
     outputnode = pe.Node(
-        niu.IdentityInterface(fields=['bold_file', 'resampling_reference']),
+        niu.IdentityInterface(fields=['bold_file', 'bold_meta', 'resampling_reference']),
         name='outputnode',
     )
 
@@ -150,17 +178,42 @@ def init_bold_volumetric_resample_wf(
         (boldref2target, bold2target, [('out', 'in2')]),
         (bold2target, resample, [('out', 'transforms')]),
         (gen_ref, outputnode, [('out_file', 'resampling_reference')]),
-        (resample, outputnode, [('out_file', 'bold_file')]),
+        (resample, outputnode, [
+            ('out_file', 'bold_file'),
+            ('out_meta', 'bold_meta'),
+        ]),
     ])  # fmt:skip
 
+    if quantize is not None:
+        resample.inputs.quantize = quantize
+        resample.inputs.quantize_tolerance = quantize_tolerance
+
+    if resampling_cache is not None:
+        resample.inputs.coordinates_cache = resampling_cache
+        resample.inputs.transforms_cache = resampling_cache
+
+    if mask_dilation is not None:
+        resample.inputs.mask_dilation = mask_dilation
+        workflow.connect([(inputnode, resample, [('target_mask', 'mask_file')])])
+
     if not fieldmap_id:
         return workflow
 
-    fmap_select = pe.Node(
-        KeySelect(fields=['fmap_ref', 'fmap_coeff'], key=fieldmap_id),
-        name='fmap_select',
-        run_without_submitting=True,
-    )
+    fmap_select = inputnode
+    if not fmap_selected:
+        fmap_select = pe.Node(
+            KeySelect(fields=['fmap_ref', 'fmap_coeff'], key=fieldmap_id),
+            name='fmap_select',
+            run_without_submitting=True,
+        )
+        workflow.connect([
+            (inputnode, fmap_select, [
+                ('fmap_ref', 'fmap_ref'),
+                ('fmap_coeff', 'fmap_coeff'),
+                ('fmap_id', 'keys'),
+            ]),
+        ])  # fmt:skip
+
     distortion_params = pe.Node(
         DistortionParameters(
             metadata=metadata,
@@ -177,13 +230,10 @@ def init_bold_volumetric_resample_wf(
     )
 
     fmap_recon = pe.Node(ReconstructFieldmap(), name='fmap_recon', mem_gb=1)
+    if resampling_cache is not None:
+        fmap_recon.inputs.transforms_cache = resampling_cache
 
     workflow.connect([
-        (inputnode, fmap_select, [
-            ('fmap_ref', 'fmap_ref'),
-            ('fmap_coeff', 'fmap_coeff'),
-            ('fmap_id', 'keys'),
-        ]),
         (inputnode, distortion_params, [('bold_file', 'in_file')]),
         (inputnode, fmap2target, [('boldref2fmap_xfm', 'in1')]),
         (gen_ref, fmap_recon, [('out_file', 'target_ref_file')]),
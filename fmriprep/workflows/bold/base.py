@@ -57,7 +57,11 @@ def init_bold_wf(
     bold_series: list[str],
     precomputed: dict | None = None,
     fieldmap_id: str | None = None,
+    fmap_selected: bool = False,
+    sbref_files: list[str] | None = None,
     jacobian: bool = False,
+    anat_masks: bool = False,
+    fit_cache: dict | None = None,
 ) -> pe.Workflow:
     """
     This workflow controls the functional preprocessing stages of *fMRIPrep*.
@@ -86,6 +90,21 @@ def init_bold_wf(
     fieldmap_id
         ID of the fieldmap to use to correct this BOLD series. If :obj:`None`,
         no correction will be applied.
+    fmap_selected
+        Whether the ``fmap_*`` inputs hold the fieldmap files of ``fieldmap_id``
+        (e.g., selected once for all the runs of a subject), rather than lists
+        collated with ``fmap_id``.
+    sbref_files
+        Single-band reference files of the series, sorted by echo time.
+        Queried from the layout if :obj:`None`.
+    anat_masks
+        Whether the aCompCor masks and the carpetplot parcellation are provided in
+        anatomical space through the ``acompcor_masks`` and ``carpet_dseg`` inputs
+        (see :func:`~fmriprep.workflows.bold.confounds.init_anat_confounds_wf`),
+        rather than generated for this series.
+    fit_cache
+        Signature of the fit stage of this series, under which its outputs are
+        stored in the fit cache (see :func:`~fmriprep.workflows.bold.fit.init_bold_fit_wf`).
 
     Inputs
     ------
@@ -142,6 +161,10 @@ def init_bold_wf(
         Brain (binary) mask of the MNI152NLin6Asym reference image
     mni2009c2anat_xfm
         Transform from MNI152NLin2009cAsym to anatomical space
+    acompcor_masks
+        CSF, WM and combined aCompCor masks in T1w space (if ``anat_masks``)
+    carpet_dseg
+        Carpetplot parcellation in T1w space (if ``anat_masks``)
 
     Note that ``anat2std_xfm``, ``std_space``, ``std_resolution``,
     ``std_t1w`` and ``std_mask`` are treated as single
@@ -233,6 +256,9 @@ configured with cubic B-spline interpolation.
                 'mni6_mask',
                 # MNI152NLin2009cAsym inverse warp, for carpetplotting
                 'mni2009c2anat_xfm',
+                # Anatomical masks, shared by all runs
+                'acompcor_masks',
+                'carpet_dseg',
             ],
         ),
         name='inputnode',
@@ -246,7 +272,10 @@ configured with cubic B-spline interpolation.
         bold_series=bold_series,
         precomputed=precomputed,
         fieldmap_id=fieldmap_id,
+        fmap_selected=fmap_selected,
+        sbref_files=sbref_files,
         jacobian=jacobian,
+        fit_cache=fit_cache,
         omp_nthreads=omp_nthreads,
     )
 
@@ -287,6 +316,7 @@ configured with cubic B-spline interpolation.
     bold_native_wf = init_bold_native_wf(
         bold_series=bold_series,
         fieldmap_id=fieldmap_id,
+        fmap_selected=fmap_selected,
         jacobian=jacobian,
         omp_nthreads=omp_nthreads,
     )
@@ -380,46 +410,71 @@ configured with cubic B-spline interpolation.
     )
     merge_bold_sources.inputs.in1 = bold_series
 
-    # Resample to anatomical space
-    bold_anat_wf = init_bold_volumetric_resample_wf(
-        metadata=all_metadata[0],
-        fallback_total_readout_time=config.workflow.fallback_total_readout_time,
-        fieldmap_id=fieldmap_id if not multiecho else None,
-        omp_nthreads=omp_nthreads,
-        mem_gb=mem_gb,
-        jacobian=jacobian,
-        name='bold_anat_wf',
+    # Resample to anatomical space, only if the series is written out or sampled onto surfaces
+    anat_out = bool(nonstd_spaces.intersection(('anat', 'T1w')))
+    surface_out = bool(config.workflow.run_reconall and freesurfer_spaces)
+    goodvoxels_out = config.workflow.project_goodvoxels and (
+        config.workflow.cifti_output or surf_std
     )
-    bold_anat_wf.inputs.inputnode.resolution = 'native'
+    anat_needed = anat_out or surface_out or goodvoxels_out or config.workflow.cifti_output
+    # Surface sampling only reads from within the cortical ribbon: the series keeps the full
+    # T1w grid, but voxels away from the ribbon are zero-filled rather than interpolated.
+    # The goodvoxels mask is written out, and is estimated over the whole brain.
+    ribbon_only = not anat_out and not goodvoxels_out and config.workflow.run_reconall
+    # Skip the empty field of view around the brain in standard spaces
+    std_mask_dilation = 4 if config.workflow.resample_within_mask else None
+    # Template transforms and grids mapped through them are shared by all runs of a subject
+    resampling_cache = str(config.execution.work_dir / 'resampling_cache')
+
+    if anat_needed:
+        bold_anat_wf = init_bold_volumetric_resample_wf(
+            metadata=all_metadata[0],
+            fallback_total_readout_time=config.workflow.fallback_total_readout_time,
+            fieldmap_id=fieldmap_id if not multiecho else None,
+            fmap_selected=fmap_selected,
+            omp_nthreads=omp_nthreads,
+            mem_gb=mem_gb,
+            jacobian=jacobian,
+            mask_dilation=2 if ribbon_only else None,
+            # Only quantize series that are written out
+            quantize=config.workflow.quantize_outputs if anat_out else None,
+            quantize_tolerance=config.workflow.quantize_tolerance,
+            name='bold_anat_wf',
+        )
+        bold_anat_wf.inputs.inputnode.resolution = 'native'
+
+        workflow.connect([
+            (inputnode, bold_anat_wf, [
+                ('t1w_preproc', 'inputnode.target_ref_file'),
+                ('anat_ribbon' if ribbon_only else 't1w_mask', 'inputnode.target_mask'),
+                ('fmap_ref', 'inputnode.fmap_ref'),
+                ('fmap_coeff', 'inputnode.fmap_coeff'),
+                ('fmap_id', 'inputnode.fmap_id'),
+            ]),
+            (bold_fit_wf, bold_anat_wf, [
+                ('outputnode.coreg_boldref', 'inputnode.bold_ref_file'),
+                ('outputnode.boldref2fmap_xfm', 'inputnode.boldref2fmap_xfm'),
+                ('outputnode.boldref2anat_xfm', 'inputnode.boldref2anat_xfm'),
+            ]),
+            (bold_native_wf, bold_anat_wf, [
+                ('outputnode.bold_minimal', 'inputnode.bold_file'),
+                ('outputnode.motion_xfm', 'inputnode.motion_xfm'),
+            ]),
+        ])  # fmt:skip
 
     workflow.connect([
-        (inputnode, bold_anat_wf, [
-            ('t1w_preproc', 'inputnode.target_ref_file'),
-            ('t1w_mask', 'inputnode.target_mask'),
-            ('fmap_ref', 'inputnode.fmap_ref'),
-            ('fmap_coeff', 'inputnode.fmap_coeff'),
-            ('fmap_id', 'inputnode.fmap_id'),
-        ]),
-        (bold_fit_wf, bold_anat_wf, [
-            ('outputnode.coreg_boldref', 'inputnode.bold_ref_file'),
-            ('outputnode.boldref2fmap_xfm', 'inputnode.boldref2fmap_xfm'),
-            ('outputnode.boldref2anat_xfm', 'inputnode.boldref2anat_xfm'),
-        ]),
-        (bold_native_wf, bold_anat_wf, [
-            ('outputnode.bold_minimal', 'inputnode.bold_file'),
-            ('outputnode.motion_xfm', 'inputnode.motion_xfm'),
-        ]),
         (bold_fit_wf, merge_bold_sources, [('outputnode.coreg_boldref', 'in2')]),
     ])  # fmt:skip
 
     # Full derivatives, including resampled BOLD series
-    if nonstd_spaces.intersection(('anat', 'T1w')):
+    if anat_out:
         ds_bold_t1_wf = init_ds_volumes_wf(
             source_file=bold_file,
             bids_root=str(config.execution.bids_dir),
             output_dir=fmriprep_dir,
             multiecho=multiecho,
             metadata=all_metadata[0],
+            quantized=bool(config.workflow.quantize_outputs),
             name='ds_bold_t1_wf',
         )
         ds_bold_t1_wf.inputs.inputnode.space = 'T1w'
@@ -435,6 +490,7 @@ configured with cubic B-spline interpolation.
             (bold_native_wf, ds_bold_t1_wf, [('outputnode.t2star_map', 'inputnode.t2star')]),
             (bold_anat_wf, ds_bold_t1_wf, [
                 ('outputnode.bold_file', 'inputnode.bold'),
+                ('outputnode.bold_meta', 'inputnode.bold_meta'),
                 ('outputnode.resampling_reference', 'inputnode.ref_file'),
             ]),
             (merge_bold_sources, ds_bold_t1_wf, [('out', 'inputnode.source_files')]),
@@ -447,9 +503,14 @@ configured with cubic B-spline interpolation.
         bold_std_wf = init_bold_volumetric_resample_wf(
             metadata=all_metadata[0],
             fieldmap_id=fieldmap_id if not multiecho else None,
+            fmap_selected=fmap_selected,
             omp_nthreads=omp_nthreads,
             mem_gb=mem_gb,
             jacobian=jacobian,
+            mask_dilation=std_mask_dilation,
+            resampling_cache=resampling_cache,
+            quantize=config.workflow.quantize_outputs,
+            quantize_tolerance=config.workflow.quantize_tolerance,
             name='bold_std_wf',
         )
         ds_bold_std_wf = init_ds_volumes_wf(
@@ -458,6 +519,7 @@ configured with cubic B-spline interpolation.
             output_dir=fmriprep_dir,
             multiecho=multiecho,
             metadata=all_metadata[0],
+            quantized=bool(config.workflow.quantize_outputs),
             name='ds_bold_std_wf',
         )
 
@@ -496,13 +558,14 @@ configured with cubic B-spline interpolation.
             (bold_native_wf, ds_bold_std_wf, [('outputnode.t2star_map', 'inputnode.t2star')]),
             (bold_std_wf, ds_bold_std_wf, [
                 ('outputnode.bold_file', 'inputnode.bold'),
+                ('outputnode.bold_meta', 'inputnode.bold_meta'),
                 ('outputnode.resampling_reference', 'inputnode.ref_file'),
             ]),
             (merge_bold_sources, ds_bold_std_wf, [('out', 'inputnode.source_files')]),
         ])  # fmt:skip
 
     # Goodvoxels mask might be needed in any surface resampling
-    if config.workflow.project_goodvoxels and (config.workflow.cifti_output or surf_std):
+    if goodvoxels_out:
         from .resampling import init_goodvoxels_bold_mask_wf
 
         goodvoxels_bold_mask_wf = init_goodvoxels_bold_mask_wf(mem_gb['resampled'])
@@ -534,7 +597,7 @@ voxels whose time-series have a locally high coefficient of variation.
                 ]),
         ])  # fmt:skip
 
-    if config.workflow.run_reconall and freesurfer_spaces:
+    if surface_out:
         workflow.__postdesc__ += """\
 Non-gridded (surface) resamplings were performed using `mri_vol2surf`
 (FreeSurfer).
@@ -586,9 +649,12 @@ Non-gridded (surface) resamplings were performed using `mri_vol2surf`
         bold_MNI6_wf = init_bold_volumetric_resample_wf(
             metadata=all_metadata[0],
             fieldmap_id=fieldmap_id if not multiecho else None,
+            fmap_selected=fmap_selected,
             omp_nthreads=omp_nthreads,
             mem_gb=mem_gb,
             jacobian=jacobian,
+            mask_dilation=std_mask_dilation,
+            resampling_cache=resampling_cache,
             name='bold_MNI6_wf',
         )
 
@@ -778,6 +844,7 @@ Non-gridded (surface) resamplings were performed using `mri_vol2surf`
         regressors_all_comps=config.workflow.regressors_all_comps,
         regressors_fd_th=config.workflow.regressors_fd_th,
         regressors_dvars_th=config.workflow.regressors_dvars_th,
+        anat_masks=anat_masks,
         name='bold_confounds_wf',
     )
 
@@ -798,6 +865,7 @@ Non-gridded (surface) resamplings were performed using `mri_vol2surf`
         (inputnode, bold_confounds_wf, [
             ('t1w_tpms', 'inputnode.t1w_tpms'),
             ('t1w_mask', 'inputnode.t1w_mask'),
+            ('acompcor_masks', 'inputnode.acompcor_masks'),
         ]),
         (bold_fit_wf, bold_confounds_wf, [
             ('outputnode.bold_mask', 'inputnode.bold_mask'),
@@ -820,6 +888,7 @@ Non-gridded (surface) resamplings were performed using `mri_vol2surf`
             mem_gb=mem_gb['resampled'],
             metadata=all_metadata[0],
             cifti_output=config.workflow.cifti_output,
+            anat_parcellation=anat_masks,
             name='carpetplot_wf',
         )
 
@@ -834,6 +903,7 @@ Non-gridded (surface) resamplings were performed using `mri_vol2surf`
         workflow.connect([
             (inputnode, carpetplot_wf, [
                 ('mni2009c2anat_xfm', 'inputnode.std2anat_xfm'),
+                ('carpet_dseg', 'inputnode.carpet_dseg'),
             ]),
             (bold_fit_wf, carpetplot_wf, [
                 ('outputnode.dummy_scans', 'inputnode.dummy_scans'),
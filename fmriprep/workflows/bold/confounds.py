@@ -25,13 +25,13 @@ Calculate BOLD confounds
 ^^^^^^^^^^^^^^^^^^^^^^^^
 
 .. autofunction:: init_bold_confs_wf
+.. autofunction:: init_anat_confounds_wf
 
 """
 
 from nipype.algorithms import confounds as nac
 from nipype.interfaces import utility as niu
 from nipype.pipeline import engine as pe
-from templateflow.api import get as get_template
 
 from ...config import DEFAULT_MEMORY_MIN_GB
 from ...interfaces import DerivativesDataSink
@@ -44,7 +44,9 @@ from ...interfaces.confounds import (
     GatherConfounds,
     RenameACompCor,
 )
+from ...interfaces.maths import BinaryDilation
 from ...utils.bids import dismiss_echo
+from ...utils.templates import carpet_dseg
 
 
 def init_bold_confs_wf(
@@ -54,6 +56,7 @@ def init_bold_confs_wf(
     regressors_dvars_th: float,
     regressors_fd_th: float,
     freesurfer: bool = False,
+    anat_masks: bool = False,
     name: str = 'bold_confs_wf',
 ):
     """
@@ -117,6 +120,10 @@ def init_bold_confs_wf(
         Set to ``True`` if the input volume fractions for the anatomical
         component-based noise correction maps come from FreeSurfer's ``aseg``.
         sMRIPrep always uses FAST for tissue probability maps, so we always set this to False.
+    anat_masks : :obj:`bool`
+        Whether the aCompCor masks are provided in anatomical space through the
+        ``acompcor_masks`` input (e.g., generated once for all the runs of a subject
+        with :func:`init_anat_confounds_wf`), rather than generated from ``t1w_tpms``.
     name : :obj:`str`
         Name of workflow (default: ``bold_confs_wf``)
 
@@ -135,6 +142,8 @@ def init_bold_confs_wf(
         Mask of the skull-stripped template image
     t1w_tpms
         List of tissue probability maps in T1w space
+    acompcor_masks
+        CSF, WM and combined aCompCor masks in T1w space (if ``anat_masks``)
     boldref2anat_xfm
         Affine matrix that maps the BOLD reference space into alignment with
         the anatomical (T1w) space
@@ -160,7 +169,7 @@ def init_bold_confs_wf(
     from niworkflows.interfaces.confounds import ExpandModel, SpikeRegressors
     from niworkflows.interfaces.fixes import FixHeaderApplyTransforms as ApplyTransforms
     from niworkflows.interfaces.images import SignalExtraction
-    from niworkflows.interfaces.morphology import BinaryDilation, BinarySubtraction
+    from niworkflows.interfaces.morphology import BinarySubtraction
     from niworkflows.interfaces.nibabel import ApplyMask, Binarize
     from niworkflows.interfaces.patches import RobustACompCor as ACompCor
     from niworkflows.interfaces.patches import RobustTCompCor as TCompCor
@@ -234,6 +243,7 @@ the edge of the brain, as proposed by [@patriat_improved_2017].
                 'skip_vols',
                 't1w_mask',
                 't1w_tpms',
+                'acompcor_masks',
                 'boldref2anat_xfm',
             ]
         ),
@@ -277,9 +287,6 @@ the edge of the brain, as proposed by [@patriat_improved_2017].
     fdisp = pe.Node(FramewiseDisplacement(), name='fdisp')
     rmsd = pe.Node(FSLRMSDeviation(), name='rmsd')
 
-    # Generate aCompCor probseg maps
-    acc_masks = pe.Node(aCompCorMasks(is_aseg=freesurfer), name='acc_masks')
-
     # Resample probseg maps in BOLD space via BOLD-to-T1w transform
     acc_msk_tfm = pe.MapNode(
         ApplyTransforms(interpolation='Gaussian', invert_transform_flags=[True]),
@@ -540,12 +547,9 @@ the edge of the brain, as proposed by [@patriat_improved_2017].
         # aCompCor
         (inputnode, acompcor, [('bold', 'realigned_file'),
                                ('skip_vols', 'ignore_initial_volumes')]),
-        (inputnode, acc_masks, [('t1w_tpms', 'in_vfs'),
-                                (('bold', _get_zooms), 'bold_zooms')]),
         (inputnode, acc_msk_tfm, [('boldref2anat_xfm', 'transforms'),
                                   ('bold_mask', 'reference_image')]),
         (inputnode, acc_msk_brain, [('bold_mask', 'in_mask')]),
-        (acc_masks, acc_msk_tfm, [('out_masks', 'input_image')]),
         (acc_msk_tfm, acc_msk_brain, [('output_image', 'in_file')]),
         (acc_msk_brain, acc_msk_bin, [('out_file', 'in_file')]),
         (acc_msk_bin, acompcor, [('out_file', 'mask_files')]),
@@ -620,11 +624,104 @@ the edge of the brain, as proposed by [@patriat_improved_2017].
         (conf_corr_plot, ds_report_conf_corr, [('out_file', 'in_file')]),
     ])  # fmt: skip
 
+    if anat_masks:
+        workflow.connect([(inputnode, acc_msk_tfm, [('acompcor_masks', 'input_image')])])
+        return workflow
+
+    # Generate aCompCor probseg maps
+    acc_masks = pe.Node(aCompCorMasks(is_aseg=freesurfer), name='acc_masks')
+    workflow.connect([
+        (inputnode, acc_masks, [('t1w_tpms', 'in_vfs'),
+                                (('bold', _get_zooms), 'bold_zooms')]),
+        (acc_masks, acc_msk_tfm, [('out_masks', 'input_image')]),
+    ])  # fmt: skip
+
+    return workflow
+
+
+def init_anat_confounds_wf(name: str = 'anat_confounds_wf'):
+    """
+    Build a workflow to generate the anatomical inputs of the confounds and carpetplots.
+
+    The aCompCor masks (see :func:`~fmriprep.utils.confounds.acompcor_masks`) and the
+    carpetplot parcellation are the same for every BOLD run of a subject, so they are
+    generated once in the anatomical space, and projected into the space of each run by
+    :func:`init_bold_confs_wf` and :func:`init_carpetplot_wf`.
+
+    Workflow Graph
+        .. workflow::
+            :graph2use: orig
+            :simple_form: yes
+
+            from fmriprep.workflows.bold.confounds import init_anat_confounds_wf
+            wf = init_anat_confounds_wf()
+
+    Parameters
+    ----------
+    name : :obj:`str`
+        Name of workflow (default: ``anat_confounds_wf``)
+
+    Inputs
+    ------
+    t1w_preproc
+        Bias-corrected structural template image
+    t1w_tpms
+        List of tissue probability maps in T1w space
+    std2anat_xfm
+        Transform from MNI152NLin2009cAsym to anatomical space
+
+    Outputs
+    -------
+    acompcor_masks
+        CSF, WM and combined aCompCor masks in T1w space
+    carpet_dseg
+        Carpetplot parcellation in T1w space
+
+    """
+    from niworkflows.interfaces.fixes import FixHeaderApplyTransforms as ApplyTransforms
+
+    from ...interfaces.confounds import aCompCorMasks
+
+    workflow = pe.Workflow(name=name)
+    inputnode = pe.Node(
+        niu.IdentityInterface(fields=['t1w_preproc', 't1w_tpms', 'std2anat_xfm']),
+        name='inputnode',
+    )
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=['acompcor_masks', 'carpet_dseg']),
+        name='outputnode',
+    )
+
+    # sMRIPrep always uses FAST for TPMs, so masks do not depend on the BOLD zooms
+    acc_masks = pe.Node(aCompCorMasks(is_aseg=False), name='acc_masks')
+    carpet_dseg_tfm = pe.Node(
+        ApplyTransforms(
+            dimension=3,
+            input_image=str(carpet_dseg()),
+            interpolation='MultiLabel',
+            args='-u int',
+        ),
+        name='carpet_dseg_tfm',
+    )
+
+    workflow.connect([
+        (inputnode, acc_masks, [('t1w_tpms', 'in_vfs')]),
+        (inputnode, carpet_dseg_tfm, [
+            ('t1w_preproc', 'reference_image'),
+            ('std2anat_xfm', 'transforms'),
+        ]),
+        (acc_masks, outputnode, [('out_masks', 'acompcor_masks')]),
+        (carpet_dseg_tfm, outputnode, [('output_image', 'carpet_dseg')]),
+    ])  # fmt:skip
     return workflow
 
 
 def init_carpetplot_wf(
-    mem_gb: float, metadata: dict, cifti_output: bool, name: str = 'bold_carpet_wf'
+    mem_gb: float,
+    metadata: dict,
+    cifti_output: bool,
+    anat_parcellation: bool = False,
+    name: str = 'bold_carpet_wf',
 ):
     """
     Build a workflow to generate *carpet* plots.
@@ -640,6 +737,10 @@ def init_carpetplot_wf(
         the FoV
     metadata : :obj:`dict`
         BIDS metadata for BOLD file
+    anat_parcellation : :obj:`bool`
+        Whether the parcellation is provided in anatomical space through the
+        ``carpet_dseg`` input (see :func:`init_anat_confounds_wf`), so only the
+        BOLD-to-anatomical transform is applied to each run
     name : :obj:`str`
         Name of workflow (default: ``bold_carpet_wf``)
 
@@ -657,6 +758,8 @@ def init_carpetplot_wf(
         the anatomical (T1w) space
     std2anat_xfm
         ANTs-compatible affine-and-warp transform file
+    carpet_dseg
+        Parcellation in T1w space (if ``anat_parcellation``)
     cifti_bold
         BOLD image in CIFTI format, to be used in place of volumetric BOLD
     crown_mask
@@ -683,6 +786,7 @@ def init_carpetplot_wf(
                 'confounds_file',
                 'boldref2anat_xfm',
                 'std2anat_xfm',
+                'carpet_dseg',
                 'cifti_bold',
                 'crown_mask',
                 'acompcor_mask',
@@ -720,23 +824,11 @@ def init_carpetplot_wf(
 
     parcels = pe.Node(niu.Function(function=_carpet_parcellation), name='parcels')
     parcels.inputs.nifti = not cifti_output
-    # List transforms
-    mrg_xfms = pe.Node(niu.Merge(2), name='mrg_xfms')
 
     # Warp segmentation into EPI space
     resample_parc = pe.Node(
         ApplyTransforms(
             dimension=3,
-            input_image=str(
-                get_template(
-                    'MNI152NLin2009cAsym',
-                    resolution=1,
-                    desc='carpet',
-                    suffix='dseg',
-                    extension=['.nii', '.nii.gz'],
-                )
-            ),
-            invert_transform_flags=[True, False],
             interpolation='MultiLabel',
             args='-u int',
         ),
@@ -747,11 +839,28 @@ def init_carpetplot_wf(
     if cifti_output:
         workflow.connect(inputnode, 'cifti_bold', conf_plot, 'in_cifti')
 
+    if anat_parcellation:
+        resample_parc.inputs.invert_transform_flags = [True]
+        workflow.connect([
+            (inputnode, resample_parc, [
+                ('carpet_dseg', 'input_image'),
+                ('boldref2anat_xfm', 'transforms'),
+            ]),
+        ])  # fmt:skip
+    else:
+        resample_parc.inputs.input_image = str(carpet_dseg())
+        resample_parc.inputs.invert_transform_flags = [True, False]
+        # List transforms
+        mrg_xfms = pe.Node(niu.Merge(2), name='mrg_xfms')
+        workflow.connect([
+            (inputnode, mrg_xfms, [
+                ('boldref2anat_xfm', 'in1'),
+                ('std2anat_xfm', 'in2'),
+            ]),
+            (mrg_xfms, resample_parc, [('out', 'transforms')]),
+        ])  # fmt:skip
+
     workflow.connect([
-        (inputnode, mrg_xfms, [
-            ('boldref2anat_xfm', 'in1'),
-            ('std2anat_xfm', 'in2'),
-        ]),
         (inputnode, resample_parc, [('bold_mask', 'reference_image')]),
         (inputnode, parcels, [('crown_mask', 'crown_mask')]),
         (inputnode, parcels, [('acompcor_mask', 'acompcor_mask')]),
@@ -760,7 +869,6 @@ def init_carpetplot_wf(
             ('confounds_file', 'confounds_file'),
             ('dummy_scans', 'drop_trs'),
         ]),
-        (mrg_xfms, resample_parc, [('out', 'transforms')]),
         (resample_parc, parcels, [('output_image', 'segmentation')]),
         (parcels, conf_plot, [('out', 'in_segm')]),
         (conf_plot, ds_report_bold_conf, [('out_file', 'in_file')]),
@@ -92,12 +92,69 @@ def get_sbrefs(
     )
 
 
+def collect_sbrefs(
+    bold_runs: list[list[str]],
+    entity_overrides: dict[str, ty.Any],
+    layout: bids.BIDSLayout,
+) -> dict[str, list[str]]:
+    """Find the single-band reference(s) of several BOLD runs with a single query
+
+    Equivalent to calling :func:`get_sbrefs` on each run, but the layout is queried
+    once with the entities shared by all runs, and the results are matched to
+    each run in memory.
+
+    Returns
+    -------
+    sbref_files
+        Mapping of the first file of each run to its sbref files, sorted by EchoTime
+    """
+    queries = {}
+    for bold_files in bold_runs:
+        entities = extract_entities(bold_files)
+        entities.pop('echo', None)
+        entities.update(suffix='sbref', extension=['.nii', '.nii.gz'])
+        entities.update(entity_overrides)
+        queries[bold_files[0]] = entities
+
+    if not queries:
+        return {}
+
+    missing = object()
+    shared = {
+        key: value
+        for key, value in next(iter(queries.values())).items()
+        if all(query.get(key, missing) == value for query in queries.values())
+    }
+    candidates = [
+        (sbref.path, sbref.get_entities()) for sbref in layout.get(return_type='object', **shared)
+    ]
+
+    def _matches(entities, query):
+        # As in PyBIDS, ``None`` requires the entity to be absent
+        return all(
+            entities.get(key) in (value if isinstance(value, list) else [value])
+            for key, value in query.items()
+            if key not in shared
+        )
+
+    return {
+        bold_file: sorted(
+            (path for path, entities in candidates if _matches(entities, query)),
+            key=lambda fname: layout.get_metadata(fname).get('EchoTime'),
+        )
+        for bold_file, query in queries.items()
+    }
+
+
 def init_bold_fit_wf(
     *,
     bold_series: list[str],
     precomputed: dict | None = None,
     fieldmap_id: str | None = None,
+    fmap_selected: bool = False,
+    sbref_files: list[str] | None = None,
     jacobian: bool = False,
+    fit_cache: dict | None = None,
     omp_nthreads: int = 1,
     name: str = 'bold_fit_wf',
 ) -> pe.Workflow:
@@ -126,6 +183,19 @@ def init_bold_fit_wf(
     fieldmap_id
         ID of the fieldmap to use to correct this BOLD series. If :obj:`None`,
         no correction will be applied.
+    fmap_selected
+        Whether the ``fmap_*`` inputs hold the fieldmap files of ``fieldmap_id``
+        (e.g., selected once for all the runs of a subject), rather than lists
+        collated with ``fmap_id``.
+    sbref_files
+        Single-band reference files of the series, sorted by echo time
+        (see :func:`collect_sbrefs`). Queried from the layout if :obj:`None`.
+    fit_cache
+        Signature of the fit stage of this series
+        (see :func:`~fmriprep.utils.fitcache.fit_signature`).
+        If given, the outputs of the workflow are stored under its key in
+        the fit cache (``config.execution.fit_cache_dir``), unless they were
+        all precomputed.
 
     Inputs
     ------
@@ -202,18 +272,19 @@ def init_bold_fit_wf(
     if precomputed is None:
         precomputed = {}
     layout = config.execution.layout
-    bids_filters = config.execution.get().get('bids_filters', {})
+    bids_filters = config.execution.bids_filters or {}
 
     # Fitting operates on the shortest echo
     # This could become more complicated in the future
     bold_file = bold_series[0]
 
     # Collect sbref files, sorted by EchoTime
-    sbref_files = get_sbrefs(
-        bold_series,
-        entity_overrides=bids_filters.get('sbref', {}),
-        layout=layout,
-    )
+    if sbref_files is None:
+        sbref_files = get_sbrefs(
+            bold_series,
+            entity_overrides=bids_filters.get('sbref', {}),
+            layout=layout,
+        )
 
     basename = os.path.basename(bold_file)
     sbref_msg = f'No single-band-reference found for {basename}.'
@@ -236,6 +307,8 @@ def init_bold_fit_wf(
 
     hmc_boldref = precomputed.get('hmc_boldref')
     coreg_boldref = precomputed.get('coreg_boldref')
+    # Only reused together with the coregistration reference it was calculated from
+    bold_mask = precomputed.get('bold_mask') if coreg_boldref else None
     # Can contain
     #  1) boldref2fmap
     #  2) boldref2anat
@@ -466,25 +539,29 @@ def init_bold_fit_wf(
     # Stage 3: Register fieldmap to boldref and reconstruct in BOLD space
     if fieldmap_id:
         config.loggers.workflow.info('Stage 3: Adding fieldmap reconstruction workflow')
-        fmap_select = pe.Node(
-            KeySelect(
-                fields=['fmap_ref', 'fmap_coeff', 'fmap_mask', 'sdc_method'],
-                key=fieldmap_id,
-            ),
-            name='fmap_select',
-            run_without_submitting=True,
-        )
+        fmap_select = inputnode
+        if not fmap_selected:
+            fmap_select = pe.Node(
+                KeySelect(
+                    fields=['fmap_ref', 'fmap_coeff', 'fmap_mask', 'sdc_method'],
+                    key=fieldmap_id,
+                ),
+                name='fmap_select',
+                run_without_submitting=True,
+            )
+            workflow.connect([
+                (inputnode, fmap_select, [
+                    ('fmap_ref', 'fmap_ref'),
+                    ('fmap_coeff', 'fmap_coeff'),
+                    ('fmap_mask', 'fmap_mask'),
+                    ('sdc_method', 'sdc_method'),
+                    ('fmap_id', 'keys'),
+                ]),
+            ])  # fmt:skip
 
         boldref_fmap = pe.Node(ReconstructFieldmap(inverse=[True]), name='boldref_fmap', mem_gb=1)
 
         workflow.connect([
-            (inputnode, fmap_select, [
-                ('fmap_ref', 'fmap_ref'),
-                ('fmap_coeff', 'fmap_coeff'),
-                ('fmap_mask', 'fmap_mask'),
-                ('sdc_method', 'sdc_method'),
-                ('fmap_id', 'keys'),
-            ]),
             (fmapref_buffer, boldref_fmap, [('out', 'target_ref_file')]),
             (fmapreg_buffer, boldref_fmap, [('boldref2fmap_xfm', 'transforms')]),
             (fmap_select, boldref_fmap, [
@@ -648,13 +725,15 @@ def init_bold_fit_wf(
     else:
         config.loggers.workflow.info('Found coregistration reference - skipping Stage 4')
 
-        # TODO: Allow precomputed bold masks to be passed
-        # Also needs consideration for how it interacts above
-        skullstrip_precomp_ref_wf = init_skullstrip_bold_wf(name='skullstrip_precomp_ref_wf')
-        skullstrip_precomp_ref_wf.inputs.inputnode.in_file = coreg_boldref
-        workflow.connect([
-            (skullstrip_precomp_ref_wf, regref_buffer, [('outputnode.mask_file', 'boldmask')])
-        ])  # fmt:skip
+        if bold_mask:
+            regref_buffer.inputs.boldmask = bold_mask
+            config.loggers.workflow.debug(f'Reusing coregistration reference mask: {bold_mask}')
+        else:
+            skullstrip_precomp_ref_wf = init_skullstrip_bold_wf(name='skullstrip_precomp_ref_wf')
+            skullstrip_precomp_ref_wf.inputs.inputnode.in_file = coreg_boldref
+            workflow.connect([
+                (skullstrip_precomp_ref_wf, regref_buffer, [('outputnode.mask_file', 'boldmask')])
+            ])  # fmt:skip
 
     if not boldref2anat_xform:
         config.loggers.workflow.info('Stage 5: Adding coregistration workflow')
@@ -674,6 +753,7 @@ def init_bold_fit_wf(
             omp_nthreads=omp_nthreads,
             mem_gb=mem_gb['resampled'],
             sloppy=config.execution.sloppy,
+            speculative=config.workflow.bold2anat_speculative,
         )
 
         ds_boldreg_wf = init_ds_registration_wf(
@@ -710,6 +790,32 @@ def init_bold_fit_wf(
         config.loggers.workflow.info('Found coregistration transform - skipping Stage 5')
         outputnode.inputs.boldref2anat_xfm = boldref2anat_xform
 
+    reused = [hmc_boldref, hmc_xforms, coreg_boldref, bold_mask, boldref2anat_xform]
+    if fieldmap_id:
+        reused.append(boldref2fmap_xform)
+    if fit_cache and config.execution.fit_cache_dir and not all(reused):
+        from ...interfaces.fitcache import StoreFitCache
+
+        store_fit_cache = pe.Node(
+            StoreFitCache(
+                cache_dir=str(config.execution.fit_cache_dir),
+                signature=fit_cache,
+            ),
+            name='store_fit_cache',
+            run_without_submitting=True,
+        )
+        workflow.connect([
+            (outputnode, store_fit_cache, [
+                ('hmc_boldref', 'hmc_boldref'),
+                ('motion_xfm', 'motion_xfm'),
+                ('coreg_boldref', 'coreg_boldref'),
+                ('bold_mask', 'bold_mask'),
+                ('boldref2anat_xfm', 'boldref2anat_xfm'),
+            ]),
+        ])  # fmt:skip
+        if fieldmap_id:
+            workflow.connect(outputnode, 'boldref2fmap_xfm', store_fit_cache, 'boldref2fmap_xfm')
+
     return workflow
 
 
@@ -717,6 +823,7 @@ def init_bold_native_wf(
     *,
     bold_series: list[str],
     fieldmap_id: str | None = None,
+    fmap_selected: bool = False,
     jacobian: bool = False,
     omp_nthreads: int = 1,
     name: str = 'bold_native_wf',
@@ -749,6 +856,10 @@ def init_bold_native_wf(
     fieldmap_id
         ID of the fieldmap to use to correct this BOLD series. If :obj:`None`,
         no correction will be applied.
+    fmap_selected
+        Whether the ``fmap_*`` inputs hold the fieldmap files of ``fieldmap_id``
+        (e.g., selected once for all the runs of a subject), rather than lists
+        collated with ``fmap_id``.
 
     Inputs
     ------
@@ -868,9 +979,7 @@ def init_bold_native_wf(
     )
     outputnode.inputs.metadata = metadata
 
-    boldbuffer = pe.Node(
-        niu.IdentityInterface(fields=['bold_file', 'ro_time', 'pe_dir']), name='boldbuffer'
-    )
+    boldbuffer = pe.Node(niu.IdentityInterface(fields=['bold_file']), name='boldbuffer')
 
     # Track echo index - this allows us to treat multi- and single-echo workflows
     # almost identically
@@ -901,11 +1010,20 @@ def init_bold_native_wf(
 
     # Prepare fieldmap metadata
     if fieldmap_id:
-        fmap_select = pe.Node(
-            KeySelect(fields=['fmap_ref', 'fmap_coeff'], key=fieldmap_id),
-            name='fmap_select',
-            run_without_submitting=True,
-        )
+        fmap_select = inputnode
+        if not fmap_selected:
+            fmap_select = pe.Node(
+                KeySelect(fields=['fmap_ref', 'fmap_coeff'], key=fieldmap_id),
+                name='fmap_select',
+                run_without_submitting=True,
+            )
+            workflow.connect([
+                (inputnode, fmap_select, [
+                    ('fmap_ref', 'fmap_ref'),
+                    ('fmap_coeff', 'fmap_coeff'),
+                    ('fmap_id', 'keys'),
+                ]),
+            ])  # fmt:skip
 
         distortion_params = pe.Node(
             DistortionParameters(
@@ -916,24 +1034,14 @@ def init_bold_native_wf(
             name='distortion_params',
             run_without_submitting=True,
         )
-        workflow.connect([
-            (inputnode, fmap_select, [
-                ('fmap_ref', 'fmap_ref'),
-                ('fmap_coeff', 'fmap_coeff'),
-                ('fmap_id', 'keys'),
-            ]),
-            (distortion_params, boldbuffer, [
-                ('readout_time', 'ro_time'),
-                ('pe_direction', 'pe_dir'),
-            ]),
-        ])  # fmt:skip
 
     # Resample to boldref
+    # Echoes are resampled jointly, sharing coordinates, head-motion and fieldmap corrections
     boldref_bold = pe.Node(
         ResampleSeries(jacobian=jacobian),
         name='boldref_bold',
         n_procs=omp_nthreads,
-        mem_gb=mem_gb['resampled'],
+        mem_gb=mem_gb['resampled'] * len(bold_series),
     )
 
     workflow.connect([
@@ -941,11 +1049,6 @@ def init_bold_native_wf(
             ('boldref', 'ref_file'),
             ('motion_xfm', 'transforms'),
         ]),
-        (boldbuffer, boldref_bold, [
-            ('bold_file', 'in_file'),
-            ('ro_time', 'ro_time'),
-            ('pe_dir', 'pe_dir'),
-        ]),
     ])  # fmt:skip
 
     if fieldmap_id:
@@ -959,6 +1062,10 @@ def init_bold_native_wf(
                 ('fmap_coeff', 'in_coeffs'),
                 ('fmap_ref', 'fmap_ref_file'),
             ]),
+            (distortion_params, boldref_bold, [
+                ('readout_time', 'ro_time'),
+                ('pe_direction', 'pe_dir'),
+            ]),
             (boldref_fmap, boldref_bold, [('out_file', 'fieldmap')]),
         ])  # fmt:skip
 
@@ -970,6 +1077,10 @@ def init_bold_native_wf(
             name='join_echos',
             run_without_submitting=True,
         )
+        workflow.connect([
+            (boldbuffer, join_echos, [('bold_file', 'bold_files')]),
+            (join_echos, boldref_bold, [('bold_files', 'in_file')]),
+        ])  # fmt:skip
 
         # create optimal combination, adaptive T2* map
         bold_t2s_wf = init_bold_t2s_wf(
@@ -986,9 +1097,8 @@ def init_bold_native_wf(
                 ('bold_mask', 'inputnode.bold_mask'),
                 ('dummy_scans', 'inputnode.skip_vols'),
             ]),
-            (boldref_bold, join_echos, [('out_file', 'bold_files')]),
-            (join_echos, bold_t2s_wf, [('bold_files', 'inputnode.bold_file')]),
-            (join_echos, outputnode, [('bold_files', 'bold_echos')]),
+            (boldref_bold, bold_t2s_wf, [('out_file', 'inputnode.bold_file')]),
+            (boldref_bold, outputnode, [('out_file', 'bold_echos')]),
             (bold_t2s_wf, outputnode, [
                 ('outputnode.bold', 'bold_minimal'),
                 ('outputnode.bold', 'bold_native'),
@@ -997,6 +1107,7 @@ def init_bold_native_wf(
         ])  # fmt:skip
     else:
         workflow.connect([
+            (boldbuffer, boldref_bold, [('bold_file', 'in_file')]),
             (inputnode, outputnode, [('motion_xfm', 'motion_xfm')]),
             (boldbuffer, outputnode, [('bold_file', 'bold_minimal')]),
             (boldref_bold, outputnode, [('out_file', 'bold_native')]),
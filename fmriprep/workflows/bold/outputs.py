@@ -763,6 +763,7 @@ def init_ds_volumes_wf(
     output_dir: str,
     multiecho: bool,
     metadata: list[dict],
+    quantized: bool = False,
     name='ds_volumes_wf',
 ) -> pe.Workflow:
     timing_parameters = prepare_timing_parameters(metadata)
@@ -774,6 +775,7 @@ def init_ds_volumes_wf(
                 'source_files',
                 'ref_file',
                 'bold',  # Resampled into target space
+                'bold_meta',  # Sidecar metadata of the resampled series
                 'bold_mask',  # boldref space
                 'bold_ref',  # boldref space
                 't2star',  # boldref space
@@ -840,6 +842,9 @@ def init_ds_volumes_wf(
         ]),
         (sources, ds_bold, [('out', 'Sources')]),
     ])  # fmt:skip
+    if quantized:
+        # Report the scaling and quantization error of the stored series
+        workflow.connect([(inputnode, ds_bold, [('bold_meta', 'meta_dict')])])
 
     resample_ref = pe.Node(
         ApplyTransforms(
@@ -58,6 +58,7 @@ def init_bold_reg_wf(
     omp_nthreads: int,
     name: str = 'bold_reg_wf',
     sloppy: bool = False,
+    speculative: bool = False,
 ):
     """
     Build a workflow to run same-subject, BOLD-to-T1w image-registration.
@@ -102,6 +103,9 @@ def init_bold_reg_wf(
         Maximum number of threads an individual process may use
     name : :obj:`str`
         Name of workflow (default: ``bold_reg_wf``)
+    speculative : :obj:`bool`
+        Run the registration candidates concurrently and select by cost
+        (see :py:func:`init_bbreg_wf`).
 
     Inputs
     ------
@@ -166,6 +170,7 @@ def init_bold_reg_wf(
             bold2anat_dof=bold2anat_dof,
             bold2anat_init=bold2anat_init,
             omp_nthreads=omp_nthreads,
+            speculative=speculative,
         )
     else:
         bbr_wf = init_fsl_bbr_wf(
@@ -174,6 +179,7 @@ def init_bold_reg_wf(
             bold2anat_init=bold2anat_init,
             sloppy=sloppy,
             omp_nthreads=omp_nthreads,
+            speculative=speculative,
         )
 
     workflow.connect([
@@ -202,6 +208,7 @@ def init_bbreg_wf(
     bold2anat_dof: AffineDOF,
     bold2anat_init: RegistrationInit,
     omp_nthreads: int,
+    speculative: bool = False,
     name: str = 'bbreg_wf',
 ):
     """
@@ -222,6 +229,12 @@ def init_bbreg_wf(
     Excessive deviation will result in rejecting the BBR refinement and
     accepting the original, affine registration.
 
+    If ``speculative`` (and ``use_bbr`` is ``None``), ``bbregister`` is also
+    initialized with the header information of the BOLD reference, concurrently
+    with ``mri_coreg``.
+    Of both BBR candidates (unless rejected as above) and the affine registration,
+    the one of lowest BBR cost is accepted (see :py:func:`select_xforms`).
+
     Workflow Graph
         .. workflow ::
             :graph2use: orig
@@ -243,6 +256,11 @@ def init_bbreg_wf(
         If ``'header'``, use header information for initialization of BOLD and T1 images.
         If ``'t1w'``, align BOLD to T1w by their centers.
         If ``'t2w'``, align BOLD to T1w using the T2w as an intermediate.
+    omp_nthreads : :obj:`int`
+        Maximum number of threads an individual process may use
+    speculative : :obj:`bool`
+        Run the header-initialized and the ``mri_coreg``-initialized BBR concurrently,
+        and select the registration of lowest cost
     name : :obj:`str`, optional
         Workflow name (default: bbreg_wf)
 
@@ -328,12 +346,20 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
             LOGGER.warning('Initializing BBR with header; affine fallback disabled')
             use_bbr = True
 
+    speculative = _check_speculative(speculative, use_bbr)
+    if speculative:
+        workflow.__desc__ += (
+            ' Boundary-based registration was also initialized with the header information '
+            'of the BOLD reference, and the registration of lowest cost was selected.'
+        )
+
     fssource = pe.Node(FreeSurferSource(), name='fssource')
 
     mri_coreg = pe.Node(
         MRICoreg(dof=bold2anat_dof, sep=[4], ftol=0.0001, linmintol=0.01),
         name='mri_coreg',
-        n_procs=omp_nthreads,
+        # Leave a thread to the header-initialized BBR, running concurrently
+        n_procs=max(omp_nthreads - 1, 1) if speculative else omp_nthreads,
         mem_gb=5,
     )
     if use_t2w:
@@ -353,7 +379,9 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
     if bold2anat_init == 'header':
         bbregister.inputs.init = 'header'
 
-    transforms = pe.Node(niu.Merge(2), run_without_submitting=True, name='transforms')
+    # Candidates: BBR, affine registration and, if speculative, header-initialized BBR
+    n_candidates = 3 if speculative else 2
+    transforms = pe.Node(niu.Merge(n_candidates), run_without_submitting=True, name='transforms')
     # In cases where Merge(2) only has `in1` or `in2` defined
     # output list will just contain a single element
     select_transform = pe.Node(
@@ -363,7 +391,7 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
     concat_xfm = pe.Node(ConcatenateXFMs(inverse=True), name='concat_xfm')
 
     # Set up GeneratedBy metadata and add a merge node for cost, if available
-    gen_by = pe.Node(niu.Merge(2), run_without_submitting=True, name='gen_by')
+    gen_by = pe.Node(niu.Merge(n_candidates), run_without_submitting=True, name='gen_by')
     select_gen = pe.Node(niu.Select(index=0), run_without_submitting=True, name='select_gen')
     metadata = pe.Node(niu.Merge(2), run_without_submitting=True, name='metadata')
     merge_meta = pe.Node(DictMerge(), run_without_submitting=True, name='merge_meta')
@@ -427,7 +455,7 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         ]
     }
 
-    costs = pe.Node(niu.Merge(2), run_without_submitting=True, name='costs')
+    costs = pe.Node(niu.Merge(n_candidates), run_without_submitting=True, name='costs')
     select_cost = pe.Node(niu.Select(index=0), run_without_submitting=True, name='select_cost')
     read_cost = pe.Node(niu.Function(function=_read_cost), name='read_cost')
 
@@ -448,6 +476,39 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         return workflow
 
     # Only reach this point if bold2anat_init is "t1w" or "t2w" and use_bbr is None
+    if speculative:
+        bbregister_header = pe.Node(
+            BBRegister(
+                dof=bold2anat_dof,
+                contrast_type='t2',
+                init='header',
+                out_lta_file=True,
+            ),
+            name='bbregister_header',
+            mem_gb=12,
+        )
+        gen_by.inputs.in3 = gen_by.inputs.in1
+        select_xfm = pe.Node(
+            niu.Function(function=select_xforms, output_names=['index', 'fallback']),
+            name='select_xfm',
+        )
+
+        workflow.connect([
+            (inputnode, bbregister_header, [('subjects_dir', 'subjects_dir'),
+                                            ('subject_id', 'subject_id'),
+                                            ('in_file', 'source_file')]),
+            (bbregister_header, transforms, [('out_lta_file', 'in3')]),
+            (bbregister_header, costs, [('min_cost_file', 'in3')]),
+            (transforms, select_xfm, [('out', 'lta_list')]),
+            (costs, select_xfm, [('out', 'cost_files')]),
+            (select_xfm, outputnode, [('fallback', 'fallback')]),
+            (select_xfm, select_transform, [('index', 'index')]),
+            (select_xfm, select_gen, [('index', 'index')]),
+            (select_xfm, select_cost, [('index', 'index')]),
+        ])  # fmt:skip
+
+        return workflow
+
     compare_transforms = pe.Node(niu.Function(function=compare_xforms), name='compare_transforms')
 
     workflow.connect([
@@ -467,6 +528,7 @@ def init_fsl_bbr_wf(
     bold2anat_init: RegistrationInit,
     omp_nthreads: int,
     sloppy: bool = False,
+    speculative: bool = False,
     name: str = 'fsl_bbr_wf',
 ):
     """
@@ -486,6 +548,11 @@ def init_fsl_bbr_wf(
     Excessive deviation will result in rejecting the BBR refinement and
     accepting the original, affine registration.
 
+    If ``speculative`` (and ``use_bbr`` is ``None``), FLIRT-BBR is also initialized
+    with the header (qform) information of the BOLD reference, concurrently with
+    ``mri_coreg``, and the BBR cost of every candidate is measured with FLIRT to
+    select the registration (see :py:func:`select_xforms`).
+
     Workflow Graph
         .. workflow ::
             :graph2use: orig
@@ -508,6 +575,13 @@ def init_fsl_bbr_wf(
         If ``'header'``, use header information for initialization of BOLD and T1 images.
         If ``'t1w'``, align BOLD to T1w by their centers.
         If ``'t2w'``, align BOLD to T1w using the T2w as an intermediate.
+    omp_nthreads : :obj:`int`
+        Maximum number of threads an individual process may use
+    sloppy : :obj:`bool`
+        Downsample the anatomical reference for BBR
+    speculative : :obj:`bool`
+        Run the header-initialized and the ``mri_coreg``-initialized FLIRT-BBR
+        concurrently, and select the registration of lowest cost
     name : :obj:`str`, optional
         Workflow name (default: fsl_bbr_wf)
 
@@ -591,7 +665,21 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
             'T2w intermediate for FSL is not implemented, registering with T1w instead.'
         )
 
-    metadata = pe.Node(niu.Merge(2), run_without_submitting=True, name='metadata')
+    speculative = _check_speculative(speculative, use_bbr)
+    FSLDIR = os.getenv('FSLDIR')
+    measurecost = op.join(FSLDIR or '', 'etc/flirtsch/measurecost1.sch')
+    if speculative and not (FSLDIR and os.path.exists(measurecost)):
+        LOGGER.warning('FSLDIR unset - cannot measure FLIRT-BBR costs; speculative mode disabled')
+        speculative = False
+    if speculative:
+        workflow.__desc__ += (
+            ' Boundary-based registration was also initialized with the header information '
+            'of the BOLD reference, and the registration of lowest cost was selected.'
+        )
+
+    # Candidates: BBR, affine registration and, if speculative, header-initialized BBR
+    n_candidates = 3 if speculative else 2
+    metadata = pe.Node(niu.Merge(n_candidates), run_without_submitting=True, name='metadata')
     select_meta = pe.Node(niu.Select(index=0), run_without_submitting=True, name='select_meta')
 
     # Mask T1w_preproc with T1w_mask to make T1w_brain
@@ -600,7 +688,8 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
     mri_coreg = pe.Node(
         MRICoreg(dof=bold2anat_dof, sep=[4], ftol=0.0001, linmintol=0.01),
         name='mri_coreg',
-        n_procs=omp_nthreads,
+        # Leave a thread to the header-initialized BBR, running concurrently
+        n_procs=max(omp_nthreads - 1, 1) if speculative else omp_nthreads,
         mem_gb=5,
     )
 
@@ -650,7 +739,6 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         name='flt_bbr',
     )
 
-    FSLDIR = os.getenv('FSLDIR')
     if FSLDIR and os.path.exists(schedule := op.join(FSLDIR, 'etc/flirtsch/bbr.sch')):
         flt_bbr.inputs.schedule = schedule
     else:
@@ -669,6 +757,9 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         (lta_to_fsl, flt_bbr, [('out_fsl', 'in_matrix_file')]),
     ])  # fmt:skip
 
+    # Sources of the reference and white-matter segmentation of BBR
+    bbr_reference = (mask_t1w_brain, 'out_file')
+    bbr_wm_seg = (wm_mask, 'out')
     if sloppy is True:
         downsample = pe.Node(
             niu.Function(
@@ -679,14 +770,14 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         workflow.connect([
             (mask_t1w_brain, downsample, [('out_file', 'in_file')]),
             (wm_mask, downsample, [('out', 'in_mask')]),
-            (downsample, flt_bbr, [('out_file', 'reference'),
-                                   ('out_mask', 'wm_seg')]),
-        ])  # fmt:skip
-    else:
-        workflow.connect([
-            (mask_t1w_brain, flt_bbr, [('out_file', 'reference')]),
-            (wm_mask, flt_bbr, [('out', 'wm_seg')]),
         ])  # fmt:skip
+        bbr_reference = (downsample, 'out_file')
+        bbr_wm_seg = (downsample, 'out_mask')
+
+    workflow.connect([
+        (bbr_reference[0], flt_bbr, [(bbr_reference[1], 'reference')]),
+        (bbr_wm_seg[0], flt_bbr, [(bbr_wm_seg[1], 'wm_seg')]),
+    ])  # fmt:skip
 
     # Short-circuit workflow building, use boundary-based registration
     if use_bbr is True:
@@ -695,9 +786,7 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
 
         return workflow
 
-    transforms = pe.Node(niu.Merge(2), run_without_submitting=True, name='transforms')
-
-    compare_transforms = pe.Node(niu.Function(function=compare_xforms), name='compare_transforms')
+    transforms = pe.Node(niu.Merge(n_candidates), run_without_submitting=True, name='transforms')
 
     select_transform = pe.Node(niu.Select(), run_without_submitting=True, name='select_transform')
 
@@ -710,14 +799,66 @@ Co-registration was configured with {dof_text} degrees of freedom{reason_text}.
         (inputnode, fsl_to_lta, [('in_file', 'source_file')]),
         (mask_t1w_brain, fsl_to_lta, [('out_file', 'target_file')]),
         (transforms, fsl_to_lta, [('out', 'in_fsl')]),
-        (fsl_to_lta, compare_transforms, [('out_lta', 'lta_list')]),
-        (compare_transforms, outputnode, [('out', 'fallback')]),
         # Select output transform
         (transforms, select_transform, [('out', 'inlist')]),
-        (compare_transforms, select_transform, [('out', 'index')]),
         (select_transform, xfm2itk, [('out', 'in_xfm')]),
-        # Select metadata
-        (compare_transforms, select_meta, [('out', 'index')]),
+    ])  # fmt:skip
+
+    if not speculative:
+        compare_transforms = pe.Node(
+            niu.Function(function=compare_xforms), name='compare_transforms'
+        )
+        workflow.connect([
+            (fsl_to_lta, compare_transforms, [('out_lta', 'lta_list')]),
+            (compare_transforms, outputnode, [('out', 'fallback')]),
+            (compare_transforms, select_transform, [('out', 'index')]),
+            (compare_transforms, select_meta, [('out', 'index')]),
+        ])  # fmt:skip
+
+        return workflow
+
+    flt_bbr_header = pe.Node(
+        fsl.FLIRT(
+            cost_func='bbr',
+            dof=bold2anat_dof,
+            args='-basescale 1',
+            uses_qform=True,
+            schedule=flt_bbr.inputs.schedule,
+        ),
+        name='flt_bbr_header',
+    )
+    metadata.inputs.in3 = metadata.inputs.in1
+
+    # BBR cost of every candidate (the first value in the output of the schedule)
+    measure_cost = pe.MapNode(
+        fsl.FLIRT(
+            cost_func='bbr',
+            dof=bold2anat_dof,
+            args='-basescale 1',
+            schedule=measurecost,
+        ),
+        iterfield=['in_matrix_file'],
+        name='measure_cost',
+    )
+    select_xfm = pe.Node(
+        niu.Function(function=select_xforms, output_names=['index', 'fallback']),
+        name='select_xfm',
+    )
+
+    workflow.connect([
+        (inputnode, flt_bbr_header, [('in_file', 'in_file')]),
+        (bbr_reference[0], flt_bbr_header, [(bbr_reference[1], 'reference')]),
+        (bbr_wm_seg[0], flt_bbr_header, [(bbr_wm_seg[1], 'wm_seg')]),
+        (flt_bbr_header, transforms, [('out_matrix_file', 'in3')]),
+        (inputnode, measure_cost, [('in_file', 'in_file')]),
+        (bbr_reference[0], measure_cost, [(bbr_reference[1], 'reference')]),
+        (bbr_wm_seg[0], measure_cost, [(bbr_wm_seg[1], 'wm_seg')]),
+        (transforms, measure_cost, [('out', 'in_matrix_file')]),
+        (fsl_to_lta, select_xfm, [('out_lta', 'lta_list')]),
+        (measure_cost, select_xfm, [('out_matrix_file', 'cost_files')]),
+        (select_xfm, outputnode, [('fallback', 'fallback')]),
+        (select_xfm, select_transform, [('index', 'index')]),
+        (select_xfm, select_meta, [('index', 'index')]),
     ])  # fmt:skip
 
     return workflow
@@ -766,6 +907,62 @@ def compare_xforms(lta_list, norm_threshold=15):
     return norm[1] > norm_threshold
 
 
+def select_xforms(lta_list, cost_files, norm_threshold=15):
+    """
+    Select the registration candidate of lowest boundary-based registration cost.
+
+    Candidates are the BBR refinement of the affine registration, the affine
+    registration itself, and further BBR registrations with other initializations,
+    in that order.
+    BBR candidates are rejected if they deviate from the affine registration
+    beyond ``norm_threshold`` (see :py:func:`compare_xforms`).
+
+    Parameters
+    ----------
+
+      lta_list : :obj:`list` of :obj:`str`
+          the candidate affines in LTA format
+      cost_files : :obj:`list` of :obj:`str`
+          files starting with the BBR cost of each candidate
+      norm_threshold : :obj:`float`
+          the upper bound limit to the normalized displacement of BBR candidates
+          relative to the affine registration (default: `15`)
+
+    Returns
+    -------
+    index : :obj:`int`
+        Index of the selected candidate
+    fallback : :obj:`bool`
+        Whether the affine registration was selected
+
+    """
+    from fmriprep.workflows.bold.registration import compare_xforms
+
+    costs = []
+    for cost_file in cost_files:
+        with open(cost_file) as fobj:
+            costs.append(float(fobj.read().split()[0]))
+
+    accepted = [1] + [
+        index
+        for index, lta in enumerate(lta_list)
+        if index != 1 and not compare_xforms([lta, lta_list[1]], norm_threshold)
+    ]
+    index = min(accepted, key=costs.__getitem__)
+    return index, index == 1
+
+
+def _check_speculative(speculative, use_bbr):
+    """Speculative registration only applies if BBR is tested against its fallback."""
+    if speculative and use_bbr is not None:
+        LOGGER.warning(
+            'Speculative registration requires testing BBR against the affine registration; '
+            'registering sequentially.'
+        )
+        return False
+    return speculative
+
+
 def _conditional_downsampling(in_file, in_mask, zoom_th=4.0):
     """Downsamples the input dataset for sloppy mode."""
     from pathlib import Path
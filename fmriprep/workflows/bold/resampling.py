@@ -50,6 +50,7 @@ from ...config import DEFAULT_MEMORY_MIN_GB
 from ...interfaces.bids import BIDSURI
 from ...interfaces.workbench import MetricDilate, MetricMask, MetricResample
 from ...utils.bids import dismiss_echo
+from ...utils.templates import template_spheres
 from .outputs import prepare_timing_parameters
 
 
@@ -767,16 +768,7 @@ def init_wb_surf_surf_wf(
         name='select_surfaces',
         run_without_submitting=True,
     )
-    select_surfaces.inputs.template_sphere = [
-        str(sphere)
-        for sphere in tf.get(
-            template=template,
-            space=space if space != template else None,
-            density=density,
-            suffix='sphere',
-            extension='.surf.gii',
-        )
-    ]
+    select_surfaces.inputs.template_sphere = template_spheres(template, density, space)
 
     resample_to_template = pe.Node(
         MetricResample(method='ADAP_BARY_AREA', area_surfs=True),
@@ -882,7 +874,6 @@ def init_bold_fsLR_resampling_wf(
 
     """
     import smriprep.data
-    import templateflow.api as tf
     from niworkflows.engine.workflows import LiterateWorkflow as Workflow
     from niworkflows.interfaces.utility import KeySelect
 
@@ -948,16 +939,7 @@ The BOLD time-series were resampled onto the left/right-symmetric template
         name='select_surfaces',
         run_without_submitting=True,
     )
-    select_surfaces.inputs.template_sphere = [
-        str(sphere)
-        for sphere in tf.get(
-            template='fsLR',
-            density=fslr_density,
-            suffix='sphere',
-            space=None,
-            extension='.surf.gii',
-        )
-    ]
+    select_surfaces.inputs.template_sphere = template_spheres('fsLR', fslr_density)
     atlases = smriprep.data.load('atlases')
     select_surfaces.inputs.template_roi = [
         str(atlases / f'L.atlasroi.{fslr_density}_fs_LR.shape.gii'),
@@ -34,8 +34,8 @@ from nipype.interfaces import utility as niu
 from nipype.pipeline import engine as pe
 
 from ... import config
-from ...interfaces.maths import Clip, Label2Mask
-from ...interfaces.multiecho import T2SMap
+from ...interfaces.maths import BinaryDilation, Clip, Label2Mask
+from ...interfaces.multiecho import T2SFit
 from ...interfaces.reports import LabeledHistogram
 
 LOGGER = config.loggers.workflow
@@ -51,8 +51,10 @@ def init_bold_t2s_wf(
     r"""
     Combine multiple echos of :abbr:`ME-EPI (multi-echo echo-planar imaging)`.
 
-    This workflow wraps the `tedana`_ :func:`T2* workflow <tedana.workflows.t2smap_workflow>`
+    This workflow follows the `tedana`_ :func:`T2* workflow <tedana.workflows.t2smap_workflow>`
     to optimally combine multiple preprocessed echos and derive a T2\ :sup:`★` map.
+    Fitting and combination run in-process (see :class:`~fmriprep.interfaces.multiecho.T2SFit`),
+    reading the echoes in bounded blocks of volumes.
     The following steps are performed:
     #. Compute the T2\ :sup:`★` map
     #. Create an optimally combined ME-EPI time series
@@ -86,7 +88,6 @@ def init_bold_t2s_wf(
 
     """
     from niworkflows.engine.workflows import LiterateWorkflow as Workflow
-    from niworkflows.interfaces.morphology import BinaryDilation
 
     workflow = Workflow(name=name)
     if config.workflow.me_t2s_fit_method == 'curvefit':
@@ -99,7 +100,7 @@ def init_bold_t2s_wf(
         fit_str = 'log-linear regression'
 
     workflow.__desc__ = f"""\
-A T2<sup>★</sup> map was estimated from the preprocessed EPI echoes using tedana's t2smap
+A T2<sup>★</sup> map was estimated from the preprocessed EPI echoes following tedana's t2smap
 workflow [@DuPre2021], by voxel-wise fitting the maximal number of echoes with reliable signal in
 that voxel to a monoexponential signal decay model with {fit_str}.
 The calculated T2<sup>★</sup> map was then used to optimally combine preprocessed BOLD across
@@ -118,10 +119,17 @@ The optimally combined time series was carried forward as the *preprocessed BOLD
 
     dilate_mask = pe.Node(BinaryDilation(radius=2), name='dilate_mask')
 
+    # Echoes are read in blocks of up to chunk_gb, bounding the memory footprint
     t2smap_node = pe.Node(
-        T2SMap(echo_times=list(echo_times), fittype=config.workflow.me_t2s_fit_method),
+        T2SFit(
+            echo_times=list(echo_times),
+            fittype=config.workflow.me_t2s_fit_method,
+            num_threads=omp_nthreads,
+            chunk_gb=0.25,
+        ),
         name='t2smap_node',
-        mem_gb=2.5 * mem_gb * len(echo_times),
+        mem_gb=min(2.5 * mem_gb * len(echo_times), 1.0),
+        n_procs=omp_nthreads,
     )
     workflow.connect([
         (inputnode, dilate_mask, [('bold_mask', 'in_mask')]),
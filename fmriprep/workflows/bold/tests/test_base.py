@@ -81,3 +81,49 @@ def test_bold_wf(
 
     flatgraph = wf._create_flat_graph()
     generate_expanded_graph(flatgraph)
+
+
+def test_bold_wf_quantize(bids_root: Path):
+    img = nb.Nifti1Image(np.zeros((10, 10, 10, 10)), np.eye(4))
+    bold_file = str(bids_root / 'sub-01' / 'func' / 'sub-01_task-rest_run-1_bold.nii.gz')
+    img.to_filename(bold_file)
+    img.to_filename(bold_file.replace('_bold.', '_sbref.'))
+
+    with mock_config(bids_dir=bids_root):
+        config.workflow.bold2anat_init = 't1w'
+        config.workflow.quantize_outputs = 'int16'
+        config.workflow.quantize_tolerance = 0.05
+        wf = init_bold_wf(bold_series=[bold_file], precomputed={})
+
+    resample = wf.get_node('bold_std_wf').get_node('resample')
+    assert resample.inputs.quantize == 'int16'
+    assert resample.inputs.quantize_tolerance == 0.05
+
+    # The quantization is reported in the sidecar of the stored series
+    ds_wf = wf.get_node('ds_bold_std_wf')
+    connections = ds_wf._graph.get_edge_data(
+        ds_wf.get_node('inputnode'), ds_wf.get_node('ds_bold')
+    )['connect']
+    assert ('bold_meta', 'meta_dict') in connections
+
+
+@pytest.mark.parametrize('project_goodvoxels', [False, True])
+def test_bold_wf_ribbon_only(bids_root: Path, project_goodvoxels: bool):
+    img = nb.Nifti1Image(np.zeros((10, 10, 10, 10)), np.eye(4))
+    bold_file = str(bids_root / 'sub-01' / 'func' / 'sub-01_task-rest_run-1_bold.nii.gz')
+    img.to_filename(bold_file)
+    img.to_filename(bold_file.replace('_bold.', '_sbref.'))
+
+    with mock_config(bids_dir=bids_root):
+        config.workflow.bold2anat_init = 't1w'
+        config.workflow.run_reconall = True
+        config.workflow.cifti_output = '91k'
+        config.workflow.project_goodvoxels = project_goodvoxels
+        wf = init_bold_wf(bold_series=[bold_file], precomputed={})
+
+    # The published goodvoxels mask is estimated over the whole brain
+    bold_anat_wf = wf.get_node('bold_anat_wf')
+    masked = ('target_mask', 'mask_file') in bold_anat_wf._graph.get_edge_data(
+        bold_anat_wf.get_node('inputnode'), bold_anat_wf.get_node('resample')
+    )['connect']
+    assert masked is not project_goodvoxels
@@ -9,7 +9,7 @@ from niworkflows.utils.testing import generate_bids_skeleton
 from .... import config
 from ...tests import mock_config
 from ...tests.layouts import get_layout
-from ..fit import init_bold_fit_wf, init_bold_native_wf
+from ..fit import collect_sbrefs, get_sbrefs, init_bold_fit_wf, init_bold_native_wf
 
 
 @pytest.fixture(scope='module', autouse=True)
@@ -134,6 +134,46 @@ def test_bold_fit_precomputes(
     generate_expanded_graph(flatgraph)
 
 
+@pytest.mark.parametrize('reused', [True, False])
+def test_bold_fit_cache(bids_root: Path, tmp_path: Path, reused: bool):
+    """Outputs of the fit stage are stored in the fit cache, unless all of them were reused."""
+    from ....utils.fitcache import fit_signature
+
+    img = nb.Nifti1Image(np.zeros((10, 10, 10, 10)), np.eye(4))
+    bold_series = [str(bids_root / 'sub-01' / 'func' / 'sub-01_task-rest_run-1_bold.nii.gz')]
+    img.to_filename(bold_series[0])
+    img.slicer[:, :, :, 0].to_filename(
+        bids_root / 'sub-01' / 'func' / 'sub-01_task-rest_run-1_sbref.nii.gz'
+    )
+
+    precomputed = {'transforms': {}}
+    if reused:
+        dummy_nifti = str(tmp_path / 'dummy.nii')
+        dummy_affine = str(tmp_path / 'dummy.txt')
+        img.to_filename(dummy_nifti)
+        np.savetxt(dummy_affine, np.eye(4))
+        precomputed.update(
+            hmc_boldref=dummy_nifti,
+            coreg_boldref=dummy_nifti,
+            bold_mask=dummy_nifti,
+            transforms={'hmc': dummy_affine, 'boldref2anat': dummy_affine},
+        )
+
+    with mock_config(bids_dir=bids_root):
+        config.workflow.bold2anat_init = 't1w'
+        config.execution.fit_cache_dir = tmp_path / 'fitcache'
+        wf = init_bold_fit_wf(
+            bold_series=bold_series,
+            precomputed=precomputed,
+            fit_cache=fit_signature({'bold': bold_series}, {}, config.environment.version),
+            omp_nthreads=1,
+        )
+
+    nodes = wf.list_node_names()
+    assert not any(name.startswith('skullstrip_precomp_ref_wf') for name in nodes)
+    assert ('store_fit_cache' in nodes) is not reused
+
+
 @pytest.mark.parametrize('task', ['rest', 'nback'])
 @pytest.mark.parametrize('fieldmap_id', ['phasediff', None])
 @pytest.mark.parametrize('run_stc', [True, False])
@@ -175,3 +215,29 @@ def test_bold_native_precomputes(
 
     flatgraph = wf._create_flat_graph()
     generate_expanded_graph(flatgraph)
+
+
+@pytest.mark.parametrize('layout_id', ['no_session', 'many_runs'])
+def test_collect_sbrefs(tmp_path: Path, layout_id: str):
+    """A single query matches the sbrefs that get_sbrefs finds for each run."""
+    bids_dir = tmp_path / 'bids'
+    generate_bids_skeleton(bids_dir, get_layout(layout_id))
+    func_dir = bids_dir / 'sub-01' / 'func'
+    bold_runs = [[str(bold)] for bold in sorted(func_dir.glob('*_task-rest_*_bold.nii.gz'))]
+    bold_runs.append(sorted(str(bold) for bold in func_dir.glob('*_task-nback_*_bold.nii.gz')))
+    bold_runs = [run for run in bold_runs if run]
+
+    with mock_config(bids_dir=bids_dir):
+        layout = config.execution.layout
+        sbref_files = collect_sbrefs(bold_runs, entity_overrides={}, layout=layout)
+        assert list(sbref_files) == [run[0] for run in bold_runs]
+        for run in bold_runs:
+            assert sbref_files[run[0]] == get_sbrefs(run, entity_overrides={}, layout=layout)
+        assert all(len(sbref_files[run[0]]) == 1 for run in bold_runs if 'rest' in run[0])
+
+        # Overrides apply to every run
+        assert not any(
+            collect_sbrefs(
+                bold_runs, entity_overrides={'acquisition': 'x'}, layout=layout
+            ).values()
+        )
@@ -0,0 +1,84 @@
+from pathlib import Path
+
+import nibabel as nb
+import nitransforms as nt
+import numpy as np
+import pytest
+
+from ..registration import init_bbreg_wf, init_fsl_bbr_wf, select_xforms
+
+
+def _write_lta(path: Path, translation: float) -> str:
+    img = nb.Nifti1Image(np.zeros((10, 10, 10)), np.eye(4))
+    matrix = np.eye(4)
+    matrix[0, 3] = translation
+    nt.linear.Affine(matrix, reference=img).to_filename(path, moving=img, fmt='fs')
+    return str(path)
+
+
+def _write_cost(path: Path, cost: float) -> str:
+    path.write_text(f'{cost} 100.0 80.0 20.0\n')
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    ('translations', 'costs', 'expected'),
+    [
+        # BBR refinement of lowest cost
+        ((1, 0, 2), (0.4, 0.6, 0.5), (0, False)),
+        # Header-initialized BBR of lowest cost
+        ((1, 0, 2), (0.5, 0.6, 0.4), (2, False)),
+        # Distorted candidates are rejected, despite their cost
+        ((20, 0, 30), (0.4, 0.6, 0.5), (1, True)),
+        ((20, 0, 2), (0.4, 0.6, 0.5), (2, False)),
+        # The affine registration is kept if of lowest cost
+        ((1, 0), (0.7, 0.6), (1, True)),
+    ],
+)
+def test_select_xforms(tmp_path: Path, translations, costs, expected):
+    lta_list = [
+        _write_lta(tmp_path / f'candidate{i}.lta', translation)
+        for i, translation in enumerate(translations)
+    ]
+    cost_files = [
+        _write_cost(tmp_path / f'candidate{i}.cost', cost) for i, cost in enumerate(costs)
+    ]
+    index, fallback = select_xforms(lta_list, cost_files)
+    assert (index, fallback) == expected
+
+
+@pytest.mark.parametrize('use_bbr', [None, True, False])
+def test_bbreg_speculative(use_bbr):
+    wf = init_bbreg_wf(
+        use_bbr=use_bbr,
+        bold2anat_dof=6,
+        bold2anat_init='t1w',
+        omp_nthreads=4,
+        speculative=True,
+    )
+    nodes = wf.list_node_names()
+    # Only if BBR is tested against the affine registration
+    assert ('bbregister_header' in nodes) is (use_bbr is None)
+    assert 'compare_transforms' not in nodes
+    assert wf.get_node('mri_coreg').n_procs == (3 if use_bbr is None else 4)
+
+
+def test_fsl_bbr_speculative(tmp_path, monkeypatch):
+    schedules = tmp_path / 'etc' / 'flirtsch'
+    schedules.mkdir(parents=True)
+    (schedules / 'measurecost1.sch').touch()
+    monkeypatch.setenv('FSLDIR', str(tmp_path))
+
+    wf = init_fsl_bbr_wf(
+        use_bbr=None, bold2anat_dof=6, bold2anat_init='t1w', omp_nthreads=1, speculative=True
+    )
+    nodes = wf.list_node_names()
+    assert {'flt_bbr_header', 'measure_cost', 'select_xfm'} <= set(nodes)
+    assert 'compare_transforms' not in nodes
+
+    # Costs cannot be measured without FSL
+    monkeypatch.delenv('FSLDIR')
+    wf = init_fsl_bbr_wf(
+        use_bbr=None, bold2anat_dof=6, bold2anat_init='t1w', omp_nthreads=1, speculative=True
+    )
+    assert 'compare_transforms' in wf.list_node_names()
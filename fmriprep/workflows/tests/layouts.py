@@ -59,6 +59,32 @@ def _make_fmap():
     ]
 
 
+def _make_many_runs(n_runs: int = 32):
+    """A single subject with many rest runs, each with its sbref."""
+    return {
+        '01': {
+            'anat': _make_anat(),
+            'func': [
+                {
+                    'task': 'rest',
+                    'run': i,
+                    'suffix': suffix,
+                    'metadata': {
+                        'RepetitionTime': 2.0,
+                        'PhaseEncodingDirection': 'j',
+                        'TotalReadoutTime': 0.6,
+                        'EchoTime': 0.03,
+                        'SliceTiming': [0.0, 0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 1.8],
+                    },
+                }
+                for suffix in ('bold', 'sbref')
+                for i in range(1, n_runs + 1)
+            ],
+            'fmap': _make_fmap(),
+        },
+    }
+
+
 def _make_no_session():
     return {
         '01': {
@@ -131,6 +157,7 @@ _LAYOUT_FACTORIES = {
     'single_session': _make_single_session,
     'homogeneous_sessions': _make_homogeneous_sessions,
     'heterogeneous_sessions': _make_heterogeneous_sessions,
+    'many_runs': _make_many_runs,
 }
 
 
@@ -5,13 +5,15 @@ import bids
 import nibabel as nb
 import numpy as np
 import pytest
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
 from nipype.pipeline.engine.utils import generate_expanded_graph
 from niworkflows.utils.testing import generate_bids_skeleton
 from sdcflows.fieldmaps import clear_registry
 from sdcflows.utils.wrangler import find_estimators
 
 from ... import config
-from ..base import get_estimator, init_fmriprep_wf
+from ..base import fuse_trivial_nodes, get_estimator, init_fmriprep_wf
 from ..tests import mock_config
 from .layouts import get_layout
 
@@ -375,3 +377,96 @@ def test_fmriprep_wf_heterogeneous_sessions(bids_root_factory):
         assert procs == [('01', None)]
         wf = init_fmriprep_wf()
         assert wf.get_node('sub_01_wf')
+
+
+def _scale(value, factor=1):
+    return value * factor
+
+
+def _split(value):
+    return value, -value
+
+
+def _fusable_wf(base_dir):
+    workflow = pe.Workflow(name='fusable_wf', base_dir=str(base_dir))
+    inputnode = pe.Node(niu.IdentityInterface(fields=['values']), name='inputnode')
+    inputnode.inputs.values = [1, 2, 3]
+    select = pe.Node(niu.Select(index=1), name='select', run_without_submitting=True)
+    scale = pe.Node(niu.Function(function=_scale), name='scale', run_without_submitting=True)
+    scale.inputs.factor = 10
+    split = pe.Node(
+        niu.Function(function=_split, output_names=['pos', 'neg']),
+        name='split',
+        run_without_submitting=True,
+    )
+    merge = pe.Node(niu.Merge(2), name='merge')
+    outputnode = pe.Node(niu.IdentityInterface(fields=['out']), name='outputnode')
+    workflow.connect([
+        (inputnode, select, [('values', 'inlist')]),
+        (select, scale, [('out', 'value')]),
+        (scale, split, [('out', 'value')]),
+        (split, merge, [('pos', 'in1'), ('neg', 'in2')]),
+        (merge, outputnode, [('out', 'out')]),
+    ])  # fmt:skip
+    return workflow
+
+
+def test_fuse_trivial_nodes(tmp_path):
+    expected = _fusable_wf(tmp_path / 'unfused').run()
+    fused = fuse_trivial_nodes(_fusable_wf(tmp_path / 'fused'))
+
+    assert sorted(fused.list_node_names()) == ['inputnode', 'merge', 'outputnode']
+    assert fused.get_node('merge').run_without_submitting
+
+    result = fused.run()
+    outputs = [
+        node.result.outputs.out
+        for graph in (expected, result)
+        for node in graph.nodes()
+        if node.name == 'merge'
+    ]
+    assert outputs == [[20, -20], [20, -20]]
+
+
+def test_init_fmriprep_wf_many_runs(tmp_path):
+    """Fieldmap selection is shared across the runs of a subject."""
+    bids_dir = tmp_path / 'bids'
+
+    spec = get_layout('many_runs')
+    spec['01']['fmap'][0]['metadata']['IntendedFor'] = [
+        f'func/{bold}' for bold in (f'sub-01_task-rest_run-{i}_bold.nii.gz' for i in range(1, 33))
+    ]
+    generate_bids_skeleton(bids_dir, spec)
+    img = nb.Nifti1Image(np.zeros((10, 10, 10, 10)), np.eye(4))
+    for img_path in bids_dir.glob('sub-01/*/*.nii.gz'):
+        img.to_filename(img_path)
+
+    with mock_config(bids_dir=bids_dir):
+        config.workflow.level = 'minimal'
+        wf = init_fmriprep_wf()
+
+    subject_wf = wf.get_node('sub_01_wf')
+    names = {name.split('.')[0] for name in subject_wf.list_node_names()}
+    assert len([name for name in names if name.startswith('bold_task_rest_run_')]) == 32
+    # One selection per estimator, rather than one per run
+    assert [name for name in names if name.startswith('fmap_select_')] == ['fmap_select_auto00000']
+
+    generate_expanded_graph(wf._create_flat_graph())
+
+
+def test_init_fmriprep_wf_anat_confounds(bids_root: Path):
+    """aCompCor masks and carpetplot parcellation are generated once per subject."""
+    with mock_config(bids_dir=bids_root):
+        config.workflow.level = 'full'
+        wf = init_fmriprep_wf()
+
+    subject_wf = wf.get_node('sub_01_wf')
+    names = subject_wf.list_node_names()
+    bold_wfs = {name.split('.')[0] for name in names if name.startswith('bold_')}
+    assert len(bold_wfs) > 1
+    assert [name for name in names if name.endswith('.acc_masks')] == [
+        'anat_confounds_wf.acc_masks'
+    ]
+    assert not [name for name in names if name.endswith('.mrg_xfms')]
+
+    generate_expanded_graph(wf._create_flat_graph())